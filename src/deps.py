@@ -1,8 +1,16 @@
 import secrets
+from typing import Any
 
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
+from schemas.notifications import PushMessage
+from schemas.notifications.bark import BarkPushMessage
+from schemas.notifications.telegram import TelegramPushMessage
 from settings import get_settings
+from utils.convert.svg import SvgRenderer
+from utils.network.certs import SSLCertMonitor, SSLCertScanner
+from utils.notifications.dispatcher import NotificationDispatcher
+from utils.notifications.queue import NotificationJobStore, NotificationQueue
 
 security = HTTPBasic()
 
@@ -22,3 +30,126 @@ def get_current_username(credentials: HTTPBasicCredentials = Depends(security)):
             headers={"WWW-Authenticate": "Basic"},
         )
     return credentials.username
+
+
+_ssl_cert_scanner: SSLCertScanner | None = None
+_ssl_cert_monitor: SSLCertMonitor | None = None
+
+
+def get_ssl_cert_scanner() -> SSLCertScanner:
+    """全局共享的证书扫描器, 所有请求共用同一个并发上限与缓存"""
+    global _ssl_cert_scanner
+    if _ssl_cert_scanner is None:
+        settings = get_settings()
+        _ssl_cert_scanner = SSLCertScanner(
+            concurrency=settings.ssl_scan_concurrency,
+            connect_timeout=settings.ssl_scan_connect_timeout,
+            handshake_timeout=settings.ssl_scan_handshake_timeout,
+        )
+    return _ssl_cert_scanner
+
+
+async def notify_ssl_cert_expiry(title: str, body: str):
+    settings = get_settings()
+    message = PushMessage()
+    if settings.ssl_monitor_bark_device_key:
+        data: dict[str, Any] = dict(
+            device_key=settings.ssl_monitor_bark_device_key,
+            title=title,
+            body=body[:1024],
+            group="ssl",
+            endpoint=settings.ssl_monitor_bark_endpoint,
+        )
+        message.bark = BarkPushMessage(**data)
+    if settings.ssl_monitor_telegram_bot_id and settings.ssl_monitor_telegram_chat_id:
+        message.telegram = TelegramPushMessage(
+            bot_id=settings.ssl_monitor_telegram_bot_id,
+            chat_id=settings.ssl_monitor_telegram_chat_id,
+            text=f"{title}\n{body}",
+        )
+    failures = [x for x in await get_notification_dispatcher().dispatch([message]) if not x.ok]
+    if failures:
+        raise RuntimeError("; ".join(f"{x.channel}: {x.error}" for x in failures))
+
+
+def get_ssl_cert_monitor() -> SSLCertMonitor:
+    global _ssl_cert_monitor
+    if _ssl_cert_monitor is None:
+        settings = get_settings()
+        _ssl_cert_monitor = SSLCertMonitor(
+            get_ssl_cert_scanner(),
+            settings.ssl_monitor_hosts,
+            interval=settings.ssl_monitor_interval,
+            expire_days=settings.ssl_monitor_expire_days,
+            notify=notify_ssl_cert_expiry,
+        )
+    return _ssl_cert_monitor
+
+
+_svg_renderer: SvgRenderer | None = None
+
+
+def get_svg_renderer() -> SvgRenderer:
+    """全局共享的 SVG 渲染器, 所有请求共用同一个进程池与渲染缓存"""
+    global _svg_renderer
+    if _svg_renderer is None:
+        settings = get_settings()
+        _svg_renderer = SvgRenderer(
+            max_workers=settings.svg_render_max_workers, cache_size=settings.svg_render_cache_size
+        )
+    return _svg_renderer
+
+
+async def close_svg_renderer():
+    global _svg_renderer
+    if _svg_renderer is not None:
+        await _svg_renderer.aclose()
+        _svg_renderer = None
+
+
+_notification_dispatcher: NotificationDispatcher | None = None
+
+
+def get_notification_dispatcher() -> NotificationDispatcher:
+    """全局共享的消息推送, 所有请求复用各推送服务的连接与并发上限"""
+    global _notification_dispatcher
+    if _notification_dispatcher is None:
+        settings = get_settings()
+        _notification_dispatcher = NotificationDispatcher(
+            concurrency=settings.notification_provider_concurrency, timeout=settings.notification_timeout
+        )
+    return _notification_dispatcher
+
+
+async def close_notification_dispatcher():
+    global _notification_dispatcher
+    if _notification_dispatcher is not None:
+        await _notification_dispatcher.aclose()
+        _notification_dispatcher = None
+
+
+_notification_queue: NotificationQueue | None = None
+
+
+def get_notification_queue() -> NotificationQueue:
+    """全局共享的持久化推送队列, 由后台任务消费"""
+    global _notification_queue
+    if _notification_queue is None:
+        settings = get_settings()
+        _notification_queue = NotificationQueue(
+            NotificationJobStore(settings.notification_queue_path),
+            get_notification_dispatcher(),
+            max_attempts=settings.notification_queue_max_attempts,
+            base_delay=settings.notification_queue_base_delay,
+            max_delay=settings.notification_queue_max_delay,
+            batch_window=settings.notification_queue_batch_window,
+            retention=settings.notification_queue_retention,
+        )
+    return _notification_queue
+
+
+def close_notification_queue():
+    global _notification_queue
+    if _notification_queue is not None:
+        _notification_queue.store.close()
+        _notification_queue = None
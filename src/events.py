@@ -3,10 +3,21 @@ import gc
 import logging
 from contextlib import AsyncExitStack, asynccontextmanager
 
+from deps import (
+    close_notification_dispatcher,
+    close_notification_queue,
+    close_svg_renderer,
+    get_notification_queue,
+    get_ssl_cert_monitor,
+)
 from fastapi import FastAPI
 from rssapi.core.events import lifespan as rssapi_lifespan
 from schemas.ping import get_default_memory
 from settings import get_settings
+from utils.convert.dash import close_dash_client
+from utils.network.doh import close_doh_client
+from utils.playwright import close_browser_pool
+from utils.rss.douyin import close_douyin_user_feeds, get_douyin_user_feeds
 
 logger = logging.getLogger(__file__)
 
@@ -35,6 +46,21 @@ async def background_gc():
 
 async def startup_event(app: FastAPI):
     app.state.background_gc_task = asyncio.create_task(background_gc(), name="background_gc")
+    app.state.ssl_cert_monitor_task = None
+    settings = get_settings()
+    if settings.ssl_monitor_enable and settings.ssl_monitor_hosts:
+        app.state.ssl_cert_monitor_task = asyncio.create_task(get_ssl_cert_monitor().run(), name="ssl_cert_monitor")
+    app.state.notification_queue_task = asyncio.create_task(get_notification_queue().run(), name="notification_queue")
+    app.state.douyin_user_feeds_task = None
+    if settings.rss_douyin_user_auto_fetch_enable:
+        app.state.douyin_user_feeds_task = asyncio.create_task(
+            get_douyin_user_feeds().run(
+                settings.rss_douyin_user_auto_fetch_start_wait,
+                settings.rss_douyin_user_auto_fetch_wait,
+                settings.rss_douyin_user_auto_fetch_once_wait,
+            ),
+            name="douyin_user_feeds",
+        )
 
 
 async def shutdown(app: FastAPI):
@@ -43,4 +69,27 @@ async def shutdown(app: FastAPI):
         task.cancel()
         logger.info("[shutdown]: background_gc task cancelled")
 
+    monitor_task: asyncio.Task | None = app.state.ssl_cert_monitor_task
+    if monitor_task and not monitor_task.done():
+        monitor_task.cancel()
+        logger.info("[shutdown]: ssl_cert_monitor task cancelled")
+
+    queue_task: asyncio.Task = app.state.notification_queue_task
+    if not queue_task.done():
+        queue_task.cancel()
+        logger.info("[shutdown]: notification_queue task cancelled")
+
+    feeds_task: asyncio.Task | None = app.state.douyin_user_feeds_task
+    if feeds_task and not feeds_task.done():
+        feeds_task.cancel()
+        logger.info("[shutdown]: douyin_user_feeds task cancelled")
+
+    await close_doh_client()
+    await close_douyin_user_feeds()
+    await close_browser_pool()
+    await close_dash_client()
+    await close_svg_renderer()
+    await close_notification_dispatcher()
+    close_notification_queue()
+
     logger.info("shutdown")
@@ -25,6 +25,7 @@ import routers.network.url.forward
 import routers.network.url.redirect
 import routers.nga.thread
 import routers.notifications.push
+import routers.rss.douyin
 import routers.stash.ruleset
 import routers.stash.stoverride
 import routers.store.memory
@@ -83,6 +84,8 @@ def include_routers(app: FastAPI):
     app.include_router(routers.apple.itunes.appstore.router, prefix=api_prefix)
     app.include_router(routers.iptv.sub.router, prefix=api_prefix)
     app.include_router(routers.dandanplay.bilibili.router, prefix=api_prefix)
+    # 先于 rssapi 注册, 同路径的抖音用户动态由预取缓存提供
+    app.include_router(routers.rss.douyin.router, prefix=api_prefix)
 
     include_rssapi_routers(app, api_prefix=api_prefix)
     include_ical_api_routers(app, api_prefix=api_prefix)
@@ -7,6 +7,7 @@ from events import lifespan
 from fastapi import FastAPI
 from init import initial
 from responses import PingResponse
+from routers.convert.dash import get_remux_cache
 from rssapi.applications.nodeseek.router import NodeseekToolkit
 from schemas.ping import PingRes, ping_responses
 from settings import get_settings, version
@@ -24,6 +25,7 @@ async def ping():
     m = PingRes.model_construct()
     m.nodeseek = {"ArticlePostCache": list(NodeseekToolkit.ArticlePostCache.keys())}
     m.sentry_cache = await middlewares.errors.SentryCacheMiddleware.get_errors()
+    m.dash_remux_cache = get_remux_cache().stats()
     return m
 
 
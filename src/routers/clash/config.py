@@ -6,6 +6,7 @@ import yaml
 from fastapi import APIRouter, Query
 from fastapi.responses import PlainTextResponse
 from schemas.adapter import HttpUrl
+from utils.stash.ruleset import optimize_ruleset_payloads
 
 
 class QxBehaviourEnum(str, Enum):
@@ -25,6 +26,7 @@ logger = logging.getLogger(__file__)
 def qx(
     url: HttpUrl = Query(..., description="规则文件"),
     behavior: QxBehaviourEnum = Query(..., description="接受处理的行为"),
+    optimize: bool = Query(False, description="移除已被更短后缀覆盖的规则, 缩减比例见响应头"),
 ):
     """将 qx 的规则配置文件转换为 clash 可识别的 rule-set 文件
     匹配规则支持:
@@ -44,8 +46,11 @@ def qx(
         if type_ != QxMatchRuleEnum.hostsuffix:
             continue
         domains.append(f"+.{domain}")
+    headers: dict[str, str] = {}
+    if optimize:
+        domains, headers = optimize_ruleset_payloads(domains)
     content = yaml.safe_dump({"payload": domains}, allow_unicode=True)
-    return PlainTextResponse(content=content)
+    return PlainTextResponse(content=content, headers=headers)
 
 
 @router.get("/qx/nocomments", summary="移除文本中的部分注释")
@@ -2,107 +2,141 @@ import asyncio
 import logging
 import tempfile
 import time
+from contextlib import aclosing
+from functools import partial
 from pathlib import Path
-from xml.etree import ElementTree
 
 import ffmpeg
 import httpx
-from fastapi import APIRouter, BackgroundTasks, HTTPException, Query
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Query, Request
 from fastapi.responses import FileResponse, StreamingResponse
 from schemas.adapter import HttpUrl
+from settings import get_settings
+from utils.cache import DiskLRUCache
+from utils.convert.dash import (
+    DashInputs,
+    DashRepresentation,
+    get_dash_client,
+    parse_mpd,
+    select_representation,
+)
+from utils.convert.ffmpeg import FFmpegJobManager, iter_process_stdout
 
 router = APIRouter(tags=["Utils"], prefix="/convert/dash")
 
 logger = logging.getLogger(__file__)
 
-MPD_NS = {"mpd": "urn:mpeg:dash:schema:mpd:2011"}
+ffmpeg_jobs = FFmpegJobManager(get_settings().ffmpeg_max_concurrency)
 
+_remux_cache: DiskLRUCache | None = None
 
-def _parse_mpd(content: str, base_url: str) -> tuple[str, str]:
-    """从 MPD 内容中提取视频和音频流的 URL。返回 (video_url, audio_url)。"""
-    root = ElementTree.fromstring(content)
 
-    video_url = ""
-    audio_url = ""
+def get_remux_cache() -> DiskLRUCache:
+    global _remux_cache
+    if _remux_cache is None:
+        settings = get_settings()
+        _remux_cache = DiskLRUCache(settings.dash_remux_cache_dir, settings.dash_remux_cache_max_size, suffix=".mp4")
+    return _remux_cache
 
-    for adaptation_set in root.findall(".//mpd:AdaptationSet", MPD_NS):
-        mime_type = adaptation_set.get("mimeType", "")
-        content_type = adaptation_set.get("contentType", "")
 
-        representations = adaptation_set.findall("mpd:Representation", MPD_NS)
-        if not representations:
-            continue
+async def _fetch_mpd(
+    dash_url: str, max_bandwidth: int | None = None, max_height: int | None = None
+) -> tuple[DashRepresentation, DashRepresentation]:
+    """获取 MPD 并按带宽与高度上限选择视频和音频 Representation。返回 (video, audio)。"""
+    resp = await get_dash_client().get(dash_url)
+    if resp.status_code != 200:
+        raise HTTPException(status_code=502, detail=f"获取 MPD 文件失败: HTTP {resp.status_code}")
 
-        # 选择最高带宽的 Representation
-        best = max(representations, key=lambda r: int(r.get("bandwidth", "0")))
-        base_url_elem = best.find("mpd:BaseURL", MPD_NS)
-        if base_url_elem is None or not base_url_elem.text:
-            continue
+    representations = parse_mpd(resp.text, str(resp.url))
+    video = select_representation(representations, "video", max_bandwidth=max_bandwidth, max_height=max_height)
+    audio = select_representation(representations, "audio", max_bandwidth=max_bandwidth)
+    if video is None:
+        raise HTTPException(status_code=400, detail="MPD 中未找到视频流")
+    if audio is None:
+        raise HTTPException(status_code=400, detail="MPD 中未找到音频流")
+    logger.debug(f"dash selected video={video.id}@{video.bandwidth}, audio={audio.id}@{audio.bandwidth}")
+    return video, audio
 
-        url = base_url_elem.text
-        if not url.startswith("http"):
-            url = base_url.rstrip("/") + "/" + url.lstrip("/")
 
-        if "video" in mime_type or "video" in content_type:
-            if not video_url:
-                video_url = url
-        elif "audio" in mime_type or "audio" in content_type:
-            if not audio_url:
-                audio_url = url
+def _open_dash_inputs(video: DashRepresentation, audio: DashRepresentation) -> DashInputs:
+    return DashInputs(get_dash_client(), [video, audio], concurrency=get_settings().dash_segment_concurrency)
 
-    if not video_url:
-        raise HTTPException(status_code=400, detail="MPD 中未找到视频流")
-    if not audio_url:
-        raise HTTPException(status_code=400, detail="MPD 中未找到音频流")
 
-    return video_url, audio_url
+def _compile_remux_args(inputs: list[str], output: str, **kwargs) -> list[str]:
+    video_url, audio_url = inputs
+    return list(
+        ffmpeg.input(video_url)  # type: ignore
+        .output(ffmpeg.input(audio_url), output, format="mp4", vcodec="copy", acodec="copy", **kwargs)  # type: ignore
+        .global_args("-loglevel", "error")
+        .overwrite_output()
+        .compile()
+    )
 
 
-async def _fetch_mpd(dash_url: str) -> tuple[str, str]:
-    """获取 MPD 并解析出视频和音频 URL。返回 (video_url, audio_url)。"""
-    async with httpx.AsyncClient(follow_redirects=True) as client:
-        resp = await client.get(dash_url)
-        if resp.status_code != 200:
-            raise HTTPException(status_code=502, detail=f"获取 MPD 文件失败: HTTP {resp.status_code}")
-        mpd_content = resp.text
+async def _run_ffmpeg(args: list[str], pass_fds: list[int]):
+    """运行 ffmpeg, 任务被取消时结束进程"""
+    start = time.monotonic()
+    process = await asyncio.create_subprocess_exec(
+        *args, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE, pass_fds=pass_fds
+    )
+    try:
+        _, stderr_output = await process.communicate()
+    except asyncio.CancelledError:
+        process.kill()
+        await process.wait()
+        raise
+    logger.info(f"ffmpeg mux completed in {time.monotonic() - start:.2f}s")
+    if process.returncode != 0:
+        logger.error(f"ffmpeg error: {stderr_output.decode()}")
+        raise HTTPException(status_code=500, detail="音视频合并失败")
 
-    base_url = dash_url.rsplit("/", 1)[0]
-    video_url, audio_url = _parse_mpd(mpd_content, base_url)
-    return video_url, audio_url
 
+async def _remux_dash_to_file(video: DashRepresentation, audio: DashRepresentation, cache_key: str) -> str:
+    """合并音视频到缓存目录中的临时文件, 完成后放入缓存"""
+    remux_cache = get_remux_cache()
+    tmp = tempfile.NamedTemporaryFile(suffix=".mp4.tmp", dir=remux_cache.directory, delete=False)
+    tmp_path = tmp.name
+    tmp.close()
 
-@router.get("/mp4/stream", summary="dash2mp4 流式")
-async def dash_to_mp4_stream(dash_url: HttpUrl = Query(..., description="MPD 文件的 URL")):
-    """将 DASH MPD 中的音视频流合并为 MP4 流式返回。响应快但时长信息不准确。"""
-    video_url, audio_url = await _fetch_mpd(str(dash_url))
+    try:
+        # 分段下载失败时退出上下文会抛出异常, 截断的文件不会放入缓存
+        async with _open_dash_inputs(video, audio) as inputs:
+            await _run_ffmpeg(_compile_remux_args(inputs.urls, tmp_path), inputs.pass_fds)
+    except httpx.HTTPError as e:
+        Path(tmp_path).unlink(missing_ok=True)
+        raise HTTPException(status_code=502, detail=f"下载分段失败: {e}")
+    except BaseException:
+        Path(tmp_path).unlink(missing_ok=True)
+        raise
+    return str(remux_cache.put(cache_key, tmp_path))
 
-    process = (
-        ffmpeg.input(video_url)  # type: ignore
-        .output(
-            ffmpeg.input(audio_url),  # type: ignore
-            "pipe:1",
-            format="mp4",
-            vcodec="copy",
-            acodec="copy",
-            movflags="frag_keyframe+empty_moov",
-        )
-        .global_args("-loglevel", "error")
-        .run_async(pipe_stdout=True, pipe_stderr=True)
-    )
 
-    def stream_generator():
-        try:
-            while True:
-                chunk = process.stdout.read(1024 * 64)
-                if not chunk:
-                    break
-                yield chunk
-        finally:
-            process.stdout.close()
-            stderr_output = process.stderr.read()
-            process.wait()
-            if process.returncode != 0 and stderr_output:
-                logger.error(f"ffmpeg error: {stderr_output.decode()}")
+@router.get("/mp4/stream", summary="dash2mp4 流式")
+async def dash_to_mp4_stream(
+    dash_url: HttpUrl = Query(..., description="MPD 文件的 URL"),
+    max_bandwidth: int | None = Query(None, description="最大带宽, bps"),
+    max_height: int | None = Query(None, description="视频最大高度"),
+):
+    """将 DASH MPD 中的音视频流合并为 MP4 流式返回。响应快但时长信息不准确。
+
+    - 支持 BaseURL 单文件与 SegmentTemplate/SegmentTimeline/SegmentList 分段, 分段由本服务并发下载后按顺序交给 ffmpeg
+    - 可通过 max_bandwidth 与 max_height 选择较低码率, 减少传输量
+    - 与其他转换任务共享并发上限, 排队期间不会启动 ffmpeg
+    - 使用异步管道读取 ffmpeg 输出, 不占用线程池; 客户端断开或分段下载失败时结束 ffmpeg 进程并中断响应
+    """
+    video, audio = await _fetch_mpd(str(dash_url), max_bandwidth, max_height)
+    chunk_size = get_settings().ffmpeg_stream_chunk_size
+
+    async def stream_generator():
+        # 先结束 ffmpeg 再停止下载分段, 最后释放并发名额
+        async with ffmpeg_jobs.slot(), _open_dash_inputs(video, audio) as inputs:
+            args = _compile_remux_args(inputs.urls, "pipe:1", movflags="frag_keyframe+empty_moov")
+            async with (
+                aclosing(iter_process_stdout(args, chunk_size, pass_fds=inputs.pass_fds)) as chunks,
+                aclosing(inputs.guard(chunks)) as guarded,
+            ):
+                async for chunk in guarded:
+                    yield chunk
 
     return StreamingResponse(
         stream_generator(),
@@ -113,47 +147,50 @@ async def dash_to_mp4_stream(dash_url: HttpUrl = Query(..., description="MPD 文
 
 @router.get("/mp4", summary="dash2mp4")
 async def dash_to_mp4(
+    request: Request,
     background_tasks: BackgroundTasks,
     dash_url: HttpUrl = Query(..., description="MPD 文件的 URL"),
+    max_bandwidth: int | None = Query(None, description="最大带宽, bps"),
+    max_height: int | None = Query(None, description="视频最大高度"),
 ):
-    """将 DASH MPD 中的音视频流合并为 MP4 完整返回。需等待处理完成，但时长信息准确。"""
-    video_url, audio_url = await _fetch_mpd(str(dash_url))
-
-    tmp = tempfile.NamedTemporaryFile(suffix=".mp4", delete=False)
-    tmp_path = tmp.name
-    tmp.close()
-
-    def _mux():
-        start = time.monotonic()
-        process = (
-            ffmpeg.input(video_url)
-            .output(
-                ffmpeg.input(audio_url),
-                tmp_path,
-                format="mp4",
-                vcodec="copy",
-                acodec="copy",
-            )
-            .global_args("-loglevel", "error")
-            .overwrite_output()
-            .run_async(pipe_stderr=True)
+    """将 DASH MPD 中的音视频流合并为 MP4 完整返回。需等待处理完成，但时长信息准确。
+
+    - 支持 BaseURL 单文件与 SegmentTemplate/SegmentTimeline/SegmentList 分段, 可通过 max_bandwidth 与 max_height 选择较低码率
+    - 合并结果按选中的音视频流缓存在磁盘中, 命中缓存时直接返回, 支持 Range 请求
+    - 相同音视频流的请求共享同一个转换任务, 所有请求方断开后取消任务, 排队位置见响应头 X-FFmpeg-Queue-Position
+    """
+    video, audio = await _fetch_mpd(str(dash_url), max_bandwidth, max_height)
+    cache_key = f"{video.key}\n{audio.key}"
+    remux_cache = get_remux_cache()
+    cached_path = remux_cache.get(cache_key)
+    if cached_path is not None:
+        return FileResponse(
+            cached_path, media_type="video/mp4", filename="output.mp4", headers={"X-Remux-Cache": "HIT"}
         )
-        _, stderr_output = process.communicate()
-        elapsed = time.monotonic() - start
-        logger.info(f"ffmpeg mux completed in {elapsed:.2f}s")
-        return process.returncode, stderr_output
 
+    job = ffmpeg_jobs.acquire(
+        remux_cache.path_for(cache_key).name, partial(_remux_dash_to_file, video, audio, cache_key)
+    )
+    position = ffmpeg_jobs.position(job)
     try:
-        returncode, stderr_output = await asyncio.to_thread(_mux)
-        if returncode != 0:
-            logger.error(f"ffmpeg error: {stderr_output.decode()}")
-            raise HTTPException(status_code=500, detail="音视频合并失败")
-    except HTTPException:
-        Path(tmp_path).unlink(missing_ok=True)
+        path = await ffmpeg_jobs.wait(job, disconnected=request.is_disconnected)
+    except ConnectionAbortedError:
+        ffmpeg_jobs.release(job)
+        raise HTTPException(status_code=499, detail="客户端已断开")
+    except BaseException:
+        ffmpeg_jobs.release(job)
         raise
-    except Exception:
-        Path(tmp_path).unlink(missing_ok=True)
-        raise HTTPException(status_code=500, detail="音视频合并失败")
 
-    background_tasks.add_task(Path(tmp_path).unlink, missing_ok=True)
-    return FileResponse(tmp_path, media_type="video/mp4", filename="output.mp4")
+    background_tasks.add_task(ffmpeg_jobs.release, job)
+    return FileResponse(
+        path,
+        media_type="video/mp4",
+        filename="output.mp4",
+        headers={"X-FFmpeg-Queue-Position": str(position), "X-Remux-Cache": "MISS"},
+    )
+
+
+@router.get("/jobs", summary="dash2mp4 任务状态")
+def dash_jobs():
+    """当前的转换任务与排队情况"""
+    return ffmpeg_jobs.stats()
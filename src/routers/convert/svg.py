@@ -1,10 +1,13 @@
-import io
 import logging
 
-import cairosvg
-from fastapi import APIRouter, HTTPException, Query
-from fastapi.responses import StreamingResponse
+import httpx
+from deps import get_svg_renderer
+from fastapi import APIRouter, Header, HTTPException, Query
+from fastapi.responses import Response
 from schemas.adapter import HttpUrl
+from settings import get_settings
+from utils.basic import is_etag_matched
+from utils.convert.svg import get_svg_etag
 
 router = APIRouter(tags=["Utils"], prefix="/convert/svg")
 
@@ -12,16 +15,37 @@ logger = logging.getLogger(__file__)
 
 
 @router.get("/png", summary="svg2png")
-async def convert_svg_to_png(url: HttpUrl, download: bool = Query(False, description="是否下载文件")):
-    # 使用 cairosvg 将 SVG 转换为 PNG
-    png_content = cairosvg.svg2png(url=url)
-    if not isinstance(png_content, bytes):
-        raise HTTPException(status_code=500, detail="Format conversion failed.")
-    # 返回 PNG 文件
-    response = StreamingResponse(
-        io.BytesIO(png_content),
-        media_type="image/png",
-    )
+async def convert_svg_to_png(
+    url: HttpUrl,
+    download: bool = Query(False, description="是否下载文件"),
+    width: int | None = Query(None, gt=0, le=4096, description="输出宽度, 仅指定宽高之一时按比例缩放"),
+    height: int | None = Query(None, gt=0, le=4096, description="输出高度"),
+    scale: float = Query(1, gt=0, le=10, description="缩放倍数"),
+    if_none_match: str | None = Header(None),
+):
+    """使用 cairosvg 将 SVG 转换为 PNG
+
+    - SVG 通过异步客户端获取, 栅格化在进程池中执行
+    - 结果按 SVG 内容与尺寸缓存, 响应携带 ETag 与 Cache-Control, 客户端携带 If-None-Match 时可能返回 304
+    """
+    renderer = get_svg_renderer()
+    try:
+        key, png_content = await renderer.render_url(str(url), width, height, scale)
+    except httpx.HTTPStatusError as e:
+        raise HTTPException(status_code=502, detail=f"获取 SVG 失败: HTTP {e.response.status_code}")
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=502, detail=f"获取 SVG 失败: {e!r}")
+    except Exception as e:
+        logger.warning(f"[svg2png] render failed: {url}, {e!r}")
+        raise HTTPException(status_code=422, detail="Format conversion failed.")
+
+    etag = get_svg_etag(key)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={get_settings().svg_cache_max_age}",
+    }
+    if is_etag_matched(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
     if download:
-        response.headers["Content-Disposition"] = "attachment; filename=converted.png"
-    return response
+        headers["Content-Disposition"] = "attachment; filename=converted.png"
+    return Response(png_content, media_type="image/png", headers=headers)
@@ -0,0 +1,45 @@
+import asyncio
+import os
+
+import httpx
+import pytest
+import routers.convert.dash as dash_router
+from fastapi import HTTPException
+from utils.cache import DiskLRUCache
+from utils.convert.dash import DashRepresentation, DashSegment
+
+
+@pytest.mark.asyncio
+async def test_remux_segment_failure_not_cached(tmp_path, monkeypatch):
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/missing":
+            return httpx.Response(404)
+        return httpx.Response(200, content=request.url.path.encode())
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    cache = DiskLRUCache(tmp_path, 1024 * 1024, suffix=".mp4")
+
+    def remux(output: str, pass_fds: list[int]):
+        # 与 ffmpeg 一样读到 EOF 后正常退出, 输出截断的文件
+        with open(output, "wb") as f:
+            for fd in pass_fds:
+                while chunk := os.read(fd, 4096):
+                    f.write(chunk)
+
+    async def run_ffmpeg(args: list[str], pass_fds: list[int]):
+        output = next(x for x in args if x.endswith(".mp4.tmp"))
+        await asyncio.to_thread(remux, output, pass_fds)
+
+    monkeypatch.setattr(dash_router, "get_dash_client", lambda: client)
+    monkeypatch.setattr(dash_router, "get_remux_cache", lambda: cache)
+    monkeypatch.setattr(dash_router, "_run_ffmpeg", run_ffmpeg)
+
+    segments = [DashSegment(f"https://cdn.example.com/{x}") for x in ("0", "1", "missing", "3")]
+    video = DashRepresentation("v", "video", segments=segments)
+    audio = DashRepresentation("a", "audio", url="https://cdn.example.com/audio.m4a")
+    with pytest.raises(HTTPException) as e:
+        await dash_router._remux_dash_to_file(video, audio, "key")
+    assert e.value.status_code == 502
+    assert cache.get("key") is None and cache.stats()["count"] == 0
+    assert list(tmp_path.iterdir()) == []
+    await client.aclose()
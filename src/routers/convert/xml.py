@@ -1,9 +1,16 @@
 import json
 import logging
+from collections.abc import AsyncIterator
+from contextlib import aclosing
+from xml.parsers import expat
 
+import httpx
 import xmltodict
-from fastapi import APIRouter, Body, Query
+from fastapi import APIRouter, Body, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
+from schemas.adapter import HttpUrl
+from utils.convert.xml import iter_xml_to_json, iter_xml_to_ndjson
 
 router = APIRouter(tags=["Utils"], prefix="/convert/xml")
 
@@ -29,3 +36,50 @@ def to_json_v2(req: XMLConvertReq = Body(...)):
     """将传入的 xml 字符串转成 json字符串并返回"""
     content = req.content
     return {"content": json.dumps(xmltodict.parse(content), ensure_ascii=False)}
+
+
+async def _iter_url_content(url: str) -> AsyncIterator[bytes]:
+    async with httpx.AsyncClient(follow_redirects=True, timeout=30) as client:
+        async with client.stream("GET", url) as resp:
+            if resp.is_error:
+                raise HTTPException(status_code=502, detail=f"获取 XML 失败: HTTP {resp.status_code}")
+            async for chunk in resp.aiter_bytes():
+                yield chunk
+
+
+@router.post("/stream", summary="xml2json 流式")
+async def to_json_stream(
+    request: Request,
+    url: HttpUrl | None = Query(None, description="XML 地址, 为空时读取请求体中的原始 XML"),
+    item_path: str | None = Query(
+        None, description="逐条输出的节点路径, 例如 rss/channel/item", examples=["rss/channel/item"]
+    ),
+):
+    """增量解析 XML 并流式返回, 结构与 xmltodict 一致
+
+    - 未指定 item_path 时返回整个文档的 JSON
+    - 指定 item_path 时以 NDJSON 逐行返回匹配的节点, 内存占用与单个节点大小相关, 适用于大型 RSS/OPML
+    """
+    chunks = _iter_url_content(str(url)) if url else request.stream()
+    if item_path:
+        content, media_type = iter_xml_to_ndjson(chunks, item_path), "application/x-ndjson"
+    else:
+        content, media_type = iter_xml_to_json(chunks), "application/json"
+
+    # 读取第一段输出, 使获取失败与开头的格式错误以状态码返回
+    try:
+        first = await anext(content, "")
+    except expat.ExpatError as e:
+        raise HTTPException(status_code=400, detail=f"XML 格式错误: {e}")
+
+    async def iter_content() -> AsyncIterator[str]:
+        yield first
+        try:
+            async with aclosing(content):
+                async for part in content:
+                    yield part
+        except expat.ExpatError as e:
+            logger.warning(f"[xml2json stream] invalid xml: {e}")
+            yield json.dumps({"error": f"XML 格式错误: {e}"}, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(iter_content(), media_type=media_type)
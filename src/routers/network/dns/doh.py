@@ -1,125 +1,96 @@
-import base64
-import enum
 import logging
 
-import dns.flags
-import dns.message
-import dns.rdatatype
-import httpx
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, Body, HTTPException, Query, Response
 from schemas.adapter import HttpUrl
-from schemas.network.dns.doh import DoHResponse
-
-
-class DoHMethod(str, enum.Enum):
-    auto = "auto"
-    json = "json"
-    wireformat = "wireformat"
-
+from schemas.network.dns.doh import (
+    DoHBatchItem,
+    DoHBatchReq,
+    DoHBatchRes,
+    DoHMethod,
+    DoHRecordType,
+    DoHResolverResult,
+    DoHResponse,
+)
+from settings import get_settings
+from utils.network.doh import DEFAULT_DOH, get_doh_client
 
 router = APIRouter(tags=["Utils"], prefix="/network/dns")
 
 logger = logging.getLogger(__file__)
 
 
-default_doh = "https://1.1.1.1/dns-query"
-
-
-def _query_doh_json(url: str, name: str) -> dict | None:
-    """尝试使用 JSON API 查询，不支持时返回 None。"""
-    resp = httpx.get(
-        url,
-        params={"name": name, "type": "A"},
-        headers={"Accept": "application/dns-json"},
-    )
-    if resp.status_code != 200:
-        return None
-    content_type = resp.headers.get("content-type", "")
-    if "application/dns-json" not in content_type and "application/json" not in content_type:
-        return None
-    data: dict = resp.json()
-    return data
-
-
-def _query_doh_wireformat(url: str, name: str) -> dict:
-    """使用 RFC 8484 DNS wire format (GET) 查询并转换为 JSON 结构。"""
-    q = dns.message.make_query(name, dns.rdatatype.A)
-    wire = q.to_wire()
-    dns_param = base64.urlsafe_b64encode(wire).rstrip(b"=").decode()
-
-    resp = httpx.get(
-        url,
-        params={"dns": dns_param},
-        headers={"Accept": "application/dns-message"},
-    )
-    resp.raise_for_status()
-
-    r = dns.message.from_wire(resp.content)
-    flags = r.flags
-
-    result: dict = {
-        "Status": r.rcode().value,
-        "TC": int(bool(flags & dns.flags.TC)),
-        "RD": int(bool(flags & dns.flags.RD)),
-        "RA": int(bool(flags & dns.flags.RA)),
-        "AD": int(bool(flags & dns.flags.AD)),
-        "CD": int(bool(flags & dns.flags.CD)),
-        "Question": [],
-        "Answer": [],
-    }
-
-    for rrset in r.question:
-        result["Question"].append(
-            {
-                "name": str(rrset.name),
-                "type": rrset.rdtype.value,
-            }
-        )
-
-    for rrset in r.answer:
-        for rdata in rrset:
-            result["Answer"].append(
-                {
-                    "name": str(rrset.name),
-                    "type": rrset.rdtype.value,
-                    "TTL": rrset.ttl,
-                    "data": str(rdata),
-                }
-            )
-
-    return result
+default_doh = DEFAULT_DOH
 
 
 @router.get("/doh", summary="DNS-Over-Https", response_model=DoHResponse)
-def doh(
+async def doh(
     url: HttpUrl = Query(default_doh, description="使用的 dns服务https 路径"),
     name: str = Query(..., description="域名"),
     method: DoHMethod = Query(
-        DoHMethod.auto, description="查询方式: auto 自动检测, json 使用 JSON API, wireformat 使用 RFC 8484 wire format"
+        DoHMethod.auto,
+        description="查询方式: auto 自动检测, json 使用 JSON API, wireformat 使用 RFC 8484 wire format (GET), "
+        "post 使用 RFC 8484 wire format (POST)",
     ),
 ):
     """使用 doh 解析域名， 返回对应的 A记录</br>
     https://1.1.1.1/dns-query</br>
     https://223.5.5.5/resolve</br>
     https://dns.adguard-dns.com/dns-query</br>
-    """
-    doh_url = str(url)
-
-    if method == DoHMethod.json:
-        data = _query_doh_json(doh_url, name)
-        if data is None:
-            raise httpx.HTTPStatusError(
-                f"JSON API not supported by {doh_url}",
-                request=httpx.Request("GET", doh_url),
-                response=httpx.Response(400),
-            )
-    elif method == DoHMethod.wireformat:
-        data = _query_doh_wireformat(doh_url, name)
-    else:
-        data = _query_doh_json(doh_url, name)
-        if data is None:
-            logger.debug(f"doh JSON API not supported for {doh_url}, falling back to wire format")
-            data = _query_doh_wireformat(doh_url, name)
 
+    应答按 TTL 缓存, 同一 resolver 复用 HTTP/2 连接
+    """
+    data = await get_doh_client().query(str(url), name, method=method)
     logger.debug(f"doh request domain: {name}\nresponse\n{data}")
     return data
+
+
+@router.get("/doh/race", summary="DNS-Over-Https 竞速", response_model=DoHResponse)
+async def doh_race(
+    response: Response,
+    name: str = Query(..., description="域名"),
+    type: DoHRecordType = Query(DoHRecordType.A, description="解析类型"),
+    urls: list[HttpUrl] | None = Query(None, description="参与竞速的 doh 服务, 默认使用配置 doh_race_resolvers"),
+    size: int | None = Query(None, ge=1, le=10, description="每次参与竞速的数量, 默认使用配置 doh_race_size"),
+):
+    """同时向多个 doh 服务查询, 返回最先得到的有效应答并取消其余查询
+
+    按各 doh 服务的历史延迟挑选参与竞速的服务, 胜出的服务与延迟见响应头
+    """
+    settings = get_settings()
+    resolvers = [str(x) for x in urls] if urls else settings.doh_race_resolvers
+    result = await get_doh_client().race(resolvers, name, type.value, size=size or settings.doh_race_size)
+    if result.error is not None:
+        raise HTTPException(status_code=502, detail=result.error)
+
+    response.headers["X-DoH-Resolver"] = result.url
+    response.headers["X-DoH-Latency"] = str(result.latency)
+    return result.data
+
+
+@router.post("/doh/batch", summary="DNS-Over-Https 批量对比", response_model=DoHBatchRes)
+async def doh_batch(req: DoHBatchReq = Body(...)):
+    """使用多个 doh 服务并发解析多个域名, 返回每个域名在各 doh 服务下的结果矩阵
+
+    用于检查规则集中的域名是否被污染
+    """
+    urls = list(dict.fromkeys(str(x) for x in req.urls))
+    names = list(dict.fromkeys(req.names))
+    rdtypes = list(dict.fromkeys(x.value for x in req.types))
+    lookups = await get_doh_client().lookup_many(urls, names, rdtypes, method=req.method, concurrency=req.concurrency)
+
+    items = []
+    for i in range(0, len(lookups), len(urls)):
+        group = lookups[i : i + len(urls)]
+        answers = {tuple(x.answers) for x in group if x.error is None}
+        items.append(
+            DoHBatchItem(
+                name=group[0].name,
+                type=DoHRecordType(group[0].rdtype),
+                consistent=len(answers) <= 1,
+                resolvers={
+                    x.url: DoHResolverResult(status=x.status, answers=x.answers, latency=x.latency, error=x.error)
+                    for x in group
+                },
+            )
+        )
+    return DoHBatchRes(items=items, inconsistent=sum(not x.consistent for x in items))
@@ -1,20 +1,33 @@
-import asyncio
+import json
 import logging
 from concurrent.futures import ThreadPoolExecutor
 
 import ssl_checker
-from fastapi import APIRouter, Query
-from schemas.network.ssl import SSLCertSchema, SSLCertsResSchema
-from utils.basic import AsyncSSLClientContext
+from deps import get_ssl_cert_monitor, get_ssl_cert_scanner
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from schemas.network.ssl import SSLCertMonitorResSchema, SSLCertSchema, SSLCertsResSchema
+from settings import get_settings
+from utils.network.certs import parse_host_port
 
 router = APIRouter(tags=["Utils"], prefix="/network/ssl")
 
 logger = logging.getLogger(__file__)
 
+executor = ThreadPoolExecutor(max_workers=get_settings().ssl_scan_concurrency, thread_name_prefix="ssl_checker")
+
+
+def validate_hosts(hosts: list[str]) -> list[tuple[str, int]]:
+    """解析全部地址, 存在格式错误时返回 422"""
+    try:
+        return [parse_host_port(host) for host in hosts]
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
 
 def get_peer_cert_context(host: str, port: int = 443) -> SSLCertSchema | None:
     obj = ssl_checker.SSLChecker()
-    cert, resolved_ip = obj.get_cert(host, 443)
+    cert, resolved_ip = obj.get_cert(host, port)
     context = obj.get_cert_info(host, cert, resolved_ip)
     if context == "failed":
         return None
@@ -25,15 +38,47 @@ def get_peer_cert_context(host: str, port: int = 443) -> SSLCertSchema | None:
 @router.get("/certs", summary="查询网站证书信息", response_model=SSLCertsResSchema)
 def certs(hosts: list[str] = Query(..., description="域名列表")):
     """使用 ssl_checker 实现"""
-    with ThreadPoolExecutor() as exector:
-        result = exector.map(get_peer_cert_context, hosts)
-    return {"li": result}
+    result = executor.map(get_peer_cert_context, hosts)
+    return {"li": list(result)}
 
 
 @router.get("/certs/v2", summary="查询网站证书信息V2", response_model=SSLCertsResSchema)
-async def certs_v2(hosts: list[str] = Query(..., description="域名列表")):
-    """使用 asyncio 实现"""
-    results = await asyncio.gather(
-        *[AsyncSSLClientContext(host, verify=False).get_peer_certificate() for host in hosts]
+async def certs_v2(hosts: list[str] = Query(..., description="域名列表, 支持 host:port")):
+    """使用 asyncio 实现, 结果顺序与传入顺序一致, 失败的站点返回 null"""
+    addresses = validate_hosts(hosts)
+    results = {}
+    async for item in get_ssl_cert_scanner().scan(dict.fromkeys(hosts)):
+        results[(item.host, item.tcp_port)] = item.cert
+    return {"li": [results.get(item) for item in addresses]}
+
+
+@router.get("/certs/stream", summary="流式查询网站证书信息")
+async def certs_stream(hosts: list[str] = Query(..., description="域名列表, 支持 host:port")):
+    """按完成顺序以 NDJSON 逐行返回结果, 单个站点超时不会阻塞其他站点的结果
+
+    客户端断开连接时取消剩余的查询
+    """
+    validate_hosts(hosts)
+
+    async def iter_lines():
+        async for item in get_ssl_cert_scanner().scan(dict.fromkeys(hosts)):
+            yield json.dumps(item.model_dump(mode="json"), ensure_ascii=False) + "\n"
+
+    return StreamingResponse(iter_lines(), media_type="application/x-ndjson")
+
+
+@router.get("/certs/monitor", summary="证书过期监控结果", response_model=SSLCertMonitorResSchema)
+def certs_monitor():
+    """返回后台定时扫描的结果, 不会发起新的连接
+
+    监控的站点通过配置 ssl_monitor_hosts 设置
+    """
+    settings = get_settings()
+    monitor = get_ssl_cert_monitor()
+    items = sorted(monitor.results.values(), key=lambda x: x.cert.valid_days_to_expire if x.cert else -1)
+    return SSLCertMonitorResSchema(
+        enable=settings.ssl_monitor_enable,
+        expire_days=monitor.expire_days,
+        last_run_at=monitor.last_run_at,
+        li=items,
     )
-    return {"li": results}
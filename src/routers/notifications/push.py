@@ -1,11 +1,18 @@
 import logging
-from concurrent.futures import ThreadPoolExecutor
 from http import HTTPStatus
 
-from fastapi import APIRouter, Query
+from deps import get_notification_dispatcher, get_notification_queue
+from fastapi import APIRouter, HTTPException, Query
 from fastapi.responses import JSONResponse, RedirectResponse
 from schemas import ErrorDetail
-from schemas.notifications import PushMessage, PushMessages, PushMessagesV3, PushMessageV3
+from schemas.notifications import (
+    PushChannelResult,
+    PushJobSchema,
+    PushMessages,
+    PushMessagesV3,
+    PushQueuedRes,
+    PushQueueStatsRes,
+)
 
 router = APIRouter(tags=["Basic"], prefix="/notifications")
 logger = logging.getLogger(__file__)
@@ -36,82 +43,58 @@ def push(messages: PushMessages):
     return {}
 
 
+def get_push_response(results: list[PushChannelResult]) -> dict | JSONResponse:
+    """存在失败的渠道时返回 500, 响应中包含每个渠道的推送结果"""
+    details = [
+        ErrorDetail(type="value_error", loc=["body", "messages", x.index, x.channel], message=x.error or "")
+        for x in results
+        if not x.ok
+    ]
+    content = {"results": [x.model_dump() for x in results]}
+    if details:
+        content["detail"] = [x.model_dump() for x in details]
+        return JSONResponse(content=content, status_code=HTTPStatus.INTERNAL_SERVER_ERROR)
+    return content
+
+
 @router.post("/push/v2", summary="消息推送v2")
-def push_v2(messages: PushMessages):
-    def handle_message(index: int, message: PushMessage) -> ErrorDetail | None:
-        detail = None
-        loc = ["body", "messages", index]
-        try:
-            current = ""
-            if message.telegram:
-                current = "telegram"
-                message.telegram.push()
-            if message.gmail:
-                current = "gmail"
-                message.gmail.push()
-            if message.bark:
-                current = "bark"
-                message.bark.push()
-        except Exception as e:
-            logger.warning(e, exc_info=True)
-            loc.append(current)
-            detail = ErrorDetail(type="value_error", loc=loc, message=f"{e}")
-        return detail
+async def push_v2(messages: PushMessages):
+    """所有消息与渠道并发推送, 单个渠道失败不影响其他渠道"""
+    return get_push_response(await get_notification_dispatcher().dispatch(messages.messages))
 
-    with ThreadPoolExecutor(thread_name_prefix="notifications.push.") as executor:
-        arguments = [range(len(messages.messages)), messages.messages]
-        results = executor.map(handle_message, *arguments)
-    details = [x for x in results if x]
-    if details:
-        return JSONResponse(content={"detail": details}, status_code=HTTPStatus.INTERNAL_SERVER_ERROR)
-    return {}
 
+@router.post(
+    "/push/v3",
+    summary="消息推送v3",
+    status_code=HTTPStatus.ACCEPTED,
+    responses={HTTPStatus.ACCEPTED: {"model": PushQueuedRes}},
+)
+async def push_v3(
+    messages: PushMessagesV3,
+    sync: bool = Query(False, description="直接推送并返回每个渠道的结果, 不经过队列"),
+):
+    """消息写入持久化队列后立即返回任务 id, 失败的渠道按指数退避重试
 
-@router.post("/push/v3", summary="消息推送v3")
-def push_v3(messages: PushMessagesV3):
-    def handle_message(index: int, message: PushMessageV3) -> ErrorDetail | None:
-        detail = None
-        loc = ["body", "messages", index]
-        try:
-            current = ""
-            if message.telegram:
-                current = "telegram"
-                if message.telegram.message:
-                    current = "telegram.message"
-                    message.telegram.push_text()
-                if message.telegram.photo:
-                    current = "telegram.photo"
-                    message.telegram.push_photo()
-                if message.telegram.media:
-                    current = "telegram.media"
-                    message.telegram.push_media()
-            if message.gmail:
-                current = "gmail"
-                message.gmail.push()
-            if message.bark:
-                current = "bark"
-                message.bark.push()
-            if message.gotify:
-                current = "gotify"
-                message.gotify.push()
-            if message.apple:
-                current = "apple"
-                message.apple.push()
-        except Exception as e:
-            logger.warning(e, exc_info=True)
-            loc.append(current)
-            detail = ErrorDetail(type="value_error", loc=loc, message=f"{e}")
-        return detail
+    - 同一 telegram 会话的突发消息会合并推送, 图片合并为媒体组
+    - 通过 /notifications/push/v3/jobs/{id} 查询推送状态
+    - sync 为 true 时所有消息与渠道并发推送, 同一条消息中 telegram 的文本、图片与媒体组按顺序推送
+    """
+    if sync:
+        return get_push_response(await get_notification_dispatcher().dispatch(messages.messages))
+    return PushQueuedRes(ids=await get_notification_queue().enqueue(messages.messages))
 
-    with ThreadPoolExecutor(thread_name_prefix="notifications.push.") as executor:
-        arguments = [range(len(messages.messages)), messages.messages]
-        results = executor.map(handle_message, *arguments)
-    details = [x for x in results if x]
-    if details:
-        return JSONResponse(
-            content={"detail": [x.dict() for x in details]}, status_code=HTTPStatus.INTERNAL_SERVER_ERROR
-        )
-    return {}
+
+@router.get("/push/v3/jobs/{id}", summary="消息推送任务状态", response_model=PushJobSchema)
+async def push_v3_job(id: str):
+    job = await get_notification_queue().get(id)
+    if job is None:
+        raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail=f"job {id} not found")
+    return job.to_schema()
+
+
+@router.get("/push/queue", summary="消息推送队列统计", response_model=PushQueueStatsRes)
+async def push_queue_stats():
+    return PushQueueStatsRes(**await get_notification_queue().stats())
 
 
 @router.get("/oauth2/google/refresh_token", include_in_schema=False)
@@ -0,0 +1,34 @@
+import logging
+
+from fastapi import APIRouter, HTTPException, Path, Query
+from schemas.rss.jsonfeed import JSONFeed
+from utils.playwright import BrowserPoolBusy
+from utils.rss.douyin import get_user_feeds
+
+router = APIRouter(tags=["RSS"], prefix="/rss/douyin")
+
+logger = logging.getLogger(__file__)
+
+
+@router.get("/user/{username}", summary="抖音用户动态", response_model=JSONFeed)
+async def douyin_user_feeds(
+    username: str = Path(..., description="用户主页地址中的 sec_uid"),
+    cookie: str = Query("", description="抓取时使用的抖音 Cookie"),
+):
+    """从持久化缓存返回用户动态
+
+    - 缓存过期后先返回旧数据并在后台刷新, 仅首次访问的用户需要等待浏览器抓取
+    - 访问过的用户会被记录, 开启 rss_douyin_user_auto_fetch_enable 后定时预取
+    """
+    try:
+        items = await get_user_feeds(username, cookie)
+    except BrowserPoolBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "10"})
+    except Exception as e:
+        logger.warning(f"[douyin_user_feeds] fetch {username} failed: {e!r}")
+        raise HTTPException(status_code=502, detail=f"获取抖音用户动态失败: {e!r}")
+
+    home_page_url = f"https://www.douyin.com/user/{username}"
+    author = items[0].author if items else None
+    title = f"抖音 - {author.name}" if author and author.name else f"抖音 - {username}"
+    return JSONFeed(title=title, home_page_url=home_page_url, author=author, items=items)  # type: ignore[call-arg]
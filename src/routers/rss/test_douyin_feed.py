@@ -0,0 +1,42 @@
+import routers.rss.douyin as douyin_router
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from schemas.rss.jsonfeed import JSONFeedAuthor, JSONFeedItem
+from utils.playwright import BrowserPoolBusy
+
+
+def make_client() -> TestClient:
+    app = FastAPI()
+    app.include_router(douyin_router.router)
+    return TestClient(app)
+
+
+def test_douyin_user_feeds_from_cache(monkeypatch):
+    calls = []
+
+    async def get_user_feeds(username: str, cookie: str):
+        calls.append((username, cookie))
+        author = JSONFeedAuthor(name="alice")  # type: ignore[call-arg]
+        return [JSONFeedItem(id=f"douyin.user.{username}.1", content_html="<br>", author=author)]  # type: ignore[call-arg]
+
+    monkeypatch.setattr(douyin_router, "get_user_feeds", get_user_feeds)
+    res = make_client().get("/rss/douyin/user/MS4w", params={"cookie": "a=1"})
+    assert res.status_code == 200
+    body = res.json()
+    assert body["title"] == "抖音 - alice"
+    assert body["home_page_url"] == "https://www.douyin.com/user/MS4w"
+    assert [x["id"] for x in body["items"]] == ["douyin.user.MS4w.1"]
+    assert calls == [("MS4w", "a=1")]
+
+
+def test_douyin_user_feeds_errors(monkeypatch):
+    errors = [BrowserPoolBusy("busy"), TimeoutError("timeout")]
+
+    async def get_user_feeds(username: str, cookie: str):
+        raise errors.pop(0)
+
+    monkeypatch.setattr(douyin_router, "get_user_feeds", get_user_feeds)
+    client = make_client()
+    res = client.get("/rss/douyin/user/MS4w")
+    assert res.status_code == 503 and res.headers["Retry-After"] == "10"
+    assert client.get("/rss/douyin/user/MS4w").status_code == 502
@@ -1,10 +1,15 @@
 import logging
 
-import httpx
-import yaml
 from fastapi import APIRouter, Query
-from fastapi.responses import PlainTextResponse
+from fastapi.responses import PlainTextResponse, Response
 from schemas.adapter import HttpUrl
+from utils.stash.ruleset import (
+    RulesetAdblock,
+    RulesetBehaviorEnum,
+    RulesetFormatEnum,
+    dump_ruleset_payloads,
+    optimize_ruleset_payloads,
+)
 
 router = APIRouter(tags=["Stash"], prefix="/stash/ruleset")
 
@@ -12,31 +17,33 @@ logger = logging.getLogger(__file__)
 
 
 @router.get("/adblock", summary="Adblock-style规则集转换")
-def adblock_to_ruleset(url: HttpUrl = Query(...)):
-    r"""转换为 yaml 格式, domain 类型的规则集
+async def adblock_to_ruleset(
+    url: HttpUrl = Query(...),
+    behavior: RulesetBehaviorEnum = Query(
+        RulesetBehaviorEnum.domain,
+        description="domain 规则集不包含正则规则; classical 规则集包含 DOMAIN-REGEX, 域名规则均输出为 DOMAIN-SUFFIX",
+    ),
+    optimize: bool = Query(False, description="移除已被更短后缀覆盖的规则, 缩减比例见响应头"),
+    format: RulesetFormatEnum = Query(
+        RulesetFormatEnum.yaml,
+        description="binary 为本服务内部格式, Stash/Clash 等客户端无法加载, 仅包含 domain 规则, 格式见 docs/tech",
+    ),
+):
+    r"""流式转换为 yaml 格式的规则集
 
     支持以下规则
     - ||stun1.douyucdn.cn
     - ||mcdn.bilivideo.cn^
-
-    不支持以下规则
-    /.*pcdn.*biliapi\.net/
+    - /.*pcdn.*biliapi\.net/, 仅 classical 规则集
     """
-    resp = httpx.get(str(url))
-    resp.raise_for_status()
-    domains = []
-    suffix_domains = []
-    for line in resp.text.split("\n"):
-        line = line.strip()
-        if line.startswith("||") and line.endswith("^"):
-            domains.append(f"{line[2:-1]}")
-        elif line.startswith("||"):
-            suffix_domains.append(f"+.{line[2:]}")
-        elif line.startswith("/") and line.endswith("/"):
-            # todo: support regex pattern rule
-            pass
-        else:
-            logger.warning(f"unsupport rule type: {line}")
-    contents = list(set(domains) | set(suffix_domains))
-    suffix_domains = list(set(suffix_domains))
-    return PlainTextResponse(yaml.safe_dump({"payload": contents}, allow_unicode=True))
+    ruleset = RulesetAdblock(str(url))
+    await ruleset.fetch()
+    if format == RulesetFormatEnum.binary:
+        content, optimize_headers = ruleset.to_binary(optimize=optimize)
+        return Response(content, media_type="application/octet-stream", headers=optimize_headers)
+
+    payloads = ruleset.get_payloads(behavior)
+    headers: dict[str, str] = {}
+    if optimize:
+        payloads, headers = optimize_ruleset_payloads(payloads)
+    return PlainTextResponse(dump_ruleset_payloads(payloads), headers=headers)
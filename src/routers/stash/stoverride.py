@@ -1,22 +1,31 @@
+import asyncio
+import hashlib
 import inspect
 import json
 import logging
 import re
 import urllib.parse
 import uuid
+from dataclasses import dataclass
 from typing import Any, cast
 
 import httpx
 import yaml
 from asyncache import cached
 from cachetools import TTLCache
-from fastapi import APIRouter, HTTPException, Path, Query
-from fastapi.responses import PlainTextResponse
+from fastapi import APIRouter, Header, HTTPException, Path, Query
+from fastapi.responses import PlainTextResponse, Response
 from schemas.adapter import HttpUrl, KeyValuePairStr
 from schemas.github.releases import ReleaseSchema
-from schemas.loon import LoonArgument
+from utils.basic import is_etag_matched
 from utils.stash.dns import NameserverPolicyGeositeOverride
-from utils.stash.ruleset import RulesetGeositeOverride
+from utils.stash.loon import bundle_stash_overrides, parse_loon_plugin
+from utils.stash.ruleset import (
+    RulesetFormatEnum,
+    RulesetGeositeOverride,
+    dump_ruleset_payloads,
+    optimize_ruleset_payloads,
+)
 
 router = APIRouter(tags=["Stash"], prefix="/stash/stoverride")
 
@@ -24,28 +33,6 @@ router = APIRouter(tags=["Stash"], prefix="/stash/stoverride")
 logger = logging.getLogger(__file__)
 
 
-def rewrite_loon_argument(
-    argument: str, loon_arguments: dict[str, LoonArgument], overrideScriptArguments: dict | None
-) -> str | None:
-    """将 Loon 脚本参数重写为 Stash 可用的脚本参数，填充 Argument 默认值"""
-    if overrideScriptArguments is None:
-        overrideScriptArguments = {}
-
-    if not argument:
-        return ""
-
-    fields = re.findall(r"\{([^}]+)\}", argument)
-    body = {}
-    for field in fields:
-        value = overrideScriptArguments.get(field) or loon_arguments[field].default
-        if value == "true":
-            value = True
-        if value == "false":
-            value = False
-        body[field] = value
-    return json.dumps(body, ensure_ascii=False)
-
-
 @cached(TTLCache(1024, 600))
 async def get_jq_path_content(url: str, user_agent: str) -> str:
     async with httpx.AsyncClient(headers={"User-Agent": user_agent}, verify=False) as client:
@@ -58,63 +45,53 @@ async def get_jq_path_content(url: str, user_agent: str) -> str:
     return re.sub(r"\s+", " ", " ".join(lines)).strip("'")
 
 
-def kv_pair_parse(content: str) -> dict:
-    data = {}
-    key = ""
-    index = 0
-    stop = len(content)
-    while index < stop:
-        char = content[index]
-        if char == " ":
-            index += 1
-            continue
+async def get_jq_path_contents(urls: list[str], user_agent: str) -> dict[str, str]:
+    contents = await asyncio.gather(*[get_jq_path_content(url, user_agent) for url in urls])
+    return dict(zip(urls, contents))
+
+
+@dataclass(frozen=True)
+class LoonPluginSource:
+    text: str
+    digest: str
+    etag: str | None = None
+    last_modified: str | None = None
+
+
+LOON_PLUGIN_SOURCE_CACHE: TTLCache = TTLCache(256, 86400)
+LOON_OVERRIDE_CACHE: TTLCache = TTLCache(1024, 3600)
+
+
+async def fetch_loon_plugin_source(url: str, user_agent: str) -> LoonPluginSource:
+    """获取 Loon 插件内容, 存在缓存时携带 If-None-Match/If-Modified-Since, 上游返回 304 时复用缓存内容"""
+    key = (url, user_agent)
+    cached_source: LoonPluginSource | None = LOON_PLUGIN_SOURCE_CACHE.get(key)
+    headers = {}
+    if cached_source is not None:
+        if cached_source.etag:
+            headers["If-None-Match"] = cached_source.etag
+        if cached_source.last_modified:
+            headers["If-Modified-Since"] = cached_source.last_modified
+
+    async with httpx.AsyncClient(headers={"User-Agent": user_agent}, verify=False) as client:
+        resp = await client.get(url, headers=headers)
 
-        # get key name
-        if char == "=":
-            index += 1
-
-            # parse value
-            prefix: list[str] = []
-            value = ""
-            while index < stop:
-                char = content[index]
-                if char == "," and len(prefix) == 0:
-                    index += 1
-                    break
-
-                value += char
-                if key.lower() == "argument":
-                    if char in "[(":
-                        prefix.append(char)
-                        index += 1
-                        continue
-
-                    if char == ")":
-                        if not prefix or prefix[-1] != "(":
-                            raise ValueError(f"bad character at index of: {index}\ncontent:{content}")
-                        prefix.pop()
-                        index += 1
-                        continue
-
-                    if char == "]":
-                        if not prefix or prefix[-1] != "[":
-                            raise ValueError(f"bad character at index of: {index}\ncontent:{content}")
-                        prefix.pop()
-                        index += 1
-                        continue
-
-                index += 1
-
-            if prefix:
-                raise ValueError(f"invalid value: {key} - {value} - {prefix}")
-
-            data[key] = value
-            key = ""
-        else:
-            key += char
-            index += 1
-
-    return data
+    if resp.status_code == 304 and cached_source is not None:
+        logger.debug(f"[loon] not modified: {url}")
+        LOON_PLUGIN_SOURCE_CACHE[key] = cached_source
+        return cached_source
+
+    if resp.is_error:
+        raise HTTPException(status_code=resp.status_code, detail=resp.text)
+
+    source = LoonPluginSource(
+        text=resp.text,
+        digest=hashlib.sha256(resp.content).hexdigest(),
+        etag=resp.headers.get("ETag"),
+        last_modified=resp.headers.get("Last-Modified"),
+    )
+    LOON_PLUGIN_SOURCE_CACHE[key] = source
+    return source
 
 
 @cached(TTLCache(32, 86400))
@@ -341,8 +318,11 @@ async def loon(
     scriptArguments: list[KeyValuePairStr] = Query(
         [], description="强制覆写脚本参数", examples=["debug=ture", "text=loon"]
     ),
+    if_none_match: str | None = Header(None),
 ):
     """
+    插件源使用条件请求获取, 按内容哈希缓存转换结果, 客户端携带 If-None-Match 时可能返回 304
+
     Argument
     https://nsloon.app/docs/Plugin/
 
@@ -356,313 +336,101 @@ async def loon(
     """
     overrideScriptArguments = {k: v for item in scriptArguments for k, v in [item.split("=", 1)]}
 
-    async with httpx.AsyncClient(headers={"User-Agent": user_agent}, verify=False) as client:
-        resp = await client.get(url)
-        if resp.is_error:
-            raise HTTPException(status_code=resp.status_code, detail=resp.text)
-
-    override: dict[str, Any] = {}
-    section = None
-    mitms: list[str] = []
-    rules: list[str] = []
-    url_rewrites: list[str] = []
-    body_rewrites: list[str] = []
-    header_rewrites: list[str] = []
-    scripts: list[dict] = []
-    script_providers = {}
-    arguments: dict[str, LoonArgument] = {}
-    _payload: dict[str, Any] = {}
-
-    for line in resp.text.splitlines():
-        line = line.strip()
-        if line.startswith("#!"):
-            k, v = line[2:].split("=")
-            override[k.strip()] = v.strip()
-            continue
-
-    if name is not None:
-        override["name"] = name
-
-    if category is not None:
-        override["category"] = category
-
-    if icon is not None:
-        override["icon"] = icon
-
-    if desc is not None:
-        override["desc"] = desc
+    source = await fetch_loon_plugin_source(url, user_agent)
+    plugin = parse_loon_plugin(source.text)
+    # jq 脚本内容的缓存时间较短, 转换结果按其内容哈希缓存, 脚本变化后立即失效
+    jq_contents = await get_jq_path_contents(plugin.jq_paths, user_agent)
+    jq_digest = hashlib.sha256(json.dumps(jq_contents, sort_keys=True).encode()).hexdigest()
+    key = (
+        source.digest,
+        jq_digest,
+        user_agent,
+        name,
+        desc,
+        category,
+        icon,
+        tuple(sorted(overrideScriptArguments.items())),
+    )
+    converted = LOON_OVERRIDE_CACHE.get(key)
+    if converted is None:
+        override = plugin.to_stash_override(
+            name=name,
+            desc=desc,
+            category=category,
+            icon=icon,
+            script_arguments=overrideScriptArguments,
+            jq_contents=jq_contents,
+        )
+        # 设置 width 避免默认的单行内容过长导致的换行
+        text = yaml.safe_dump(override, sort_keys=False, allow_unicode=True, width=9999)
+        converted = LOON_OVERRIDE_CACHE[key] = (text, f'"{hashlib.sha256(text.encode()).hexdigest()}"')
+
+    text, etag = converted
+    if is_etag_matched(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
 
-    for line in resp.text.splitlines():
-        line = line.strip()
-        if not line:
-            continue
+    headers = {
+        "Content-Disposition": "inline",
+        "ETag": etag,
+    }
+    return PlainTextResponse(text, media_type="application/yaml;charset=utf-8", headers=headers)
 
-        if line.startswith("#"):
-            continue
 
-        matched = re.match(r"^\[(.*)?\]", line)
-        if matched:
-            section = matched.group(1)
-            continue
+@router.get("/loon/bundle", summary="合并多个 Loon 插件为一个 Stash 覆写")
+async def loon_bundle(
+    urls: list[HttpUrl] = Query(..., description="Loon 插件地址列表"),
+    user_agent: str = Query("StashCore/3.1.0 Stash/3.1.0 Clash/1.11.0"),
+    name: str = Query("Loon Bundle", description="覆写 name"),
+    desc: str | None = Query(None, description="覆写 desc, 默认为合并的插件名称"),
+    category: str | None = Query(None, description="覆写 category"),
+    icon: str | None = Query(None, description="覆写 icon"),
+    scriptArguments: list[KeyValuePairStr] = Query(
+        [], description="强制覆写脚本参数, 作用于所有插件", examples=["debug=ture", "text=loon"]
+    ),
+):
+    """并发获取并转换多个 Loon 插件, 合并为单个 Stash 覆写
 
-        if section is None:
-            continue
+    mitm、rules、rewrite 去重合并, 同名脚本自动重命名
 
-        section = section.lower()
-        match section:
-            # 优先处理 Argument, 便于后续 Script 填充参数
-            case "argument":
-                name = None
-                result: dict[str, Any] = {}
-                for part in line.split(","):
-                    part = part.strip().strip('"')
-                    if "=" in part:
-                        key, value = part.split("=", 1)
-                        key = key.strip()
-                        value = value.strip()
-                        if name is None and key not in ("tag", "desc"):
-                            name = key.strip()
-                        result[key] = value
-                    else:
-                        result.setdefault("_values", []).append(part)
-
-                assert name, (line, result)
-                _payload = {
-                    "name": name,
-                    "type": result[name],
-                    "desc": result.get("desc", ""),
-                    "tag": result.get("tag", ""),
-                    "default": result["_values"][0],
-                    "values": result["_values"],
-                }
-
-                arguments[name] = LoonArgument(**_payload)
-
-    logger.debug(f"[loon] arguments: {arguments}")
-
-    for line in resp.text.splitlines():
-        line = line.strip()
-        if not line:
-            continue
+    单个插件转换失败不影响其余插件, 失败信息追加在 desc 中, 失败数量见响应头 X-Loon-Bundle-Failures
+    """
+    overrideScriptArguments = {k: v for item in scriptArguments for k, v in [item.split("=", 1)]}
 
-        if line.startswith("#"):
-            continue
-        matched = re.match(r"^\[(.*)?\]", line)
-        if matched:
-            section = matched.group(1)
+    async def convert(url: str) -> dict[str, Any]:
+        source = await fetch_loon_plugin_source(url, user_agent)
+        plugin = parse_loon_plugin(source.text)
+        return plugin.to_stash_override(
+            script_arguments=overrideScriptArguments,
+            jq_contents=await get_jq_path_contents(plugin.jq_paths, user_agent),
+        )
+
+    results = await asyncio.gather(*[convert(url) for url in urls], return_exceptions=True)
+
+    overrides: list[dict[str, Any]] = []
+    plugin_names: list[str] = []
+    failures: list[str] = []
+    for url, result in zip(urls, results):
+        if isinstance(result, BaseException):
+            detail = result.detail if isinstance(result, HTTPException) else f"{type(result).__name__}: {result}"
+            logger.warning(f"[loon bundle] convert failed: {url}, {detail}")
+            failures.append(f"{url}: {detail}")
             continue
+        overrides.append(result)
+        plugin_names.append(str(result.get("name") or url))
 
-        if section is None:
-            continue
+    if not overrides:
+        raise HTTPException(status_code=502, detail=failures)
 
-        section = section.lower()
-        # Mock
-        if "mock-request-body" in line or "mock-response-body" in line:
-            logger.debug(f"skip by mock: {line}")
-            continue
+    if desc is None:
+        desc = "\n".join(plugin_names)
+    if failures:
+        desc = "\n".join([desc, "转换失败:", *failures])
 
-        match section:
-            case "mitm":
-                if line.startswith("hostname"):
-                    for item in line.split("=", 1)[1].split(","):
-                        mitms.append(item.strip())
-            case "rule":
-                content = line.replace(" ", "")
-                if len(content.split(",")) <= 2:
-                    logger.warning(f"[Loon Rules]invalid rule: {line}")
-                else:
-                    rules.append(content)
-            case "rewrite":
-                # URL 类型复写
-                # https://nsloon.app/docs/Rewrite/#url-%E7%B1%BB%E5%9E%8B%E5%A4%8D%E5%86%99
-                matched = re.match(r"(.*?http.*?) header (.*?http.*)", line)
-                if matched:
-                    p1, p2 = matched.groups()
-                    url_rewrites.append(f"{p1} {p2} transparent")
-                    continue
-
-                # redirect
-                matched = re.match(r"(.*?http.*?) (\d{3}) (.*?http.*)", line)
-                if matched:
-                    p1, p2, p3 = matched.groups()
-                    url_rewrites.append(f"{p1} {p3} {p2}")
-                    continue
-
-                # reject
-                matched = re.match(r"(.*?http.*?) (reject.*)", line)
-                if matched:
-                    p1, p2 = matched.groups()
-                    p2.replace("-", "_").replace(" ", "").strip()
-                    url_rewrites.append(f"{p1} - {p2}")
-                    continue
-
-                # reject-200
-                # ^.*?(ad(.*)?\.tencentmusic\.com|kuwo\.cn\/((EcomResource|(Mobile)?Ad)Serv(er|ice)|(vip|(open)?api)?\/(setting\/sidebar\/menus|v\d\/(operate\/((adVip\/)?text|pop\/info)|online\/homepage\/homepageBanner|user\/freeMode|album\/adBar|app\/(newMenuList\/menuListInfo|pasterAdvert\/config)))|kuwopay\/vip-tab\/page\/floatbox|commercia\/eproxy\/boot\/recommend\/fee\/config)) reject-200
-                matched = re.match(r"(.*) (reject-200)", line)
-                if matched:
-                    p1, p2 = matched.groups()
-                    # p2.replace("-", "_").replace(" ", "").strip()
-                    url_rewrites.append(f"{p1} - {p2}")
-                    continue
-
-                # request header
-                matched = re.match(
-                    r"(.*?http.*?) (header-add|header-del|header-replace|header-replace-regex) (.*)", line
-                )
-                if matched:
-                    p1, p2, p3 = matched.groups()
-                    p2.replace("header", "request")
-                    header_rewrites.append(f"{p1} {p2} {p3}")
-                    continue
-
-                # response header
-                matched = re.match(
-                    r"(.*?http.*?) (response-header-add|response-header-del|response-header-replace|response-header-replace-regex) (.*)",
-                    line,
-                )
-                if matched:
-                    p1, p2, p3 = matched.groups()
-                    p2.replace("header", "")
-                    header_rewrites.append(f"{p1} {p2} {p3}")
-                    continue
-
-                # request body
-                matched = re.match(
-                    r"(.*?http.*?) (request-body-replace-regex|request-body-json-add|request-body-json-replace|request-body-json-del|request-body-json-jq) (.*)",
-                    line,
-                )
-                if matched:
-                    url, rewrite_type, content = matched.groups()
-                    rewrite_type = rewrite_type.replace("request-body", "request").replace("json-jq", "jq")
-                    if rewrite_type == "request-jq":
-                        jq_path_pattern = r'jq-path="(http.*)"'
-                        jq_path_matched = re.match(jq_path_pattern, content)
-                        if jq_path_matched:
-                            jq_url = jq_path_matched.group(1)
-                            content = await get_jq_path_content(jq_url, user_agent)
-                        else:
-                            content = content.strip("'")
-                    body_rewrites.append(f"{url} {rewrite_type} {content}")
-                    continue
-
-                # response body
-                matched = re.match(
-                    r"(.*?http.*?) (response-body-replace-regex|response-body-json-add|response-body-json-replace|response-body-json-del|response-body-json-jq) (.*)",
-                    line,
-                )
-                if matched:
-                    url, rewrite_type, content = matched.groups()
-                    rewrite_type = rewrite_type.replace("response-body", "response").replace("json-jq", "jq")
-
-                    if rewrite_type == "response-jq":
-                        jq_path_pattern = r'jq-path="(http.*)"'
-                        jq_path_matched = re.match(jq_path_pattern, content)
-                        if jq_path_matched:
-                            jq_url = jq_path_matched.group(1)
-                            content = await get_jq_path_content(jq_url, user_agent)
-                        else:
-                            content = content.strip("'")
-                    body_rewrites.append(f"{url} {rewrite_type} {content}")
-                    continue
-
-                # header ?
-                matched = re.match(r"(.*?http.*?) (header) (.*)", line)
-                if matched:
-                    logger.warning(f"[Bad Header Rewrite] {line}")
-                    continue
-
-                # redirect ?
-                matched = re.match(r"(.*?http.*?) (.*?) (\d{3})", line)
-                if matched:
-                    logger.warning(f"[Bad Redirect Rewrite] {line}")
-                    continue
-
-                logger.warning(f"[NotImplementedError] {line}")
-                raise NotImplementedError(line)
-
-            case "script":
-                matched = re.match(r"(cron) (.*)", line)
-
-                if matched:
-                    # TODO: 实现 cron 脚本转换
-                    logger.debug("skip because of cron script")
-                    continue
-
-                matched = re.match(r"(generic) (.*)", line)
-                if matched:
-                    logger.debug("skip because of generic script")
-                    continue
-
-                matched = re.match(r"(http-request|http-response) (\S+) (.*)", line)
-                if not matched:
-                    raise ValueError(f"invalid script line: {line}")
-
-                type_, match_, p3 = matched.groups()
-                type_ = type_.replace("http-", "")
-                p3 = cast(str, p3)
-
-                # bad case
-                if match_ == r"^https:\/\/j1\.pupuapi\.com\/client\/a朴朴超市,":
-                    continue
-                try:
-                    kwargs = kv_pair_parse(p3)
-                except Exception as e:
-                    logger.error(f"[Loon Script] get kwargs by script\n{match_}\n{p3}\n{kwargs}\n{line}")
-                    raise e
-
-                try:
-                    if "script-path" not in kwargs:
-                        logger.error(f"[loon] can't find script-path: {kwargs}")
-                        raise RuntimeError()
-
-                    _payload = {
-                        "match": match_,
-                        "name": kwargs.pop("tag", uuid.uuid4().hex),
-                        "type": type_,
-                        "require-body": kwargs.pop("requires-body", "false").strip() == "true",
-                        "argument": rewrite_loon_argument(
-                            kwargs.pop("argument", ""), arguments, overrideScriptArguments
-                        ),
-                        "binary-mode": kwargs.pop("binary-body-mode", "false").strip() == "true",
-                        "timeout": int(kwargs.pop("timeout", 20)),
-                    }
-                    scripts.append(_payload)
-                    _script = {
-                        "url": kwargs.pop("script-path"),
-                        "interval": 86400,
-                    }
-                    script_providers[_payload["name"]] = _script
-                except Exception as e:
-                    logger.warning(f"[Loon Script] add script failed: {e}\n{match_}\n{type_}\n{p3}")
-                    raise e
-            case "argument":
-                ...
-            case _:
-                logger.warning(f"[Loon] Unkown section: {section}")
-
-    if mitms:
-        override.setdefault("http", {})
-        override["http"]["mitm"] = mitms
-    if rules:
-        rules = [x for x in rules if x]
-        override["rules"] = rules
-    if url_rewrites:
-        override.setdefault("http", {})
-        override["http"]["url-rewrite"] = url_rewrites
-    if body_rewrites:
-        override.setdefault("http", {})
-        override["http"]["body-rewrite"] = body_rewrites
-    if header_rewrites:
-        override.setdefault("http", {})
-        override["http"]["header-rewrite"] = header_rewrites
-    if scripts:
-        override.setdefault("http", {})
-        override["http"]["script"] = scripts
-        override["script-providers"] = script_providers
-    # 设置 width 避免默认的单行内容过长导致的换行
+    override = bundle_stash_overrides(overrides, name=name, desc=desc, category=category, icon=icon)
     text = yaml.safe_dump(override, sort_keys=False, allow_unicode=True, width=9999)
     headers = {
         "Content-Disposition": "inline",
+        "X-Loon-Bundle-Failures": str(len(failures)),
     }
     return PlainTextResponse(text, media_type="application/yaml;charset=utf-8", headers=headers)
 
@@ -698,17 +466,30 @@ async def ruleset_by_geosite(
         "https://github.com/v2fly/domain-list-community/releases/latest/download/dlc.dat",
         examples=["https://github.com/v2fly/domain-list-community/releases/latest/download/dlc.dat"],
     ),
+    optimize: bool = Query(False, description="移除已被更短后缀覆盖的规则, 缩减比例见响应头"),
+    format: RulesetFormatEnum = Query(
+        RulesetFormatEnum.yaml, description="binary 为本服务内部格式, Stash/Clash 等客户端无法加载, 格式见 docs/tech"
+    ),
 ):
     """geosite 数据来源自 https://github.com/v2fly/domain-list-community
 
-    数据存在 12-24h 的动态缓存时间
+    数据存在 12-24h 的动态缓存时间, binary 格式按数据版本缓存
     """
     attribute = None
     if "@" in geosite:
         geosite, attribute = geosite.split("@", 1)
     ruleset = RulesetGeositeOverride(geosite, attribute=attribute, geosite_url=geosite_url)
-    text = await ruleset.to_yaml()
     headers = {
         "Content-Disposition": "inline",
     }
+    if format == RulesetFormatEnum.binary:
+        content, optimize_headers = await ruleset.to_binary(optimize=optimize)
+        headers.update(optimize_headers)
+        return Response(content, media_type="application/octet-stream", headers=headers)
+
+    payloads = await ruleset.get_payloads()
+    if optimize:
+        payloads, optimize_headers = optimize_ruleset_payloads(payloads)
+        headers.update(optimize_headers)
+    text = dump_ruleset_payloads(payloads)
     return PlainTextResponse(text, media_type="application/yaml;charset=utf-8", headers=headers)
@@ -3,10 +3,10 @@ from typing import Any, cast
 
 import cloudscraper
 import curl_cffi
-from fastapi import APIRouter, Query
-from playwright.async_api import async_playwright
+from fastapi import APIRouter, HTTPException, Query
 from responses import PrettyJSONResponse
 from schemas.adapter import HttpUrl
+from utils.playwright import BrowserPoolBusy, get_browser_pool
 
 router = APIRouter(tags=["Utils"], prefix="/broswer")
 
@@ -28,19 +28,17 @@ async def playwright(
     if cookie is not None:
         _cookies = dict([x.strip().split("=") for x in cookie.split(";") if x != ""])
         cookies = [{"name": k, "value": v, "url": url} for k, v in _cookies.items()]
-    async with async_playwright() as playwright:
-        chromium = playwright.chromium
-        browser = await chromium.launch()
-        context = await browser.new_context(user_agent=userAgent)
-        if cookies:
-            await context.add_cookies(cookies)  # type: ignore
+    try:
+        async with get_browser_pool().new_context(user_agent=userAgent) as context:
+            if cookies:
+                await context.add_cookies(cookies)  # type: ignore
 
-        page = await context.new_page()
-        res = await page.goto(url)
-        text = await res.text() if res else None
-        status = res.status if res else None
-        await context.close()
-        await browser.close()
+            page = await context.new_page()
+            res = await page.goto(url)
+            text = await res.text() if res else None
+            status = res.status if res else None
+    except BrowserPoolBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "10"})
     return {"text": text, "status": status}
 
 
@@ -7,6 +7,7 @@ from fastapi import APIRouter, HTTPException, Query
 from fastapi.responses import PlainTextResponse, RedirectResponse
 from utils.cache import cached
 from utils.douyin.video import AsyncDouyinVideoPlaywright, DouyinVideoTool
+from utils.playwright import BrowserPoolBusy
 
 router = APIRouter(tags=["Utils"], prefix="/tool/url")
 
@@ -46,7 +47,10 @@ async def douyin_video_share_link(
     redirect: bool = Query(False, description="返回结果是否直接重定向, 默认返回纯文本"),
 ):
     """将抖音的视频分享链接转换为下载链接"""
-    download_url = await get_douyin_video_download_link_by_cache(text)
+    try:
+        download_url = await get_douyin_video_download_link_by_cache(text)
+    except BrowserPoolBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "10"})
     if redirect:
         return RedirectResponse(download_url)
 
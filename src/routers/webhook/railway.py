@@ -1,7 +1,9 @@
 import logging
 from typing import Any
 
+from deps import get_notification_queue
 from fastapi import APIRouter, Body, Path
+from schemas.notifications import PushMessageV3
 from schemas.notifications.bark import BarkPushLevel, BarkPushMessage
 from schemas.webhook.railway import RailwayWebhookPayload
 
@@ -16,7 +18,7 @@ def railway_webhook_options():
 
 
 @router.post("/bark/{token}", summary="Railway")
-def railway_webhook(
+async def railway_webhook(
     token: str = Path(..., description="bark token"),
     payload: RailwayWebhookPayload = Body(...),
 ):
@@ -29,7 +31,6 @@ def railway_webhook(
         level=BarkPushLevel.active,
         group="railway",
     )
-    msg = BarkPushMessage(**data)
-    resp = msg.push()
-    resp.raise_for_status()
+    # 写入推送队列后立即返回, 推送失败时由队列重试
+    await get_notification_queue().enqueue([PushMessageV3(bark=BarkPushMessage(**data))])
     return "ok"
@@ -1,4 +1,21 @@
+from enum import Enum
+
 from pydantic import BaseModel, Field
+from schemas.adapter import HttpUrl
+
+
+class DoHMethod(str, Enum):
+    auto = "auto"
+    json = "json"
+    wireformat = "wireformat"
+    post = "post"
+
+
+class DoHRecordType(str, Enum):
+    A = "A"
+    AAAA = "AAAA"
+    CNAME = "CNAME"
+    HTTPS = "HTTPS"
 
 
 class DNSDescription:
@@ -44,3 +61,30 @@ class DoHResponse(BaseModel):
     Answer: list[DNSAnswer] | DNSAnswer | None = None
     Authority: list[DNSAnswer] | None = None
     Additional: list | None = None
+
+
+class DoHBatchReq(BaseModel):
+    names: list[str] = Field(..., min_length=1, max_length=2000, description="待解析的域名列表")
+    types: list[DoHRecordType] = Field([DoHRecordType.A], min_length=1, description="解析类型")
+    urls: list[HttpUrl] = Field(["https://1.1.1.1/dns-query"], min_length=1, description="对比的 doh 服务列表")
+    method: DoHMethod = Field(DoHMethod.auto, description="查询方式")
+    concurrency: int = Field(32, ge=1, le=256, description="同时进行中的查询数量上限")
+
+
+class DoHResolverResult(BaseModel):
+    status: int | None = Field(None, description=DoHResDescription.Status)
+    answers: list[str] = Field([], description="与解析类型一致的记录, 已排序")
+    latency: float = Field(..., description="耗时, 毫秒, 命中缓存时接近 0")
+    error: str | None = Field(None, description="查询失败的原因")
+
+
+class DoHBatchItem(BaseModel):
+    name: str = Field(..., description=DNSDescription.Name)
+    type: DoHRecordType
+    consistent: bool = Field(..., description="所有查询成功的 doh 服务返回的记录是否一致")
+    resolvers: dict[str, DoHResolverResult] = Field(..., description="以 doh 服务地址为键的查询结果")
+
+
+class DoHBatchRes(BaseModel):
+    items: list[DoHBatchItem]
+    inconsistent: int = Field(..., description="结果不一致的查询数量")
@@ -1,6 +1,18 @@
 from pydantic import BaseModel, Field
 
 
+class SSLCertChainItemSchema(BaseModel):
+    subject: str
+    issuer: str
+    serial_number: str
+    sha256: str
+    not_before: str
+    not_after: str
+    days_to_expire: int
+    is_ca: bool
+    self_signed: bool
+
+
 class SSLCertSchema(BaseModel):
     host: str
     tcp_port: int
@@ -23,7 +35,25 @@ class SSLCertSchema(BaseModel):
     validity_days: int
     valid_days_to_expire: int
     days_left: int | None = Field(None, deprecated=True)
+    chain: list[SSLCertChainItemSchema] = Field(
+        [], description="证书链, 第一张为站点证书, Python 3.13 以下仅包含站点证书"
+    )
 
 
 class SSLCertsResSchema(BaseModel):
     li: list[SSLCertSchema | None]
+
+
+class SSLCertScanResSchema(BaseModel):
+    host: str
+    tcp_port: int
+    cert: SSLCertSchema | None = Field(None)
+    error: str | None = Field(None, description="连接或握手失败的原因")
+    latency: float = Field(..., description="耗时, 毫秒")
+
+
+class SSLCertMonitorResSchema(BaseModel):
+    enable: bool
+    expire_days: int = Field(..., description="剩余有效期低于该天数时推送提醒")
+    last_run_at: float | None = Field(None, description="最近一次扫描的时间戳, 秒")
+    li: list[SSLCertScanResSchema]
@@ -3,7 +3,9 @@ import schemas.notifications.bark as bark_
 import schemas.notifications.gmail as gmail_
 import schemas.notifications.gotify as gotify_
 import schemas.notifications.telegram as telegram_
-from pydantic import BaseModel
+from enum import Enum
+
+from pydantic import BaseModel, Field
 
 
 class PushMessage(BaseModel):
@@ -26,3 +28,44 @@ class PushMessages(BaseModel):
 
 class PushMessagesV3(BaseModel):
     messages: list[PushMessageV3]
+
+
+class PushChannelResult(BaseModel):
+    index: int = Field(..., description="消息在请求中的下标")
+    channel: str = Field(..., description="推送渠道, 例如 bark, telegram.message")
+    ok: bool
+    status_code: int | None = Field(None, description="推送服务返回的状态码")
+    error: str | None = None
+    latency: float = Field(..., description="耗时, 毫秒")
+    retry_after: float | None = Field(None, description="推送服务要求的重试等待时间, 秒")
+
+    @property
+    def retryable(self) -> bool:
+        """网络错误、限流与服务端错误可以重试"""
+        return not self.ok and (self.status_code is None or self.status_code == 429 or self.status_code >= 500)
+
+
+class PushJobStatus(str, Enum):
+    queued = "queued"
+    done = "done"
+    failed = "failed"
+
+
+class PushJobSchema(BaseModel):
+    id: str
+    status: PushJobStatus
+    attempts: int = Field(..., description="已推送的次数")
+    created_at: float
+    updated_at: float
+    next_run_at: float | None = Field(None, description="下次推送的时间")
+    results: list[PushChannelResult] = Field([], description="每个渠道最近一次的推送结果")
+
+
+class PushQueuedRes(BaseModel):
+    ids: list[str] = Field(..., description="任务 id, 与请求中的消息一一对应")
+
+
+class PushQueueStatsRes(BaseModel):
+    queued: int
+    done: int
+    failed: int
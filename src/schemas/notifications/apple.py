@@ -1,6 +1,7 @@
+import hashlib
+import threading
 import time
 from enum import Enum
-from functools import lru_cache
 from typing import Any, Dict
 
 import httpx
@@ -9,6 +10,7 @@ from pydantic import BaseModel, Field
 from schemas.adapter import HttpUrl
 
 APNS_HOST_NAME = "api.push.apple.com"
+APNS_SANDBOX_HOST_NAME = "api.sandbox.push.apple.com"
 
 # https://raw.githubusercontent.com/Finb/bark-server/master/deploy/AuthKey_LH4T9V5U4R_5U8LBRXG3A.p8
 BARK_TOKEN_PRIVATE_KEY = """
@@ -26,7 +28,6 @@ class JWTPayload(BaseModel):
     timestamp: int
 
 
-@lru_cache(maxsize=128)
 def generate_jwt(team_id, token_private_key, auth_key_id) -> JWTPayload:
     jwt_issue_time = int(time.time())
     authentication_token = jwt.encode(
@@ -38,6 +39,41 @@ def generate_jwt(team_id, token_private_key, auth_key_id) -> JWTPayload:
     return JWTPayload(token=authentication_token, timestamp=jwt_issue_time)
 
 
+class APNsTokenManager:
+    """APNs 鉴权 Token 的复用与轮换
+
+    苹果要求 Token 生成间隔不短于 20 分钟, 有效期不超过 60 分钟;
+    同一密钥的 Token 复用 refresh_interval 秒后重新生成, 默认 30 分钟
+    """
+
+    def __init__(self, refresh_interval: float = 1800):
+        self.refresh_interval = refresh_interval
+        self._tokens: dict[tuple[str, str, str], JWTPayload] = {}
+        self._lock = threading.Lock()
+
+    def get_token(self, team_id: str, token_private_key: str, auth_key_id: str) -> str:
+        key = (team_id, auth_key_id, hashlib.sha256(token_private_key.encode()).hexdigest())
+        with self._lock:
+            payload = self._tokens.get(key)
+            if payload is None or time.time() - payload.timestamp >= self.refresh_interval:
+                payload = self._tokens[key] = generate_jwt(team_id, token_private_key, auth_key_id)
+            return payload.token
+
+    def invalidate(self, team_id: str, token_private_key: str, auth_key_id: str):
+        """APNs 返回 ExpiredProviderToken 等鉴权错误时丢弃当前 Token"""
+        key = (team_id, auth_key_id, hashlib.sha256(token_private_key.encode()).hexdigest())
+        with self._lock:
+            self._tokens.pop(key, None)
+
+
+apns_token_manager = APNsTokenManager()
+
+
+class ApplePushEnvironment(str, Enum):
+    production = "production"
+    sandbox = "sandbox"
+
+
 class ApplePushLevel(str, Enum):
     active = "active"
     timeSensitive = "timeSensitive"
@@ -80,6 +116,18 @@ class ApplePushAuthParams(BaseModel):
     auth_key_id: str = Field("LH4T9V5U4R")
     topic: str = Field("me.fin.bark")
     token_private_key: str = Field(BARK_TOKEN_PRIVATE_KEY)
+    environment: ApplePushEnvironment = Field(
+        ApplePushEnvironment.production, description="sandbox 用于开发环境的 App"
+    )
+
+    def get_host(self) -> str:
+        return APNS_SANDBOX_HOST_NAME if self.environment == ApplePushEnvironment.sandbox else APNS_HOST_NAME
+
+    def get_token(self) -> str:
+        return apns_token_manager.get_token(self.team_id, self.token_private_key, self.auth_key_id)
+
+    def invalidate_token(self):
+        apns_token_manager.invalidate(self.team_id, self.token_private_key, self.auth_key_id)
 
 
 class ApplePushMessage(ApplePushExtParams, ApplePushAuthParams):
@@ -93,28 +141,43 @@ class ApplePushMessage(ApplePushExtParams, ApplePushAuthParams):
     """
 
     device_token: str = Field(...)
+    device_tokens: list[str] | None = Field(None, description="同时推送的其他设备, 在同一连接上并发推送")
     aps: AppleAPNSMessage
 
-    def push(self) -> httpx.Response:
-        url = f"https://{APNS_HOST_NAME}/3/device/{self.device_token}"
-        jwt = generate_jwt(self.team_id, self.token_private_key, self.auth_key_id)
-        # 如果有条件，最好改进脚本缓存此 Token。Token 30分钟内复用同一个，每过30分钟重新生成
-        # 苹果文档指明 TOKEN 生成间隔最短20分钟，TOKEN 有效期最长60分钟
-        # 但经我不负责任的简单测试可以短时间内正常生成
-        # 上述内容来自 bark-server 文档
-        if int(time.time()) - jwt.timestamp >= 1800:
-            generate_jwt.cache_clear()
-            jwt = generate_jwt(self.team_id, self.token_private_key, self.auth_key_id)
+    def get_device_tokens(self) -> list[str]:
+        return list(dict.fromkeys([self.device_token, *(self.device_tokens or [])]))
 
+    def get_payload(self) -> dict:
+        ext = ApplePushExtParams(**self.model_dump()).model_dump(exclude_none=True)
+        payload: Dict[str, Any] = {"aps": dict(self.aps.model_dump(exclude_none=True, by_alias=True))}
+        payload.update(ext)
+        return payload
+
+    def get_request(self, device_token: str | None = None) -> tuple[str, dict, dict]:
+        """返回 url, headers 与 payload"""
+        url = f"https://{self.get_host()}/3/device/{device_token or self.device_token}"
         headers = {
             "apns-topic": self.topic,
             "apns-push-type": "alert",
-            "authorization": f"bearer {jwt.token}",
+            "authorization": f"bearer {self.get_token()}",
         }
+        return url, headers, self.get_payload()
 
-        ext = ApplePushExtParams(**self.model_dump()).model_dump(exclude_none=True)
-        payload: Dict[str, Any] = {"aps": dict(self.aps.model_dump(exclude_none=True, by_alias=True))}
-        payload.update(ext)
-        resp = httpx.Client(http2=True).post(url, json=payload, headers=headers)
+    def check_response(self, resp: httpx.Response):
+        if resp.status_code == 403 and "ProviderToken" in resp.text:
+            # ExpiredProviderToken/InvalidProviderToken, 下次推送重新生成 Token
+            self.invalidate_token()
         resp.raise_for_status()
+
+    def push(self) -> httpx.Response:
+        url, headers, payload = self.get_request()
+        with httpx.Client(http2=True) as client:
+            resp = client.post(url, json=payload, headers=headers)
+        self.check_response(resp)
+        return resp
+
+    async def apush(self, client: httpx.AsyncClient, device_token: str | None = None) -> httpx.Response:
+        url, headers, payload = self.get_request(device_token)
+        resp = await client.post(url, json=payload, headers=headers)
+        self.check_response(resp)
         return resp
@@ -37,9 +37,16 @@ class BarkPushMessage(BaseModel):
     url: str | None = Field(None, description="Url that will jump when click notification")
     endpoint: str = Field("https://api.day.app/push", description="服务端请求地址")
 
-    def push(self) -> httpx.Response:
+    def get_payload(self) -> dict:
         payload = self.dict(exclude={"endpoint"})
-        payload = {k: v for k, v in payload.items() if v is not None}
-        resp = httpx.post(self.endpoint, json=payload)
+        return {k: v for k, v in payload.items() if v is not None}
+
+    def push(self) -> httpx.Response:
+        resp = httpx.post(self.endpoint, json=self.get_payload())
+        resp.raise_for_status()
+        return resp
+
+    async def apush(self, client: httpx.AsyncClient) -> httpx.Response:
+        resp = await client.post(self.endpoint, json=self.get_payload())
         resp.raise_for_status()
         return resp
@@ -18,8 +18,10 @@ class GotifyPushMessage(BaseModel):
     detail: GotifyPushMessageDetail
     click_url: str | None = Field(None, description="点击通知后打开的 url")
 
-    def push(self) -> httpx.Response:
-        url = f"https://gotify.19940731.xyz/message?token={self.token}"
+    def get_url(self) -> str:
+        return f"https://gotify.19940731.xyz/message?token={self.token}"
+
+    def get_payload(self) -> dict:
         payload = self.detail.dict()
         if self.click_url:
             if not self.detail.extra:
@@ -27,6 +29,14 @@ class GotifyPushMessage(BaseModel):
             payload.setdefault("extras", {}).setdefault("client::notification", {}).setdefault("click", {}).setdefault(
                 "url", self.click_url
             )
-        res = httpx.post(url, json=payload)
+        return payload
+
+    def push(self) -> httpx.Response:
+        res = httpx.post(self.get_url(), json=self.get_payload())
+        res.raise_for_status()
+        return res
+
+    async def apush(self, client: httpx.AsyncClient) -> httpx.Response:
+        res = await client.post(self.get_url(), json=self.get_payload())
         res.raise_for_status()
         return res
@@ -9,10 +9,16 @@ class TelegramPushMessage(BaseModel):
     chat_id: str
     text: str
 
+    def get_url(self) -> str:
+        return f"https://api.telegram.org/bot{self.bot_id}/sendMessage"
+
     def push(self) -> httpx.Response:
-        url = f"https://api.telegram.org/bot{self.bot_id}/sendMessage"
-        payload = {"chat_id": self.chat_id, "text": self.text}
-        res = httpx.post(url, json=payload)
+        res = httpx.post(self.get_url(), json={"chat_id": self.chat_id, "text": self.text})
+        res.raise_for_status()
+        return res
+
+    async def apush(self, client: httpx.AsyncClient) -> httpx.Response:
+        res = await client.post(self.get_url(), json={"chat_id": self.chat_id, "text": self.text})
         res.raise_for_status()
         return res
 
@@ -45,31 +51,57 @@ class TelegramPushMessageV3(BaseModel):
     def push(self):
         raise NotImplementedError("TelegramPushMessageV3 不支持 push 方法")
 
-    def push_text(self) -> httpx.Response:
-        url = f"https://api.telegram.org/bot{self.bot_id}/sendMessage"
+    def get_text_request(self) -> tuple[str, dict]:
         assert self.message
         payload = {"chat_id": self.chat_id, "text": self.message.text}
         if self.message.parse_mode:
             payload["parse_mode"] = self.message.parse_mode
+        return f"https://api.telegram.org/bot{self.bot_id}/sendMessage", payload
 
+    def get_photo_request(self) -> tuple[str, dict]:
+        assert self.photo
+        payload = {"chat_id": self.chat_id, "photo": self.photo.photo}
+        if self.photo.caption:
+            payload["caption"] = self.photo.caption
+        return f"https://api.telegram.org/bot{self.bot_id}/sendPhoto", payload
+
+    def get_media_request(self) -> tuple[str, dict]:
+        assert self.media
+        payload = {"chat_id": self.chat_id, "media": [x.dict() for x in self.media]}
+        return f"https://api.telegram.org/bot{self.bot_id}/sendMediaGroup", payload
+
+    def push_text(self) -> httpx.Response:
+        url, payload = self.get_text_request()
         res = httpx.post(url, json=payload)
         res.raise_for_status()
         return res
 
     def push_photo(self) -> httpx.Response:
-        url = f"https://api.telegram.org/bot{self.bot_id}/sendPhoto"
-        assert self.photo
-        payload = {"chat_id": self.chat_id, "photo": self.photo.photo}
-        if self.photo.caption:
-            payload["caption"] = self.photo.caption
+        url, payload = self.get_photo_request()
         res = httpx.post(url, json=payload)
         res.raise_for_status()
         return res
 
     def push_media(self) -> httpx.Response:
-        url = f"https://api.telegram.org/bot{self.bot_id}/sendMediaGroup"
-        assert self.media
-        payload = {"chat_id": self.chat_id, "media": [x.dict() for x in self.media]}
+        url, payload = self.get_media_request()
         res = httpx.post(url, json=payload)
         res.raise_for_status()
         return res
+
+    async def apush_text(self, client: httpx.AsyncClient) -> httpx.Response:
+        url, payload = self.get_text_request()
+        res = await client.post(url, json=payload)
+        res.raise_for_status()
+        return res
+
+    async def apush_photo(self, client: httpx.AsyncClient) -> httpx.Response:
+        url, payload = self.get_photo_request()
+        res = await client.post(url, json=payload)
+        res.raise_for_status()
+        return res
+
+    async def apush_media(self, client: httpx.AsyncClient) -> httpx.Response:
+        url, payload = self.get_media_request()
+        res = await client.post(url, json=payload)
+        res.raise_for_status()
+        return res
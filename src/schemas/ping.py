@@ -83,6 +83,7 @@ class PingRes(BaseModel):
     usage: Usage = Field(default_factory=Usage)
     nodeseek: dict | None
     sentry_cache: dict | None
+    dash_remux_cache: dict | None = Field(None, description="dash2mp4 磁盘缓存的命中统计")
 
     @model_validator(mode="after")
     def set_uptime(cls, values):
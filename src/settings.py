@@ -37,6 +37,60 @@ class AppSettings(BaseSettings):
 
     cloud_scraper_verify: bool = True
 
+    # dns
+    ## doh
+    doh_race_resolvers: list[str] = [
+        "https://1.1.1.1/dns-query",
+        "https://8.8.8.8/dns-query",
+        "https://223.5.5.5/dns-query",
+        "https://doh.pub/dns-query",
+        "https://dns.adguard-dns.com/dns-query",
+    ]
+    doh_race_size: int = 3
+
+    # ssl
+    ssl_scan_concurrency: int = 32
+    ssl_scan_connect_timeout: float = 5
+    ssl_scan_handshake_timeout: float = 10
+    ssl_monitor_enable: bool = False
+    ssl_monitor_hosts: list[str] = []
+    ssl_monitor_interval: int = 21600
+    ssl_monitor_expire_days: int = 14
+    ssl_monitor_bark_device_key: str | None = None
+    ssl_monitor_bark_endpoint: str = "https://api.day.app/push"
+    ssl_monitor_telegram_bot_id: str | None = None
+    ssl_monitor_telegram_chat_id: str | None = None
+
+    # convert
+    ## dash
+    ffmpeg_max_concurrency: int = 2
+    ffmpeg_stream_chunk_size: int = 64 * 1024
+    dash_segment_concurrency: int = 8
+    dash_remux_cache_dir: str = "~/.proxy-tool/dash-remux"
+    dash_remux_cache_max_size: int = 1024 * 1024 * 1024
+    ## svg
+    svg_render_max_workers: int = 2
+    svg_render_cache_size: int = 64 * 1024 * 1024
+    svg_cache_max_age: int = 7 * 86400
+
+    # notifications
+    notification_timeout: float = 10
+    notification_provider_concurrency: dict[str, int] = {}
+    ## queue
+    notification_queue_path: str = "~/.proxy-tool/notifications.db"
+    notification_queue_max_attempts: int = 8
+    notification_queue_base_delay: float = 2
+    notification_queue_max_delay: float = 600
+    notification_queue_batch_window: float = 1
+    notification_queue_retention: int = 7 * 86400
+
+    # playwright
+    playwright_headless: bool = True
+    playwright_browser_pool_size: int = 2
+    playwright_browser_max_uses: int = 50
+    playwright_browser_max_queue: int = 16
+    playwright_task_timeout: float = 30
+
     # calander
     ## vlrgg
     ics_fetch_vlrgg_match_time_semaphore: int = 15
@@ -51,6 +105,7 @@ class AppSettings(BaseSettings):
     rss_douyin_user_auto_fetch_wait: int = 600
     rss_douyin_user_auto_fetch_once_wait: int = 10
     rss_douyin_user_history_storage: str = "~/.proxy-tool/rss.douyin.user.history"
+    rss_douyin_user_feeds_storage: str = "~/.proxy-tool/rss.douyin.user.feeds"
     rss_douyin_user_headless: bool = True
 
     model_config = SettingsConfigDict(
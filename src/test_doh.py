@@ -1,7 +1,7 @@
 import pytest
 from fastapi.testclient import TestClient
 from main import app
-from routers.network.dns.doh import _query_doh_json, _query_doh_wireformat
+from utils.network.doh import DoHClient
 
 
 @pytest.fixture(scope="module")
@@ -38,23 +38,27 @@ def _assert_doh_result(data: dict):
 
 
 class TestQueryDohJson:
-    def test_cloudflare_returns_result(self):
-        data = _query_doh_json(CLOUDFLARE_DOH, TEST_DOMAIN)
+    @pytest.mark.asyncio
+    async def test_cloudflare_returns_result(self):
+        data = await DoHClient().query_json(CLOUDFLARE_DOH, TEST_DOMAIN)
         assert data is not None
         _assert_doh_result(data)
 
-    def test_adguard_returns_none(self):
-        data = _query_doh_json(ADGUARD_DOH, TEST_DOMAIN)
+    @pytest.mark.asyncio
+    async def test_adguard_returns_none(self):
+        data = await DoHClient().query_json(ADGUARD_DOH, TEST_DOMAIN)
         assert data is None
 
 
 class TestQueryDohWireformat:
-    def test_cloudflare(self):
-        data = _query_doh_wireformat(CLOUDFLARE_DOH, TEST_DOMAIN)
+    @pytest.mark.asyncio
+    async def test_cloudflare(self):
+        data = await DoHClient().query_wireformat(CLOUDFLARE_DOH, TEST_DOMAIN)
         _assert_doh_result(data)
 
-    def test_adguard(self):
-        data = _query_doh_wireformat(ADGUARD_DOH, TEST_DOMAIN)
+    @pytest.mark.asyncio
+    async def test_adguard(self):
+        data = await DoHClient().query_wireformat(ADGUARD_DOH, TEST_DOMAIN)
         _assert_doh_result(data)
 
 
@@ -108,3 +112,33 @@ class TestDohEndpoint:
         resp = client.get(DOH_ENDPOINT, params={"url": ADGUARD_DOH, "name": TEST_DOMAIN, "method": "auto"})
         assert resp.status_code == 200
         _assert_doh_result(resp.json())
+
+
+class TestDohBatchEndpoint:
+    def test_batch_matrix(self, client: TestClient):
+        resp = client.post(
+            f"{DOH_ENDPOINT}/batch",
+            json={
+                "names": [TEST_DOMAIN, "example.org"],
+                "types": ["A", "AAAA"],
+                "urls": [CLOUDFLARE_DOH, ADGUARD_DOH],
+            },
+        )
+        assert resp.status_code == 200
+        data = resp.json()
+        assert len(data["items"]) == 4
+        item = data["items"][0]
+        assert item["name"] == TEST_DOMAIN
+        assert item["type"] == "A"
+        assert set(item["resolvers"]) == {CLOUDFLARE_DOH, ADGUARD_DOH}
+        assert all(x["error"] is None for x in item["resolvers"].values())
+
+
+class TestDohRaceEndpoint:
+    def test_race(self, client: TestClient):
+        resp = client.get(
+            f"{DOH_ENDPOINT}/race", params={"name": TEST_DOMAIN, "urls": [CLOUDFLARE_DOH, ADGUARD_DOH], "size": 2}
+        )
+        assert resp.status_code == 200
+        assert resp.headers["X-DoH-Resolver"] in (CLOUDFLARE_DOH, ADGUARD_DOH)
+        _assert_doh_result(resp.json())
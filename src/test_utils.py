@@ -1,7 +1,7 @@
 import os
 
 import pytest
-from utils.basic import AsyncSSLClientContext
+from utils.basic import AsyncSSLClientContext, is_etag_matched
 from rssapi.utils.nga import NgaToolkit
 
 
@@ -204,3 +204,13 @@ async def test_nga_emoji_replace():
     data = NgaToolkit.get_smiles()
     smiles = {s.name: s.tag for s in data}
     assert smiles
+
+
+def test_is_etag_matched():
+    etag = '"abc"'
+    assert not is_etag_matched(None, etag)
+    assert not is_etag_matched('"def"', etag)
+    assert is_etag_matched('"abc"', etag)
+    assert is_etag_matched('W/"abc"', etag)
+    assert is_etag_matched('"def", "abc"', etag)
+    assert is_etag_matched("*", etag)
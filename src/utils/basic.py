@@ -26,11 +26,10 @@ import pytz
 from bs4 import BeautifulSoup as Soup
 from bs4 import Tag
 from cryptography import x509
-from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import hashes
 from cryptography.x509.oid import NameOID
 from schemas.adapter import HttpUrl
-from schemas.network.ssl import SSLCertSchema
+from schemas.network.ssl import SSLCertChainItemSchema, SSLCertSchema
 from schemas.rss.telegram import TelegramChannalMessage
 
 logger = logging.getLogger(__file__)
@@ -257,10 +256,62 @@ class CurlParser:
         self.index += step
 
 
+def get_peer_cert_chain(ssl_object: ssl.SSLObject | ssl.SSLSocket) -> list[bytes]:
+    """握手完成后从 SSL 对象读取对端证书链 (DER)
+
+    Python 3.13 起可以取得完整的证书链, 优先使用已验证的链; 更早的版本只能取得站点证书
+    """
+    for name in ("get_verified_chain", "get_unverified_chain"):
+        method = getattr(ssl_object, name, None)
+        if method is None:
+            continue
+        try:
+            chain = [x for x in method() if isinstance(x, bytes)]
+        except (ssl.SSLError, ValueError):
+            continue
+        if chain:
+            return chain
+    leaf = ssl_object.getpeercert(binary_form=True)
+    return [leaf] if leaf else []
+
+
+def describe_certificate(cert: x509.Certificate) -> SSLCertChainItemSchema:
+    now = datetime.now(tz=timezone.utc)
+    not_after = cert.not_valid_after_utc
+    try:
+        is_ca = cert.extensions.get_extension_for_class(x509.BasicConstraints).value.ca
+    except x509.ExtensionNotFound:
+        is_ca = False
+    return SSLCertChainItemSchema(
+        subject=cert.subject.rfc4514_string(),
+        issuer=cert.issuer.rfc4514_string(),
+        serial_number=str(cert.serial_number),
+        sha256=cert.fingerprint(hashes.SHA256()).hex(),
+        not_before=cert.not_valid_before_utc.strftime("%Y-%m-%d"),
+        not_after=not_after.strftime("%Y-%m-%d"),
+        days_to_expire=(not_after - now).days if not_after > now else 0,
+        is_ca=is_ca,
+        self_signed=cert.subject == cert.issuer,
+    )
+
+
 class AsyncSSLClientContext:
-    def __init__(self, host: str, port: int = 443, verify: bool = False):
+    def __init__(
+        self,
+        host: str,
+        port: int = 443,
+        verify: bool = False,
+        *,
+        address: str | None = None,
+        timeout: float | None = None,
+        handshake_timeout: float | None = None,
+    ):
+        """address 为已解析的地址, 不传时使用 host 建立连接; timeout 为建立连接与握手的总超时"""
         self._host = host
         self._port = port
+        self._address = address
+        self._timeout = timeout
+        self._handshake_timeout = handshake_timeout
         self._resolved_ip = None
         self.reader: asyncio.StreamReader | None = None
         self.writer: asyncio.StreamWriter | None = None
@@ -272,12 +323,20 @@ class AsyncSSLClientContext:
             self._ssl_ctx.check_hostname = False
             self._ssl_ctx.verify_mode = ssl.VerifyMode.CERT_NONE
 
-        self._ssl_ctx._msg_callback = self.ssl_msg_callbacl  # type: ignore
-        self._certificate_buf = b""
         self._cert: x509.Certificate | None = None
+        self._chain: list[x509.Certificate] = []
 
     async def __aenter__(self):
-        reader, writer = await asyncio.open_connection(self._host, self._port, ssl=self._ssl_ctx)
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(
+                self._address or self._host,
+                self._port,
+                ssl=self._ssl_ctx,
+                server_hostname=self._host,
+                ssl_handshake_timeout=self._handshake_timeout,
+            ),
+            self._timeout,
+        )
 
         self.reader = reader
         self.writer = writer
@@ -285,12 +344,20 @@ class AsyncSSLClientContext:
         peername = transport.get_extra_info("peername")
         if peername:
             self._resolved_ip = peername[0]
+        ssl_object = transport.get_extra_info("ssl_object")
+        if ssl_object is not None:
+            self._chain = [x509.load_der_x509_certificate(der) for der in get_peer_cert_chain(ssl_object)]
+            self._cert = self._chain[0] if self._chain else None
         return self
 
     async def __aexit__(self, exc_type: type | None, exc_val: BaseException | None, exc_tb: types.TracebackType):
         if self.writer:
             self.writer.close()
-            await self.writer.wait_closed()
+            try:
+                # 部分站点不响应 close_notify, 避免关闭连接时长时间阻塞
+                await asyncio.wait_for(self.writer.wait_closed(), self._handshake_timeout or 5)
+            except (asyncio.TimeoutError, OSError, ssl.SSLError):
+                pass
 
         if exc_val:
             self.exception = (exc_tb, exc_val, exc_tb)
@@ -300,47 +367,10 @@ class AsyncSSLClientContext:
         async with self:
             return self.certificate
 
-    def ssl_msg_callbacl(
-        self,
-        conn: ssl.SSLObject,
-        direction: str,
-        version: ssl.TLSVersion,
-        content_type: ssl._TLSContentType,  # type: ignore
-        msg_type: ssl._TLSMessageType,  # type: ignore
-        data: bytes,
-    ):
-        try:
-            if content_type == ssl._TLSContentType.HANDSHAKE:  # type: ignore
-                # cert_msg_types = (ssl._TLSMessageType.CERTIFICATE, ssl._TLSMessageType.CERTIFICATE_VERIFY)  # type: ignore
-                cert_msg_types = (ssl._TLSMessageType.CERTIFICATE,)  # type: ignore
-                if msg_type in cert_msg_types:
-                    self._certificate_buf += data
-                if direction == "read" and msg_type == ssl._TLSMessageType.FINISHED:  # type: ignore
-                    self.cert = self.certificate_parse(self._certificate_buf)
-
-        except Exception as exp:
-            print(exp)
-
-    def certificate_parse(self, byte_data: bytes) -> x509.Certificate | None:
-        cert_data = None
-        cert = None
-
-        # Find the start of the DER sequence (0x30) which should be followed by length bytes
-        # Looking for 0x30 0x82 which indicates a length > 127 bytes encoded in the next 2 bytes
-        der_start_index = byte_data.find(b"\x30\x82")
-
-        if der_start_index != -1:
-            # Read the two length bytes after 0x30 0x82
-            if der_start_index + 3 < len(byte_data):
-                length_bytes = byte_data[der_start_index + 2 : der_start_index + 4]
-                der_length = (length_bytes[0] << 8) + length_bytes[1]
-                # The total size of the DER structure is 1 (tag 0x30) + 3 (length bytes 0x82 + 2 bytes) + der_length
-                total_der_size = 1 + 3 + der_length
-                # Ensure the extracted slice is within the bounds of the original data
-                if der_start_index + total_der_size <= len(byte_data):
-                    cert_data = byte_data[der_start_index : der_start_index + total_der_size]
-                    self.certificate = x509.load_der_x509_certificate(cert_data, default_backend())
-        return cert
+    @property
+    def chain(self) -> list[SSLCertChainItemSchema]:
+        """证书链中每张证书的信息, 第一张为站点证书"""
+        return [describe_certificate(cert) for cert in self._chain]
 
     @property
     def certificate(self) -> SSLCertSchema | None:
@@ -434,6 +464,7 @@ class AsyncSSLClientContext:
             "validity_days": validity_days,
             "days_left": days_left,
             "valid_days_to_expire": days_left,
+            "chain": self.chain,
         }
         return SSLCertSchema.model_validate(context)
 
@@ -702,3 +733,13 @@ def get_date_string_for_shanghai(ts: int) -> str:
     return cast(
         str, pytz.timezone("Asia/Shanghai").localize(datetime.fromtimestamp(ts)).strftime("%Y-%m-%dT%H:%M:%S%z")
     )
+
+
+def is_etag_matched(if_none_match: str | None, etag: str) -> bool:
+    """判断请求头 If-None-Match 是否命中 etag, 按弱比较处理"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    etag = etag.removeprefix("W/")
+    return any(x.strip().removeprefix("W/") == etag for x in if_none_match.split(","))
@@ -1,6 +1,11 @@
 import collections
+import hashlib
+import logging
+import os
 import random
+import shutil
 import time
+from pathlib import Path
 from typing import Any
 
 import asyncache
@@ -8,6 +13,8 @@ from cachetools import Cache, _TimedCache
 
 cached = asyncache.cached
 
+logger = logging.getLogger(__file__)
+
 
 class RandomTTLCache(_TimedCache):
     """LRU Cache implementation with per-item random time-to-live (TTL) value."""
@@ -146,3 +153,72 @@ class RandomTTLCache(_TimedCache):
         value = self.__links[key]
         self.__links.move_to_end(key)
         return value
+
+
+class DiskLRUCache:
+    """磁盘文件缓存, 总大小超出上限时按最近访问时间淘汰
+
+    文件名为 key 的 sha256, 访问时间记录在文件的 mtime 中, 重启后从目录恢复索引
+    """
+
+    def __init__(self, directory: str | Path, max_size: int, suffix: str = ""):
+        self.directory = Path(directory).expanduser()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size
+        self.suffix = suffix
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._index: collections.OrderedDict[Path, int] = collections.OrderedDict()
+        files = [x for x in self.directory.glob(f"*{suffix}") if x.is_file()]
+        for path in sorted(files, key=lambda x: x.stat().st_mtime):
+            self._index[path] = path.stat().st_size
+
+    @property
+    def size(self) -> int:
+        return sum(self._index.values())
+
+    def path_for(self, key: str) -> Path:
+        return self.directory / f"{hashlib.sha256(key.encode()).hexdigest()}{self.suffix}"
+
+    def get(self, key: str) -> Path | None:
+        path = self.path_for(key)
+        if path not in self._index or not path.exists():
+            self._index.pop(path, None)
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._index.move_to_end(path)
+        os.utime(path)
+        return path
+
+    def put(self, key: str, src: str | Path) -> Path:
+        """将文件移动到缓存目录, 返回缓存后的路径"""
+        path = self.path_for(key)
+        shutil.move(str(src), path)
+        self._index[path] = path.stat().st_size
+        self._index.move_to_end(path)
+        self.evict(keep=path)
+        return path
+
+    def evict(self, keep: Path | None = None):
+        total = self.size
+        for path in list(self._index):
+            if total <= self.max_size:
+                break
+            if path == keep:
+                continue
+            total -= self._index.pop(path)
+            path.unlink(missing_ok=True)
+            self.evictions += 1
+            logger.debug(f"[DiskLRUCache] evict {path}")
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "count": len(self._index),
+            "size": self.size,
+            "max_size": self.max_size,
+        }
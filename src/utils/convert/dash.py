@@ -0,0 +1,367 @@
+import asyncio
+import hashlib
+import itertools
+import logging
+import math
+import os
+import re
+from collections import deque
+from collections.abc import AsyncGenerator, AsyncIterator, Iterable, Sequence
+from dataclasses import dataclass, field
+from typing import cast
+from urllib.parse import urljoin
+from xml.etree import ElementTree
+
+import httpx
+
+logger = logging.getLogger(__file__)
+
+
+MPD_NS = {"mpd": "urn:mpeg:dash:schema:mpd:2011"}
+ISO_DURATION_PATTERN = re.compile(
+    r"^P(?:(?P<days>\d+(?:\.\d+)?)D)?"
+    r"(?:T(?:(?P<hours>\d+(?:\.\d+)?)H)?(?:(?P<minutes>\d+(?:\.\d+)?)M)?(?:(?P<seconds>\d+(?:\.\d+)?)S)?)?$"
+)
+TEMPLATE_PATTERN = re.compile(r"\$(RepresentationID|Number|Bandwidth|Time)(?:%0(\d+)d)?\$")
+
+
+@dataclass(frozen=True)
+class DashSegment:
+    url: str
+    byte_range: str | None = None
+
+
+@dataclass
+class DashRepresentation:
+    id: str
+    content_type: str
+    bandwidth: int = 0
+    width: int | None = None
+    height: int | None = None
+    codecs: str | None = None
+    url: str = ""
+    segments: list[DashSegment] = field(default_factory=list)
+
+    @property
+    def segmented(self) -> bool:
+        return bool(self.segments)
+
+    @property
+    def key(self) -> str:
+        """用于缓存的标识, 分段的 Representation 使用全部分段地址的哈希"""
+        if not self.segmented:
+            return self.url
+        digest = hashlib.sha256("\n".join(f"{x.url}#{x.byte_range or ''}" for x in self.segments).encode())
+        return f"segments:{digest.hexdigest()}"
+
+
+def parse_iso_duration(value: str | None) -> float | None:
+    """解析 MPD 中 ISO 8601 格式的时长, 例如 PT1H2M3.5S"""
+    if not value:
+        return None
+    matched = ISO_DURATION_PATTERN.match(value.strip())
+    if matched is None:
+        return None
+    parts = {k: float(v) for k, v in matched.groupdict().items() if v}
+    return (
+        parts.get("days", 0) * 86400
+        + parts.get("hours", 0) * 3600
+        + parts.get("minutes", 0) * 60
+        + parts.get("seconds", 0)
+    )
+
+
+def fill_template(template: str, representation_id: str, bandwidth: int, number: int = 0, time: int = 0) -> str:
+    values = {"RepresentationID": representation_id, "Number": number, "Bandwidth": bandwidth, "Time": time}
+
+    def replace(matched: re.Match) -> str:
+        value = values[matched.group(1)]
+        width = matched.group(2)
+        return f"{value:0{width}d}" if width and isinstance(value, int) else str(value)
+
+    return TEMPLATE_PATTERN.sub(replace, template).replace("$$", "$")
+
+
+def _join_base_url(base_url: str, element: ElementTree.Element) -> str:
+    base_url_elem = element.find("mpd:BaseURL", MPD_NS)
+    if base_url_elem is None or not base_url_elem.text:
+        return base_url
+    return urljoin(base_url, base_url_elem.text.strip())
+
+
+def _merge_segment_template(*elements: ElementTree.Element) -> tuple[dict[str, str], ElementTree.Element | None]:
+    """合并 AdaptationSet 与 Representation 上的 SegmentTemplate, 后者优先"""
+    attrs: dict[str, str] = {}
+    timeline = None
+    for element in elements:
+        template = element.find("mpd:SegmentTemplate", MPD_NS)
+        if template is None:
+            continue
+        attrs.update(template.attrib)
+        element_timeline = template.find("mpd:SegmentTimeline", MPD_NS)
+        if element_timeline is not None:
+            timeline = element_timeline
+    return attrs, timeline
+
+
+def _template_segments(
+    attrs: dict[str, str],
+    timeline: ElementTree.Element | None,
+    base_url: str,
+    representation_id: str,
+    bandwidth: int,
+    period_duration: float | None,
+) -> list[DashSegment]:
+    media = attrs.get("media")
+    if not media:
+        return []
+    start_number = int(attrs.get("startNumber", "1"))
+    timescale = int(attrs.get("timescale", "1"))
+    segments = []
+    if initialization := attrs.get("initialization"):
+        segments.append(DashSegment(urljoin(base_url, fill_template(initialization, representation_id, bandwidth))))
+
+    def media_url(number: int, time: int = 0) -> DashSegment:
+        return DashSegment(urljoin(base_url, fill_template(media, representation_id, bandwidth, number, time)))
+
+    if timeline is not None:
+        number, current = start_number, 0
+        items = timeline.findall("mpd:S", MPD_NS)
+        for index, item in enumerate(items):
+            current = int(item.get("t") or current)
+            duration = int(item.get("d", "0"))
+            repeat = int(item.get("r", "0"))
+            if repeat < 0:
+                # r 为负数时重复到下一个 S 的开始时间或 Period 结束
+                next_start = int(items[index + 1].get("t", "0")) if index + 1 < len(items) else None
+                if next_start is None and period_duration is not None:
+                    next_start = int(period_duration * timescale)
+                repeat = math.ceil((next_start - current) / duration) - 1 if next_start and duration else 0
+            for _ in range(repeat + 1):
+                segments.append(media_url(number, current))
+                number += 1
+                current += duration
+        return segments
+
+    duration = int(attrs.get("duration", "0"))
+    if not duration or period_duration is None:
+        return []
+    count = math.ceil(period_duration * timescale / duration)
+    segments.extend(media_url(number) for number in range(start_number, start_number + count))
+    return segments
+
+
+def _list_segments(element: ElementTree.Element, base_url: str) -> list[DashSegment]:
+    segment_list = element.find("mpd:SegmentList", MPD_NS)
+    if segment_list is None:
+        return []
+    segments = []
+    initialization = segment_list.find("mpd:Initialization", MPD_NS)
+    if initialization is not None:
+        url = initialization.get("sourceURL")
+        segments.append(DashSegment(urljoin(base_url, url) if url else base_url, initialization.get("range")))
+    for item in segment_list.findall("mpd:SegmentURL", MPD_NS):
+        url = item.get("media")
+        segments.append(DashSegment(urljoin(base_url, url) if url else base_url, item.get("mediaRange")))
+    return segments
+
+
+def parse_mpd(content: str, mpd_url: str) -> list[DashRepresentation]:
+    """解析 MPD 中第一个 Period 的全部 Representation
+
+    支持 BaseURL 单文件, SegmentTemplate (含 SegmentTimeline) 与 SegmentList
+    """
+    root = ElementTree.fromstring(content)
+    base_url = _join_base_url(mpd_url, root)
+    period = root.find("mpd:Period", MPD_NS)
+    if period is None:
+        return []
+    base_url = _join_base_url(base_url, period)
+    period_duration = parse_iso_duration(period.get("duration")) or parse_iso_duration(
+        root.get("mediaPresentationDuration")
+    )
+
+    representations = []
+    for adaptation_set in period.findall("mpd:AdaptationSet", MPD_NS):
+        adaptation_base_url = _join_base_url(base_url, adaptation_set)
+        for element in adaptation_set.findall("mpd:Representation", MPD_NS):
+            mime_type = element.get("mimeType") or adaptation_set.get("mimeType") or ""
+            content_type = adaptation_set.get("contentType") or mime_type.split("/")[0]
+            representation_id = element.get("id", "")
+            bandwidth = int(element.get("bandwidth", "0"))
+            url = _join_base_url(adaptation_base_url, element)
+            attrs, timeline = _merge_segment_template(adaptation_set, element)
+            segments = _template_segments(attrs, timeline, url, representation_id, bandwidth, period_duration)
+            segments = segments or _list_segments(element, url) or _list_segments(adaptation_set, url)
+            if not segments and element.find("mpd:BaseURL", MPD_NS) is None:
+                # 既没有分段信息也没有 BaseURL, 无法获取
+                continue
+            representations.append(
+                DashRepresentation(
+                    id=representation_id,
+                    content_type=content_type,
+                    bandwidth=bandwidth,
+                    width=int(element.get("width") or adaptation_set.get("width") or 0) or None,
+                    height=int(element.get("height") or adaptation_set.get("height") or 0) or None,
+                    codecs=element.get("codecs") or adaptation_set.get("codecs"),
+                    url=url,
+                    segments=segments,
+                )
+            )
+    return representations
+
+
+def select_representation(
+    representations: Iterable[DashRepresentation],
+    content_type: str,
+    *,
+    max_bandwidth: int | None = None,
+    max_height: int | None = None,
+) -> DashRepresentation | None:
+    """选择满足带宽与高度上限的最高带宽 Representation, 均不满足时选择带宽最低的"""
+    candidates = [x for x in representations if x.content_type == content_type]
+    if not candidates:
+        return None
+    allowed = [
+        x
+        for x in candidates
+        if (max_bandwidth is None or x.bandwidth <= max_bandwidth)
+        and (max_height is None or x.height is None or x.height <= max_height)
+    ]
+    if allowed:
+        return max(allowed, key=lambda x: x.bandwidth)
+    return min(candidates, key=lambda x: x.bandwidth)
+
+
+async def iter_segments(
+    client: httpx.AsyncClient, segments: Sequence[DashSegment], *, concurrency: int = 8
+) -> AsyncIterator[bytes]:
+    """并发获取分段并按顺序返回, 同时进行中的请求与缓存的分段均不超过 concurrency 个"""
+
+    async def fetch(segment: DashSegment) -> bytes:
+        headers = {"Range": f"bytes={segment.byte_range}"} if segment.byte_range else None
+        resp = await client.get(segment.url, headers=headers)
+        resp.raise_for_status()
+        return resp.content
+
+    remaining = iter(segments)
+    pending: deque[asyncio.Task[bytes]] = deque(
+        asyncio.create_task(fetch(x)) for x in itertools.islice(remaining, concurrency)
+    )
+    try:
+        while pending:
+            content = await pending.popleft()
+            if (segment := next(remaining, None)) is not None:
+                pending.append(asyncio.create_task(fetch(segment)))
+            yield content
+    finally:
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+
+async def _feed_pipe(fd: int, chunks: AsyncIterator[bytes]):
+    loop = asyncio.get_running_loop()
+    pipe = os.fdopen(fd, "wb", buffering=0)
+    try:
+        transport, protocol = await loop.connect_write_pipe(
+            asyncio.streams.FlowControlMixin,  # type: ignore[attr-defined]
+            pipe,
+        )
+    except BaseException:
+        pipe.close()
+        raise
+    writer = asyncio.StreamWriter(transport, protocol, None, loop)
+    try:
+        async for chunk in chunks:
+            writer.write(chunk)
+            await writer.drain()
+    except (BrokenPipeError, ConnectionResetError):
+        logger.debug(f"[DashInputs] reader closed pipe {fd}")
+    finally:
+        writer.close()
+
+
+class DashInputs:
+    """为 ffmpeg 准备输入
+
+    单文件的 Representation 直接使用地址, 由 ffmpeg 自行下载;
+    分段的 Representation 由本进程并发下载后按顺序写入管道, ffmpeg 以 pipe:N 读取, 需要通过 pass_fds 传给子进程
+    """
+
+    def __init__(self, client: httpx.AsyncClient, representations: Sequence[DashRepresentation], concurrency: int = 8):
+        self._client = client
+        self._representations = representations
+        self._concurrency = concurrency
+        self.urls: list[str] = []
+        self.pass_fds: list[int] = []
+        self._tasks: list[asyncio.Task] = []
+
+    async def __aenter__(self) -> "DashInputs":
+        self._failure: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        for representation in self._representations:
+            if not representation.segmented:
+                self.urls.append(representation.url)
+                continue
+            read_fd, write_fd = os.pipe()
+            self.pass_fds.append(read_fd)
+            self.urls.append(f"pipe:{read_fd}")
+            chunks = iter_segments(self._client, representation.segments, concurrency=self._concurrency)
+            task = asyncio.create_task(_feed_pipe(write_fd, chunks), name=f"dash:{representation.id}")
+            task.add_done_callback(self._on_feeder_done)
+            self._tasks.append(task)
+        return self
+
+    def _on_feeder_done(self, task: asyncio.Task):
+        if task.cancelled() or task.exception() is None:
+            return
+        logger.error(f"[DashInputs] {task.get_name()} failed: {task.exception()!r}")
+        if not self._failure.done():
+            self._failure.set_exception(cast(BaseException, task.exception()))
+
+    async def guard(self, chunks: AsyncIterator[bytes]) -> AsyncGenerator[bytes, None]:
+        """转发 ffmpeg 的输出, 分段下载失败时立即抛出异常, 不等待 ffmpeg 把截断的输入处理完"""
+        while True:
+            next_chunk = asyncio.ensure_future(anext(chunks))
+            waiters: set[asyncio.Future] = {next_chunk, self._failure}
+            await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+            if self._failure.done():
+                next_chunk.cancel()
+                await asyncio.gather(next_chunk, return_exceptions=True)
+                self._failure.result()
+            try:
+                chunk = next_chunk.result()
+            except StopAsyncIteration:
+                return
+            yield chunk
+
+    async def __aexit__(self, exc_type, exc, tb):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        fds, self.pass_fds = self.pass_fds, []
+        for fd in fds:
+            os.close(fd)
+        # 分段下载失败时管道同样以 EOF 结束, ffmpeg 会正常退出并输出截断的文件, 需要向调用方抛出异常
+        if not self._failure.done():
+            self._failure.cancel()
+        elif (error := self._failure.exception()) is not None and exc_type is None:
+            raise error
+
+
+_dash_client: httpx.AsyncClient | None = None
+
+
+def get_dash_client() -> httpx.AsyncClient:
+    """获取 MPD 与分段使用的共享连接池"""
+    global _dash_client
+    if _dash_client is None or _dash_client.is_closed:
+        _dash_client = httpx.AsyncClient(follow_redirects=True, timeout=30)
+    return _dash_client
+
+
+async def close_dash_client():
+    global _dash_client
+    if _dash_client is not None:
+        await _dash_client.aclose()
+        _dash_client = None
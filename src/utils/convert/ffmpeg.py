@@ -0,0 +1,187 @@
+import asyncio
+import logging
+import time
+from collections.abc import AsyncIterator, Awaitable, Callable, Sequence
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any
+
+logger = logging.getLogger(__file__)
+
+
+class FFmpegJobState:
+    queued = "queued"
+    running = "running"
+    done = "done"
+
+
+@dataclass(eq=False)
+class FFmpegJob:
+    key: str
+    cleanup: Callable[[Any], None] | None = None
+    state: str = FFmpegJobState.queued
+    created_at: float = field(default_factory=time.time)
+    waiters: int = 0
+    task: "asyncio.Task[Any]" = field(init=False)
+
+    @property
+    def failed(self) -> bool:
+        return self.task.done() and (self.task.cancelled() or self.task.exception() is not None)
+
+
+class FFmpegJobManager:
+    """ffmpeg 任务调度
+
+    - 全局并发上限, 超出的任务排队并可查询排队位置
+    - 相同 key 的任务只执行一次, 所有等待者共享结果
+    - 所有等待者都离开后取消未完成的任务, 结果在最后一个等待者释放后清理
+    """
+
+    def __init__(self, max_concurrency: int = 2):
+        self.max_concurrency = max_concurrency
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._queue: list[object] = []
+        self._jobs: dict[str, FFmpegJob] = {}
+
+    @asynccontextmanager
+    async def slot(self, token: object | None = None) -> AsyncIterator[None]:
+        """占用一个并发名额, 用于无法共享输出的任务"""
+        token = token or object()
+        if token not in self._queue:
+            self._queue.append(token)
+        try:
+            async with self._semaphore:
+                self._queue.remove(token)
+                yield
+        finally:
+            if token in self._queue:
+                self._queue.remove(token)
+
+    async def _run(self, job: FFmpegJob, factory: Callable[[], Awaitable[Any]]) -> Any:
+        async with self.slot(job):
+            job.state = FFmpegJobState.running
+            start = time.monotonic()
+            try:
+                return await factory()
+            finally:
+                job.state = FFmpegJobState.done
+                logger.info(f"[FFmpegJobManager] job {job.key} finished in {time.monotonic() - start:.2f}s")
+
+    def acquire(
+        self, key: str, factory: Callable[[], Awaitable[Any]], *, cleanup: Callable[[Any], None] | None = None
+    ) -> FFmpegJob:
+        """加入已有的同 key 任务或创建新任务, 每次调用都必须对应一次 release"""
+        job = self._jobs.get(key)
+        if job is None or job.failed:
+            job = FFmpegJob(key=key, cleanup=cleanup)
+            job.task = asyncio.create_task(self._run(job, factory), name=f"ffmpeg:{key}")
+            self._jobs[key] = job
+            self._queue.append(job)
+        job.waiters += 1
+        return job
+
+    def release(self, job: FFmpegJob):
+        job.waiters -= 1
+        if job.waiters > 0:
+            return
+        if self._jobs.get(job.key) is job:
+            del self._jobs[job.key]
+        if not job.task.done():
+            logger.info(f"[FFmpegJobManager] all waiters left, cancel job {job.key}")
+            job.task.cancel()
+            # 尚未开始执行的任务被取消时不会进入 slot 的 finally
+            if job in self._queue:
+                self._queue.remove(job)
+        elif job.cleanup and not job.failed:
+            job.cleanup(job.task.result())
+
+    async def wait(
+        self, job: FFmpegJob, *, disconnected: Callable[[], Awaitable[bool]] | None = None, interval: float = 1
+    ) -> Any:
+        """等待任务完成; disconnected 返回 True 时抛出 ConnectionAbortedError, 调用方仍需 release"""
+        while True:
+            done, _ = await asyncio.wait({job.task}, timeout=interval if disconnected else None)
+            if done:
+                return job.task.result()
+            if disconnected and await disconnected():
+                raise ConnectionAbortedError(f"client disconnected while waiting for {job.key}")
+
+    def position(self, job: FFmpegJob) -> int:
+        """排队位置, 从 1 开始, 0 表示正在执行或已完成"""
+        if job in self._queue:
+            return self._queue.index(job) + 1
+        return 0
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "queued": len(self._queue),
+            "jobs": [
+                {
+                    "key": job.key,
+                    "state": job.state,
+                    "position": self.position(job),
+                    "waiters": job.waiters,
+                    "created_at": job.created_at,
+                }
+                for job in self._jobs.values()
+            ],
+        }
+
+
+STDERR_TAIL_SIZE = 64 * 1024
+
+
+async def _drain(stream: asyncio.StreamReader, tail: bytearray, chunk_size: int = 64 * 1024):
+    """持续读取输出直到 EOF, 只保留最后 STDERR_TAIL_SIZE 字节, 避免管道写满阻塞子进程
+
+    按块读取而不是按行读取, 超长的行不会中断读取
+    """
+    try:
+        while chunk := await stream.read(chunk_size):
+            tail += chunk
+            del tail[:-STDERR_TAIL_SIZE]
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.exception(f"drain stderr failed: {e}")
+        raise
+
+
+async def iter_process_stdout(
+    args: Sequence[str], chunk_size: int = 64 * 1024, *, pass_fds: Sequence[int] = ()
+) -> AsyncIterator[bytes]:
+    """以非阻塞管道运行子进程并逐块返回 stdout
+
+    stderr 在后台并发读取; 迭代提前结束或被取消 (例如客户端断开) 时结束子进程
+    """
+    start = time.monotonic()
+    process = await asyncio.create_subprocess_exec(
+        *args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE, pass_fds=pass_fds
+    )
+    assert process.stdout is not None and process.stderr is not None
+    stderr_tail = bytearray()
+    drain_task = asyncio.create_task(_drain(process.stderr, stderr_tail))
+    size = 0
+    completed = False
+    try:
+        while chunk := await process.stdout.read(chunk_size):
+            size += len(chunk)
+            yield chunk
+        completed = True
+    finally:
+        if not completed and process.returncode is None:
+            try:
+                process.kill()
+            except ProcessLookupError:
+                pass
+        await process.wait()
+        await asyncio.wait({drain_task}, timeout=1)
+        drain_task.cancel()
+        await asyncio.gather(drain_task, return_exceptions=True)
+        logger.info(
+            f"process {args[0]} streamed {size} bytes in {time.monotonic() - start:.2f}s, "
+            f"returncode={process.returncode}, completed={completed}"
+        )
+        if completed and process.returncode != 0:
+            logger.error(f"process error: {stderr_tail.decode(errors='replace')}")
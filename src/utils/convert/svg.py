@@ -0,0 +1,123 @@
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+from collections.abc import Callable
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import cast
+
+import httpx
+from cachetools import LRUCache, TTLCache
+
+logger = logging.getLogger(__file__)
+
+
+SvgRenderKey = tuple[str, int | None, int | None, float]
+
+
+def render_svg_to_png(svg: bytes, width: int | None = None, height: int | None = None, scale: float = 1) -> bytes:
+    """在工作进程中执行的栅格化"""
+    import cairosvg
+
+    png = cairosvg.svg2png(bytestring=svg, output_width=width, output_height=height, scale=scale)
+    if not isinstance(png, bytes):
+        raise ValueError("Format conversion failed.")
+    return png
+
+
+class SvgRenderer:
+    """SVG 转 PNG
+
+    - 通过共享的异步客户端获取 SVG, 按 URL 短期缓存源文件
+    - 栅格化在有上限的进程池中执行, 不阻塞事件循环
+    - 渲染结果按 (SVG 内容哈希, 尺寸) 缓存在按字节数限制大小的 LRU 中, 相同的并发请求只渲染一次
+    """
+
+    def __init__(
+        self,
+        *,
+        max_workers: int = 2,
+        cache_size: int = 64 * 1024 * 1024,
+        source_ttl: float = 3600,
+        max_svg_size: int = 5 * 1024 * 1024,
+        executor: Executor | None = None,
+        render: Callable[[bytes, int | None, int | None, float], bytes] = render_svg_to_png,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ):
+        self._max_workers = max_workers
+        self._executor = executor
+        self._render = render
+        self._max_svg_size = max_svg_size
+        self._transport = transport
+        self._client: httpx.AsyncClient | None = None
+        self._sources: TTLCache = TTLCache(1024, source_ttl)
+        self._cache: LRUCache = LRUCache(cache_size, getsizeof=len)
+        self._pending: dict[SvgRenderKey, asyncio.Future[bytes]] = {}
+
+    def get_executor(self) -> Executor:
+        if self._executor is None:
+            # 服务进程中存在多个线程, 使用 spawn 避免 fork 带来的锁状态问题
+            self._executor = ProcessPoolExecutor(self._max_workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._executor
+
+    def get_client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(follow_redirects=True, timeout=30, transport=self._transport)
+        return self._client
+
+    async def fetch(self, url: str) -> bytes:
+        cached_value = self._sources.get(url)
+        if cached_value is not None:
+            return cast(bytes, cached_value)
+        resp = await self.get_client().get(url)
+        resp.raise_for_status()
+        if len(resp.content) > self._max_svg_size:
+            raise ValueError(f"SVG is too large: {len(resp.content)} bytes")
+        self._sources[url] = resp.content
+        return resp.content
+
+    async def render(
+        self, svg: bytes, width: int | None = None, height: int | None = None, scale: float = 1
+    ) -> tuple[SvgRenderKey, bytes]:
+        """返回缓存键与 PNG 内容"""
+        key: SvgRenderKey = (hashlib.sha256(svg).hexdigest(), width, height, scale)
+        cached_value = self._cache.get(key)
+        if cached_value is not None:
+            return key, cast(bytes, cached_value)
+
+        future = self._pending.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self._pending[key] = asyncio.ensure_future(
+                loop.run_in_executor(self.get_executor(), self._render, svg, width, height, scale)
+            )
+            future.add_done_callback(lambda _: self._pending.pop(key, None))
+        png = await asyncio.shield(future)
+        if len(png) <= cast(int, self._cache.maxsize):
+            self._cache[key] = png
+        return key, png
+
+    async def render_url(
+        self, url: str, width: int | None = None, height: int | None = None, scale: float = 1
+    ) -> tuple[SvgRenderKey, bytes]:
+        return await self.render(await self.fetch(url), width, height, scale)
+
+    def stats(self) -> dict:
+        return {
+            "count": len(self._cache),
+            "size": self._cache.currsize,
+            "max_size": self._cache.maxsize,
+            "pending": len(self._pending),
+        }
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+def get_svg_etag(key: SvgRenderKey) -> str:
+    return f'"{hashlib.sha256(repr(key).encode()).hexdigest()[:32]}"'
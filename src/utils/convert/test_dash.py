@@ -0,0 +1,219 @@
+import asyncio
+import random
+import sys
+
+import httpx
+import pytest
+from utils.convert.dash import (
+    DashInputs,
+    DashRepresentation,
+    DashSegment,
+    fill_template,
+    iter_segments,
+    parse_iso_duration,
+    parse_mpd,
+    select_representation,
+)
+from utils.convert.ffmpeg import iter_process_stdout
+
+MPD_URL = "https://cdn.example.com/video/manifest.mpd"
+
+TEMPLATE_MPD = """<?xml version="1.0"?>
+<MPD xmlns="urn:mpeg:dash:schema:mpd:2011" mediaPresentationDuration="PT10S">
+  <Period>
+    <AdaptationSet contentType="video" mimeType="video/mp4">
+      <SegmentTemplate timescale="1000" initialization="$RepresentationID$/init.mp4"
+                       media="$RepresentationID$/$Number%05d$-$Time$.m4s" startNumber="1">
+        <SegmentTimeline>
+          <S t="0" d="4000" r="1"/>
+          <S d="2000"/>
+        </SegmentTimeline>
+      </SegmentTemplate>
+      <Representation id="1080p" bandwidth="5000000" width="1920" height="1080"/>
+      <Representation id="720p" bandwidth="2500000" width="1280" height="720"/>
+      <Representation id="360p" bandwidth="800000" width="640" height="360"/>
+    </AdaptationSet>
+    <AdaptationSet mimeType="audio/mp4">
+      <Representation id="audio" bandwidth="128000">
+        <SegmentTemplate duration="4" initialization="audio/init.mp4" media="audio/$Number$.m4s"/>
+      </Representation>
+    </AdaptationSet>
+  </Period>
+</MPD>
+"""
+
+LIST_MPD = """<?xml version="1.0"?>
+<MPD xmlns="urn:mpeg:dash:schema:mpd:2011">
+  <BaseURL>https://media.example.com/</BaseURL>
+  <Period duration="PT1M">
+    <AdaptationSet contentType="video">
+      <Representation id="v" bandwidth="1000">
+        <BaseURL>v/</BaseURL>
+        <SegmentList>
+          <Initialization sourceURL="init.mp4"/>
+          <SegmentURL media="1.m4s"/>
+          <SegmentURL mediaRange="100-199"/>
+        </SegmentList>
+      </Representation>
+    </AdaptationSet>
+    <AdaptationSet contentType="audio">
+      <Representation id="a" bandwidth="64000">
+        <BaseURL>audio.m4a</BaseURL>
+      </Representation>
+    </AdaptationSet>
+  </Period>
+</MPD>
+"""
+
+
+def test_parse_iso_duration():
+    assert parse_iso_duration("PT1H2M3.5S") == 3723.5
+    assert parse_iso_duration("P1DT1S") == 86401
+    assert parse_iso_duration("invalid") is None
+
+
+def test_fill_template():
+    assert fill_template("$RepresentationID$/$Number%03d$.m4s", "v1", 100, number=7) == "v1/007.m4s"
+    assert fill_template("$Bandwidth$-$Time$-$$.m4s", "v1", 100, time=42) == "100-42-$.m4s"
+
+
+def test_parse_mpd_segment_template():
+    representations = parse_mpd(TEMPLATE_MPD, MPD_URL)
+    assert [x.id for x in representations] == ["1080p", "720p", "360p", "audio"]
+
+    video = representations[1]
+    assert video.content_type == "video" and video.height == 720
+    assert [x.url for x in video.segments] == [
+        "https://cdn.example.com/video/720p/init.mp4",
+        "https://cdn.example.com/video/720p/00001-0.m4s",
+        "https://cdn.example.com/video/720p/00002-4000.m4s",
+        "https://cdn.example.com/video/720p/00003-8000.m4s",
+    ]
+
+    audio = representations[3]
+    assert audio.content_type == "audio"
+    assert [x.url.rsplit("/", 1)[1] for x in audio.segments] == ["init.mp4", "1.m4s", "2.m4s", "3.m4s"]
+    assert video.key != representations[0].key
+
+
+def test_parse_mpd_segment_list_and_base_url():
+    video, audio = parse_mpd(LIST_MPD, MPD_URL)
+    assert video.segments == [
+        DashSegment("https://media.example.com/v/init.mp4"),
+        DashSegment("https://media.example.com/v/1.m4s"),
+        DashSegment("https://media.example.com/v/", "100-199"),
+    ]
+    assert not audio.segmented
+    assert audio.key == audio.url == "https://media.example.com/audio.m4a"
+
+
+def test_select_representation():
+    representations = parse_mpd(TEMPLATE_MPD, MPD_URL)
+    assert select_representation(representations, "video").id == "1080p"  # type: ignore[union-attr]
+    assert select_representation(representations, "video", max_height=720).id == "720p"  # type: ignore[union-attr]
+    assert select_representation(representations, "video", max_bandwidth=1000000).id == "360p"  # type: ignore[union-attr]
+    # 均不满足时选择带宽最低的
+    assert select_representation(representations, "video", max_height=100).id == "360p"  # type: ignore[union-attr]
+    assert select_representation(representations, "text") is None
+
+
+def make_segment_transport(active: list[int], peak: list[int]) -> httpx.MockTransport:
+    async def handler(request: httpx.Request) -> httpx.Response:
+        active[0] += 1
+        peak[0] = max(peak[0], active[0])
+        await asyncio.sleep(random.uniform(0, 0.02))
+        active[0] -= 1
+        if request.url.path == "/missing":
+            return httpx.Response(404)
+        if "range" in request.headers:
+            return httpx.Response(206, content=request.headers["range"].encode())
+        return httpx.Response(200, content=request.url.path.encode())
+
+    return httpx.MockTransport(handler)
+
+
+@pytest.mark.asyncio
+async def test_iter_segments_ordered_and_bounded():
+    active, peak = [0], [0]
+    segments = [DashSegment(f"https://cdn.example.com/{i}") for i in range(50)]
+    segments.append(DashSegment("https://cdn.example.com/range", "0-99"))
+    async with httpx.AsyncClient(transport=make_segment_transport(active, peak)) as client:
+        chunks = [x async for x in iter_segments(client, segments, concurrency=4)]
+        assert chunks == [f"/{i}".encode() for i in range(50)] + [b"bytes=0-99"]
+        assert peak[0] <= 4
+
+        with pytest.raises(httpx.HTTPStatusError):
+            async for _ in iter_segments(client, [DashSegment("https://cdn.example.com/missing")]):
+                pass
+
+
+@pytest.mark.asyncio
+async def test_dash_inputs_pipe_to_process():
+    """分段按顺序写入管道, 子进程以 pipe:N 读取, 单文件的 Representation 直接传递地址"""
+    active, peak = [0], [0]
+    segmented = DashRepresentation(
+        "v", "video", segments=[DashSegment(f"https://cdn.example.com/{i}") for i in range(20)]
+    )
+    single = DashRepresentation("a", "audio", url="https://cdn.example.com/audio.m4a")
+    script = (
+        "import os, sys\n"
+        "fd = int(sys.argv[1].split(':')[1])\n"
+        "while chunk := os.read(fd, 4096):\n"
+        "    sys.stdout.buffer.write(chunk)\n"
+        "sys.stdout.buffer.write(sys.argv[2].encode())\n"
+    )
+    async with httpx.AsyncClient(transport=make_segment_transport(active, peak)) as client:
+        async with DashInputs(client, [segmented, single], concurrency=4) as inputs:
+            assert inputs.urls[0] == f"pipe:{inputs.pass_fds[0]}"
+            assert inputs.urls[1] == single.url
+            args = [sys.executable, "-c", script, *inputs.urls]
+            output = b"".join([x async for x in iter_process_stdout(args, pass_fds=inputs.pass_fds)])
+    assert output == b"".join(f"/{i}".encode() for i in range(20)) + single.url.encode()
+
+
+@pytest.mark.asyncio
+async def test_dash_inputs_segment_failure():
+    """分段下载失败时 ffmpeg 只会读到 EOF, 退出上下文时需要抛出下载错误"""
+    active, peak = [0], [0]
+    segments = [DashSegment(f"https://cdn.example.com/{i}") for i in range(5)]
+    segments.insert(3, DashSegment("https://cdn.example.com/missing"))
+    representation = DashRepresentation("v", "video", segments=segments)
+    script = "import os, sys\nfd = int(sys.argv[1].split(':')[1])\nwhile chunk := os.read(fd, 4096):\n    pass\n"
+    async with httpx.AsyncClient(transport=make_segment_transport(active, peak)) as client:
+        with pytest.raises(httpx.HTTPStatusError):
+            async with DashInputs(client, [representation], concurrency=2) as inputs:
+                args = [sys.executable, "-c", script, *inputs.urls]
+                # 读取方正常退出, 与截断的输出无法区分
+                assert [x async for x in iter_process_stdout(args, pass_fds=inputs.pass_fds)] == []
+
+
+@pytest.mark.asyncio
+async def test_dash_inputs_guard_kills_process():
+    active, peak = [0], [0]
+    representation = DashRepresentation(
+        "v",
+        "video",
+        segments=[DashSegment("https://cdn.example.com/0"), DashSegment("https://cdn.example.com/missing")],
+    )
+    # 读完管道后继续输出, 模拟仍在处理另一路输入的 ffmpeg
+    script = (
+        "import os, sys, time\n"
+        "fd = int(sys.argv[1].split(':')[1])\n"
+        "while chunk := os.read(fd, 4096):\n"
+        "    pass\n"
+        "while True:\n"
+        "    sys.stdout.buffer.write(b'x' * 1024)\n"
+        "    sys.stdout.buffer.flush()\n"
+        "    time.sleep(0.01)\n"
+    )
+    async with httpx.AsyncClient(transport=make_segment_transport(active, peak)) as client:
+        with pytest.raises(httpx.HTTPStatusError):
+            async with DashInputs(client, [representation]) as inputs:
+                args = [sys.executable, "-c", script, *inputs.urls]
+                chunks = iter_process_stdout(args, pass_fds=inputs.pass_fds)
+
+                async def consume():
+                    async for _ in inputs.guard(chunks):
+                        pass
+
+                await asyncio.wait_for(consume(), 5)
@@ -0,0 +1,115 @@
+import asyncio
+import sys
+import threading
+import time
+
+import pytest
+from utils.convert.ffmpeg import FFmpegJobManager, FFmpegJobState, iter_process_stdout
+
+
+@pytest.mark.asyncio
+async def test_ffmpeg_job_manager_single_flight():
+    manager = FFmpegJobManager(max_concurrency=1)
+    calls = []
+    cleaned = []
+    release = asyncio.Event()
+
+    async def factory(key: str) -> str:
+        calls.append(key)
+        await release.wait()
+        return f"{key}.mp4"
+
+    a1 = manager.acquire("a", lambda: factory("a"), cleanup=cleaned.append)
+    a2 = manager.acquire("a", lambda: factory("a"), cleanup=cleaned.append)
+    b = manager.acquire("b", lambda: factory("b"))
+    assert a1 is a2
+    assert manager.position(a1) == 1 and manager.position(b) == 2
+
+    await asyncio.sleep(0)
+    assert a1.state == FFmpegJobState.running
+    assert manager.position(a1) == 0 and manager.position(b) == 1
+
+    release.set()
+    assert await asyncio.gather(manager.wait(a1), manager.wait(a2)) == ["a.mp4", "a.mp4"]
+    assert await manager.wait(b) == "b.mp4"
+    assert calls == ["a", "b"]
+
+    manager.release(a1)
+    assert cleaned == []
+    manager.release(a2)
+    manager.release(b)
+    assert cleaned == ["a.mp4"]
+    assert manager.stats()["jobs"] == []
+
+
+@pytest.mark.asyncio
+async def test_ffmpeg_job_manager_cancel_when_all_waiters_leave():
+    manager = FFmpegJobManager(max_concurrency=1)
+    cancelled = asyncio.Event()
+
+    async def factory():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    running = manager.acquire("running", factory)
+    queued = manager.acquire("queued", factory)
+    await asyncio.sleep(0)
+
+    disconnected = False
+
+    async def is_disconnected() -> bool:
+        return bool(disconnected)
+
+    waiter = asyncio.create_task(manager.wait(running, disconnected=is_disconnected, interval=0.01))
+    disconnected = True
+    with pytest.raises(ConnectionAbortedError):
+        await waiter
+    manager.release(running)
+    manager.release(queued)
+
+    await asyncio.wait_for(cancelled.wait(), 1)
+    assert running.task.cancelled() or running.task.done()
+    stats = manager.stats()
+    assert stats["queued"] == 0 and stats["jobs"] == []
+
+
+@pytest.mark.asyncio
+async def test_iter_process_stdout_drains_stderr():
+    # stderr 输出远超管道缓冲区, 未并发读取时子进程会阻塞
+    script = "import sys; sys.stderr.write('x' * 1024 * 1024); sys.stdout.write('y' * 100000)"
+    chunks = [x async for x in iter_process_stdout([sys.executable, "-c", script], chunk_size=4096)]
+    assert sum(len(x) for x in chunks) == 100000
+    assert max(len(x) for x in chunks) <= 4096
+
+
+@pytest.mark.asyncio
+async def test_iter_process_stdout_kill_on_close():
+    script = "import sys, time\nwhile True:\n    sys.stdout.write('y' * 1024); sys.stdout.flush(); time.sleep(0.01)"
+    stream = iter_process_stdout([sys.executable, "-c", script])
+    assert await stream.__anext__()
+    start = time.monotonic()
+    await stream.aclose()
+    assert time.monotonic() - start < 2
+
+
+@pytest.mark.asyncio
+async def test_iter_process_stdout_concurrent_streams_use_no_threads():
+    script = (
+        "import sys, time\nfor _ in range(20):\n    sys.stdout.write('y' * 1024); sys.stdout.flush(); time.sleep(0.01)"
+    )
+    threads = threading.active_count()
+    peak = threads
+
+    async def consume() -> int:
+        nonlocal peak
+        size = 0
+        async for chunk in iter_process_stdout([sys.executable, "-c", script]):
+            size += len(chunk)
+            peak = max(peak, threading.active_count())
+        return size
+
+    assert await asyncio.gather(*(consume() for _ in range(20))) == [20 * 1024] * 20
+    assert peak == threads
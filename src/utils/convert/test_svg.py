@@ -0,0 +1,71 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import pytest
+from utils.convert.svg import SvgRenderer, get_svg_etag
+
+SVG = b'<svg xmlns="http://www.w3.org/2000/svg" width="10" height="10"/>'
+
+
+def make_renderer(calls: list, requests: list) -> SvgRenderer:
+    def render(svg: bytes, width: int | None, height: int | None, scale: float) -> bytes:
+        calls.append((width, height, scale))
+        time.sleep(0.05)
+        return b"png:" + svg[:8] + f":{width}x{height}@{scale}".encode()
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        if request.url.path == "/missing.svg":
+            return httpx.Response(404)
+        return httpx.Response(200, content=SVG)
+
+    return SvgRenderer(
+        executor=ThreadPoolExecutor(2), render=render, transport=httpx.MockTransport(handler), cache_size=1024
+    )
+
+
+@pytest.mark.asyncio
+async def test_svg_renderer_cache():
+    calls: list = []
+    requests: list = []
+    renderer = make_renderer(calls, requests)
+    url = "https://icons.example.com/a.svg"
+
+    results = await asyncio.gather(*(renderer.render_url(url, 64, None, 1) for _ in range(5)))
+    assert len(calls) == 1
+    key, png = results[0]
+    assert all(x == (key, png) for x in results)
+    assert png.endswith(b":64xNone@1")
+
+    # 相同内容的 SVG 命中渲染缓存, 不同尺寸重新渲染
+    assert await renderer.render(SVG, 64, None, 1) == (key, png)
+    other_key, _ = await renderer.render_url(url, 128, None, 1)
+    assert len(calls) == 2 and get_svg_etag(other_key) != get_svg_etag(key)
+    assert len(requests) == 1
+    assert renderer.stats()["count"] == 2
+
+    with pytest.raises(httpx.HTTPStatusError):
+        await renderer.fetch("https://icons.example.com/missing.svg")
+    await renderer.aclose()
+
+
+@pytest.mark.asyncio
+async def test_svg_renderer_does_not_block_event_loop():
+    calls: list = []
+    renderer = make_renderer(calls, [])
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            ticks += 1
+            await asyncio.sleep(0.005)
+
+    task = asyncio.create_task(ticker())
+    await asyncio.gather(*(renderer.render(SVG, size, None, 1) for size in range(1, 5)))
+    task.cancel()
+    # 4 次渲染在 2 个工作线程中共需约 0.1s, 期间事件循环持续运行
+    assert ticks >= 10
+    await renderer.aclose()
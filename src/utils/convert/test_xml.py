@@ -0,0 +1,70 @@
+import json
+import tracemalloc
+from collections.abc import AsyncIterator, Iterable
+from xml.parsers import expat
+
+import pytest
+import xmltodict
+from utils.convert.xml import XMLStreamParser, iter_xml_to_json, iter_xml_to_ndjson
+
+DOCUMENT = b"""<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0" xmlns:itunes="http://www.itunes.com/dtds/podcast-1.0.dtd">
+  <channel>
+    <title>\xe6\xb5\x8b\xe8\xaf\x95</title>
+    <item><title>a</title><guid isPermaLink="false">1</guid><itunes:author>x</itunes:author></item>
+    <item><title>b</title><category>c1</category><category>c2</category><enclosure url="u"/></item>
+  </channel>
+</rss>
+"""
+
+
+async def iter_chunks(data: bytes, size: int = 7) -> AsyncIterator[bytes]:
+    for i in range(0, len(data), size):
+        yield data[i : i + size]
+
+
+async def collect(parts: AsyncIterator[str]) -> str:
+    return "".join([x async for x in parts])
+
+
+@pytest.mark.asyncio
+async def test_iter_xml_to_json_matches_xmltodict():
+    content = await collect(iter_xml_to_json(iter_chunks(DOCUMENT)))
+    assert json.loads(content) == xmltodict.parse(DOCUMENT)
+
+
+@pytest.mark.asyncio
+async def test_iter_xml_to_ndjson():
+    content = await collect(iter_xml_to_ndjson(iter_chunks(DOCUMENT), "/rss/channel/item/"))
+    items = [json.loads(x) for x in content.splitlines()]
+    assert items == xmltodict.parse(DOCUMENT)["rss"]["channel"]["item"]
+    assert items[0]["guid"] == {"@isPermaLink": "false", "#text": "1"}
+    assert items[1]["enclosure"] == {"@url": "u"}
+
+
+def test_xml_stream_parser_bounded_memory():
+    def iter_feed(count: int) -> Iterable[bytes]:
+        yield b"<rss><channel>"
+        for i in range(count):
+            yield f"<item><title>{i}</title><description>{'x' * 200}</description></item>".encode()
+        yield b"</channel></rss>"
+
+    parser = XMLStreamParser("rss/channel/item")
+    total = 0
+    tracemalloc.start()
+    for chunk in iter_feed(50000):
+        total += len(parser.feed(chunk))
+        if total == 1000:
+            tracemalloc.reset_peak()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    total += len(parser.feed(b"", final=True))
+    assert total == 50000
+    # 约 10MB 的输入, 解析过程中不保留已返回的节点
+    assert peak < 1024 * 1024
+
+
+def test_xml_stream_parser_invalid():
+    parser = XMLStreamParser()
+    with pytest.raises(expat.ExpatError):
+        parser.feed(b"<a><b></a>", final=True)
@@ -0,0 +1,115 @@
+import json
+import logging
+from collections.abc import AsyncGenerator, AsyncIterable, AsyncIterator
+from dataclasses import dataclass, field
+from typing import Any
+from xml.parsers import expat
+
+logger = logging.getLogger(__file__)
+
+
+@dataclass
+class _Node:
+    name: str
+    attrs: dict[str, str]
+    text: list[str] = field(default_factory=list)
+    children: dict[str, Any] = field(default_factory=dict)
+
+    def to_value(self) -> Any:
+        """与 xmltodict 的默认输出一致: 属性以 @ 开头, 同时存在文本与子节点时文本为 #text, 重复的子节点合并为列表"""
+        text = "".join(self.text).strip()
+        if not self.attrs and not self.children:
+            return text or None
+        value: dict[str, Any] = {f"@{k}": v for k, v in self.attrs.items()}
+        value.update(self.children)
+        if text:
+            value["#text"] = text
+        return value
+
+    def add_child(self, name: str, value: Any):
+        if name not in self.children:
+            self.children[name] = value
+        elif isinstance(self.children[name], list):
+            self.children[name].append(value)
+        else:
+            self.children[name] = [self.children[name], value]
+
+
+class XMLStreamParser:
+    """基于 expat 的增量 XML 解析
+
+    - 未指定 item_path 时返回整个文档, 结构与 xmltodict.parse 一致
+    - 指定 item_path (例如 rss/channel/item) 时逐个返回匹配的节点, 节点返回后即被丢弃, 内存占用与单个节点大小相关
+    """
+
+    def __init__(self, item_path: str | None = None):
+        self.item_path = [x for x in (item_path or "").split("/") if x]
+        self._parser = expat.ParserCreate()
+        self._parser.buffer_text = True
+        self._parser.StartElementHandler = self._start
+        self._parser.EndElementHandler = self._end
+        self._parser.CharacterDataHandler = self._data
+        self._path: list[str] = []
+        self._stack: list[_Node] = []
+        self._items: list[Any] = []
+
+    def _capturing(self) -> bool:
+        depth = len(self.item_path)
+        return len(self._path) >= depth and self._path[:depth] == self.item_path
+
+    def _start(self, name: str, attrs: dict[str, str]):
+        self._path.append(name)
+        if self._capturing():
+            self._stack.append(_Node(name, attrs))
+
+    def _end(self, name: str):
+        if self._capturing():
+            node = self._stack.pop()
+            value = node.to_value()
+            if self._stack:
+                self._stack[-1].add_child(name, value)
+            elif self.item_path:
+                self._items.append(value)
+            else:
+                self._items.append({name: value})
+        self._path.pop()
+
+    def _data(self, data: str):
+        if self._stack:
+            self._stack[-1].text.append(data)
+
+    def feed(self, data: bytes, final: bool = False) -> list[Any]:
+        """输入一段数据, 返回本次解析完成的节点, 格式错误时抛出 expat.ExpatError"""
+        self._parser.Parse(data, final)
+        items, self._items = self._items, []
+        return items
+
+
+async def iter_xml_items(chunks: AsyncIterable[bytes], item_path: str | None = None) -> AsyncIterator[Any]:
+    parser = XMLStreamParser(item_path)
+    async for chunk in chunks:
+        for item in parser.feed(chunk):
+            yield item
+    for item in parser.feed(b"", final=True):
+        yield item
+
+
+async def iter_xml_to_ndjson(chunks: AsyncIterable[bytes], item_path: str) -> AsyncGenerator[str, None]:
+    """逐行返回匹配 item_path 的节点"""
+    async for item in iter_xml_items(chunks, item_path):
+        yield json.dumps(item, ensure_ascii=False) + "\n"
+
+
+async def iter_xml_to_json(chunks: AsyncIterable[bytes]) -> AsyncGenerator[str, None]:
+    """解析整个文档后分段编码输出, 不生成完整的 JSON 字符串"""
+    async for document in iter_xml_items(chunks):
+        buffer: list[str] = []
+        size = 0
+        for part in json.JSONEncoder(ensure_ascii=False).iterencode(document):
+            buffer.append(part)
+            size += len(part)
+            if size >= 64 * 1024:
+                yield "".join(buffer)
+                buffer, size = [], 0
+        if buffer:
+            yield "".join(buffer)
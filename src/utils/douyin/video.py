@@ -9,9 +9,13 @@ logger = logging.getLogger(__file__)
 
 Headless = True
 
+# 抖音网页版的埋点与性能监控上报
+DOUYIN_BLOCK_URL_PATTERNS = (*AsyncPlaywright.BLOCK_URL_PATTERNS, "mcs.zijieapi.com", "mon.zijieapi.com")
+
 
 class AsyncDouyinVideoPlaywright(AsyncPlaywright):
     WATCH_URL_PATH = "/aweme/v1/web/aweme/detail/"
+    BLOCK_URL_PATTERNS = DOUYIN_BLOCK_URL_PATTERNS
 
 
 class DouyinVideoTool:
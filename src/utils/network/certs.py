@@ -0,0 +1,197 @@
+import asyncio
+import ipaddress
+import logging
+import socket
+import time
+from collections.abc import AsyncIterator, Awaitable, Callable, Iterable
+from typing import cast
+
+from cachetools import TLRUCache, TTLCache
+from schemas.network.ssl import SSLCertScanResSchema
+from utils.basic import AsyncSSLClientContext
+
+logger = logging.getLogger(__file__)
+
+
+def parse_host_port(value: str, default_port: int = 443) -> tuple[str, int]:
+    """解析 host, host:port, [ipv6]:port 格式的地址, 格式错误时抛出 ValueError"""
+    value = value.strip()
+    port = default_port
+    if value.startswith("["):
+        host, _, rest = value[1:].partition("]")
+        if rest:
+            if not rest.startswith(":"):
+                raise ValueError(f"invalid address: {value!r}")
+            port = _parse_port(rest[1:], value)
+    elif value.count(":") == 1:
+        host, _, rest = value.partition(":")
+        port = _parse_port(rest, value)
+    else:
+        host = value
+    if not host:
+        raise ValueError(f"invalid address: {value!r}")
+    return host, port
+
+
+def _parse_port(port: str, value: str) -> int:
+    if not port.isdigit() or not 0 < int(port) < 65536:
+        raise ValueError(f"invalid port in address: {value!r}")
+    return int(port)
+
+
+def get_cert_cache_ttl(days_left: int, *, min_ttl: float = 300, max_ttl: float = 86400) -> float:
+    """证书结果的缓存时间, 剩余有效期每多一天缓存一小时, 临近过期时缩短到 min_ttl"""
+    return min(max(days_left * 3600, min_ttl), max_ttl)
+
+
+class SSLCertScanner:
+    """批量查询证书
+
+    - 使用信号量限制同时进行的握手数量
+    - 每个站点的连接与握手均有超时
+    - 缓存 DNS 解析结果
+    - 按 (host, port) 缓存证书结果, 缓存时间随剩余有效期缩放, 查询失败不缓存
+    """
+
+    def __init__(
+        self,
+        *,
+        concurrency: int = 32,
+        connect_timeout: float = 5,
+        handshake_timeout: float = 10,
+        dns_cache_ttl: float = 300,
+    ):
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._connect_timeout = connect_timeout
+        self._handshake_timeout = handshake_timeout
+        self._dns_cache: TTLCache = TTLCache(1024, dns_cache_ttl)
+        self._cert_cache: TLRUCache = TLRUCache(
+            4096, ttu=lambda _, value, now: now + get_cert_cache_ttl(value.cert.valid_days_to_expire)
+        )
+
+    def get_cached(self, value: str) -> SSLCertScanResSchema | None:
+        """仅读取缓存"""
+        try:
+            key = parse_host_port(value)
+        except ValueError:
+            return None
+        return cast(SSLCertScanResSchema | None, self._cert_cache.get(key))
+
+    async def resolve(self, host: str, port: int) -> str:
+        try:
+            ipaddress.ip_address(host)
+        except ValueError:
+            pass
+        else:
+            return host
+
+        address = self._dns_cache.get((host, port))
+        if address is None:
+            loop = asyncio.get_running_loop()
+            infos = await asyncio.wait_for(
+                loop.getaddrinfo(host, port, type=socket.SOCK_STREAM), self._connect_timeout
+            )
+            address = self._dns_cache[(host, port)] = infos[0][4][0]
+        return str(address)
+
+    async def scan_one(self, value: str, *, use_cache: bool = True) -> SSLCertScanResSchema:
+        """查询单个站点, 失败时不抛出异常, 原因记录在 error 中"""
+        try:
+            host, port = parse_host_port(value)
+        except ValueError as e:
+            return SSLCertScanResSchema(host=value, tcp_port=0, cert=None, error=f"ValueError: {e}", latency=0)
+        if use_cache and (cached_value := self._cert_cache.get((host, port))) is not None:
+            return cast(SSLCertScanResSchema, cached_value)
+
+        async with self._semaphore:
+            start = time.perf_counter()
+            cert, error = None, None
+            try:
+                client = AsyncSSLClientContext(
+                    host,
+                    port,
+                    verify=False,
+                    address=await self.resolve(host, port),
+                    timeout=self._connect_timeout + self._handshake_timeout,
+                    handshake_timeout=self._handshake_timeout,
+                )
+                cert = await client.get_peer_certificate()
+            except Exception as e:
+                logger.debug(f"[SSLCertScanner] {host}:{port} failed: {e!r}")
+                error = f"{type(e).__name__}: {e}"
+            latency = round((time.perf_counter() - start) * 1000, 2)
+            result = SSLCertScanResSchema(host=host, tcp_port=port, cert=cert, error=error, latency=latency)
+            if cert is not None:
+                self._cert_cache[(host, port)] = result
+            return result
+
+    async def scan(self, hosts: Iterable[str], *, use_cache: bool = True) -> AsyncIterator[SSLCertScanResSchema]:
+        """按完成顺序返回结果, 提前结束迭代时取消剩余的查询"""
+        tasks = [asyncio.create_task(self.scan_one(host, use_cache=use_cache)) for host in hosts]
+        try:
+            for future in asyncio.as_completed(tasks):
+                yield await future
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+class SSLCertMonitor:
+    """定时重新扫描证书, 剩余有效期低于阈值时推送提醒
+
+    同一张证书只提醒一次, 扫描结果供查询接口直接读取
+    """
+
+    def __init__(
+        self,
+        scanner: SSLCertScanner,
+        hosts: list[str],
+        *,
+        interval: float = 21600,
+        expire_days: int = 14,
+        notify: Callable[[str, str], Awaitable[None]] | None = None,
+    ):
+        self.scanner = scanner
+        self.hosts = list(dict.fromkeys(hosts))
+        self.interval = interval
+        self.expire_days = expire_days
+        self.results: dict[tuple[str, int], SSLCertScanResSchema] = {}
+        self.last_run_at: float | None = None
+        self._notify = notify
+        self._alerted: set[tuple[str, int, str | None]] = set()
+
+    async def check(self) -> list[SSLCertScanResSchema]:
+        """扫描一轮, 返回本轮需要提醒的结果"""
+        alerts = []
+        async for item in self.scanner.scan(self.hosts, use_cache=False):
+            self.results[(item.host, item.tcp_port)] = item
+            cert = item.cert
+            if cert is None or cert.valid_days_to_expire > self.expire_days:
+                continue
+            key = (item.host, item.tcp_port, cert.cert_sha1)
+            if key not in self._alerted:
+                self._alerted.add(key)
+                alerts.append(item)
+        self.last_run_at = time.time()
+
+        if alerts and self._notify:
+            title = f"{len(alerts)} 个证书将在 {self.expire_days} 天内过期"
+            body = "\n".join(
+                f"{x.host}:{x.tcp_port} 剩余 {x.cert.valid_days_to_expire} 天, {x.cert.valid_till}"
+                for x in alerts
+                if x.cert
+            )
+            try:
+                await self._notify(title, body)
+            except Exception as e:
+                logger.warning(f"[SSLCertMonitor] notify failed: {e}", exc_info=True)
+        return alerts
+
+    async def run(self):
+        while True:
+            try:
+                await self.check()
+            except Exception as e:
+                logger.warning(f"[SSLCertMonitor] check failed: {e}", exc_info=True)
+            await asyncio.sleep(self.interval)
@@ -0,0 +1,314 @@
+import asyncio
+import base64
+import logging
+import random
+import time
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import cast
+
+import dns.flags
+import dns.message
+import dns.rdatatype
+import httpx
+from cachetools import TLRUCache
+from schemas.network.dns.doh import DoHMethod
+
+logger = logging.getLogger(__file__)
+
+
+DEFAULT_DOH = "https://1.1.1.1/dns-query"
+# RFC 8467 建议客户端将查询填充到 128 字节的整数倍
+DEFAULT_PADDING = 128
+# resolver 延迟评分的指数加权系数
+LATENCY_EWMA_ALPHA = 0.3
+
+
+@lru_cache(maxsize=4096)
+def build_query_wire(name: str, rdtype: str = "A", pad: int = DEFAULT_PADDING) -> bytes:
+    """构造 ID 为 0 的查询报文
+
+    RFC 8484 建议 ID 置 0, 相同的查询得到相同的报文, GET 请求可被 HTTP 缓存命中, 报文本身也可复用
+    """
+    q = dns.message.make_query(name, dns.rdatatype.from_text(rdtype), id=0, use_edns=0 if pad else None, pad=pad)
+    return q.to_wire()
+
+
+def message_to_json(message: dns.message.Message) -> dict:
+    """将 wire format 应答转换为与 JSON API 一致的结构"""
+    flags = message.flags
+    result: dict = {
+        "Status": message.rcode().value,
+        "TC": int(bool(flags & dns.flags.TC)),
+        "RD": int(bool(flags & dns.flags.RD)),
+        "RA": int(bool(flags & dns.flags.RA)),
+        "AD": int(bool(flags & dns.flags.AD)),
+        "CD": int(bool(flags & dns.flags.CD)),
+        "Question": [{"name": str(rrset.name), "type": rrset.rdtype.value} for rrset in message.question],
+        "Answer": [
+            {"name": str(rrset.name), "type": rrset.rdtype.value, "TTL": rrset.ttl, "data": str(rdata)}
+            for rrset in message.answer
+            for rdata in rrset
+        ],
+    }
+    if message.authority:
+        result["Authority"] = [
+            {"name": str(rrset.name), "type": rrset.rdtype.value, "TTL": rrset.ttl, "data": str(rdata)}
+            for rrset in message.authority
+            for rdata in rrset
+        ]
+    return result
+
+
+def get_response_ttl(data: dict) -> int:
+    """应答的缓存时间, 取 Answer 中最小的 TTL, 无应答时使用 Authority 中 SOA 的 TTL 作为否定缓存时间"""
+    records = data.get("Answer") or data.get("Authority") or []
+    if isinstance(records, dict):
+        records = [records]
+    return min((int(x.get("TTL", 0)) for x in records), default=0)
+
+
+@dataclass
+class DoHLookup:
+    url: str
+    name: str
+    rdtype: str
+    status: int | None = None
+    answers: list[str] = field(default_factory=list)
+    latency: float = 0
+    error: str | None = None
+    data: dict | None = field(default=None, repr=False)
+
+
+def get_answer_records(data: dict, rdtype: str) -> list[str]:
+    """提取与解析类型一致的记录, 忽略 CNAME 链等中间记录"""
+    value = dns.rdatatype.from_text(rdtype).value
+    answers = data.get("Answer") or []
+    if isinstance(answers, dict):
+        answers = [answers]
+    return sorted(str(x["data"]).rstrip(".") for x in answers if x.get("type") == value)
+
+
+class DoHClient:
+    """DoH 异步客户端
+
+    - 每个 resolver 源站复用一个 HTTP/2 连接
+    - 应答按 (resolver, name, type) 缓存, 缓存时间为应答的最小 TTL
+    - auto 模式下记住每个 resolver 支持的查询方式, 只探测一次
+    - wire format 查询使用 ID 为 0 且带 EDNS padding 的报文, 支持 GET 与 POST
+    - 记录每个 resolver 延迟的指数加权平均, 用于竞速时挑选 resolver
+    """
+
+    def __init__(
+        self,
+        *,
+        timeout: float = 10,
+        cache_size: int = 4096,
+        max_ttl: int = 3600,
+        padding: int = DEFAULT_PADDING,
+        transport: httpx.AsyncBaseTransport | None = None,
+        timer=time.monotonic,
+    ):
+        self._timeout = timeout
+        self._max_ttl = max_ttl
+        self._padding = padding
+        self._transport = transport
+        self._clients: dict[str, httpx.AsyncClient] = {}
+        self._methods: dict[str, DoHMethod] = {}
+        self._latency: dict[str, float] = {}
+        self._cache: TLRUCache = TLRUCache(cache_size, ttu=lambda _, value, now: now + value[0], timer=timer)
+
+    def get_client(self, url: str) -> httpx.AsyncClient:
+        origin = httpx.URL(url).copy_with(path="/", query=None, fragment=None)
+        key = str(origin)
+        client = self._clients.get(key)
+        if client is None or client.is_closed:
+            client = self._clients[key] = httpx.AsyncClient(
+                http2=True, timeout=self._timeout, transport=self._transport
+            )
+        return client
+
+    def get_method(self, url: str) -> DoHMethod:
+        """auto 模式下已探测到的查询方式"""
+        return self._methods.get(url, DoHMethod.auto)
+
+    async def query_json(self, url: str, name: str, rdtype: str = "A") -> dict | None:
+        """尝试使用 JSON API 查询，不支持时返回 None。"""
+        resp = await self.get_client(url).get(
+            url,
+            params={"name": name, "type": rdtype},
+            headers={"Accept": "application/dns-json"},
+        )
+        if resp.status_code != 200:
+            return None
+        content_type = resp.headers.get("content-type", "")
+        if "application/dns-json" not in content_type and "application/json" not in content_type:
+            return None
+        data: dict = resp.json()
+        return data
+
+    async def query_wireformat(self, url: str, name: str, rdtype: str = "A", *, post: bool = False) -> dict:
+        """使用 RFC 8484 DNS wire format 查询并转换为 JSON 结构。"""
+        wire = build_query_wire(name, rdtype, self._padding)
+        client = self.get_client(url)
+        if post:
+            resp = await client.post(
+                url,
+                content=wire,
+                headers={"Accept": "application/dns-message", "Content-Type": "application/dns-message"},
+            )
+        else:
+            resp = await client.get(
+                url,
+                params={"dns": base64.urlsafe_b64encode(wire).rstrip(b"=").decode()},
+                headers={"Accept": "application/dns-message"},
+            )
+        resp.raise_for_status()
+        return message_to_json(dns.message.from_wire(resp.content))
+
+    async def _resolve(self, url: str, name: str, rdtype: str, method: DoHMethod) -> dict:
+        if method == DoHMethod.auto:
+            method = self.get_method(url)
+
+        if method in (DoHMethod.wireformat, DoHMethod.post):
+            return await self.query_wireformat(url, name, rdtype, post=method == DoHMethod.post)
+
+        data = await self.query_json(url, name, rdtype)
+        if data is not None:
+            self._methods.setdefault(url, DoHMethod.json)
+            return data
+        if method == DoHMethod.json:
+            raise httpx.HTTPStatusError(
+                f"JSON API not supported by {url}",
+                request=httpx.Request("GET", url),
+                response=httpx.Response(400),
+            )
+
+        logger.debug(f"[DoHClient] JSON API not supported for {url}, falling back to wire format")
+        self._methods[url] = DoHMethod.wireformat
+        return await self.query_wireformat(url, name, rdtype)
+
+    async def query(self, url: str, name: str, rdtype: str = "A", method: DoHMethod = DoHMethod.auto) -> dict:
+        key = (url, name.lower().rstrip("."), rdtype.upper())
+        cached_value = self._cache.get(key)
+        if cached_value is not None:
+            return cast(dict, cached_value[1])
+
+        start = time.perf_counter()
+        try:
+            data = await self._resolve(url, name, rdtype.upper(), method)
+        except asyncio.CancelledError:
+            # 竞速中被取消的 resolver 只知道比胜者慢, 作为截尾样本, 不拉低已有评分
+            elapsed = (time.perf_counter() - start) * 1000
+            self.record_latency(url, max(elapsed, self._latency.get(url, elapsed)))
+            raise
+        except Exception:
+            self.record_latency(url, self._timeout * 1000)
+            raise
+        self.record_latency(url, (time.perf_counter() - start) * 1000)
+
+        ttl = min(get_response_ttl(data), self._max_ttl)
+        if ttl > 0:
+            self._cache[key] = (ttl, data)
+        return data
+
+    def record_latency(self, url: str, latency: float):
+        score = self._latency.get(url)
+        self._latency[url] = latency if score is None else score + LATENCY_EWMA_ALPHA * (latency - score)
+
+    def get_latency_scores(self) -> dict[str, float]:
+        """resolver 延迟的指数加权平均, 毫秒"""
+        return dict(self._latency)
+
+    def pick_race_resolvers(self, urls: list[str], size: int) -> list[str]:
+        """挑选参与竞速的 resolver
+
+        未测量过的 resolver 优先, 其余按延迟评分排序; 名额不少于 2 个时保留一个名额随机探测评分较差的 resolver, 避免其评分永远得不到更新
+        """
+        ranked = sorted(urls, key=lambda url: self._latency.get(url, -1))
+        if len(urls) <= size:
+            return ranked
+        if size < 2:
+            return ranked[:size]
+        picked, rest = ranked[: size - 1], ranked[size - 1 :]
+        return picked + [random.choice(rest)]
+
+    async def race(
+        self, urls: list[str], name: str, rdtype: str = "A", *, size: int = 3, method: DoHMethod = DoHMethod.auto
+    ) -> DoHLookup:
+        """并发向多个 resolver 查询, 返回第一个有效应答 (NOERROR 或 NXDOMAIN) 并取消其余查询
+
+        全部失败时返回最后完成的结果
+        """
+        if not urls:
+            raise ValueError("urls must not be empty")
+        tasks = [
+            asyncio.create_task(self.lookup(url, name, rdtype, method)) for url in self.pick_race_resolvers(urls, size)
+        ]
+        result = DoHLookup(urls[0], name, rdtype)
+        try:
+            for future in asyncio.as_completed(tasks):
+                result = await future
+                if result.error is None and result.status in (0, 3):
+                    return result
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        return result
+
+    async def lookup(self, url: str, name: str, rdtype: str = "A", method: DoHMethod = DoHMethod.auto) -> DoHLookup:
+        """查询并记录耗时, 失败时不抛出异常"""
+        result = DoHLookup(url, name, rdtype)
+        start = time.perf_counter()
+        try:
+            data = await self.query(url, name, rdtype, method)
+        except Exception as e:
+            result.error = f"{type(e).__name__}: {e}"
+        else:
+            result.data = data
+            result.status = data.get("Status")
+            result.answers = get_answer_records(data, rdtype)
+        result.latency = round((time.perf_counter() - start) * 1000, 2)
+        return result
+
+    async def lookup_many(
+        self,
+        urls: list[str],
+        names: list[str],
+        rdtypes: list[str],
+        *,
+        method: DoHMethod = DoHMethod.auto,
+        concurrency: int = 32,
+    ) -> list[DoHLookup]:
+        """并发查询 urls × names × rdtypes, 同一 resolver 的请求复用 HTTP/2 连接, 结果顺序与输入一致"""
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def _lookup(url: str, name: str, rdtype: str) -> DoHLookup:
+            async with semaphore:
+                return await self.lookup(url, name, rdtype, method)
+
+        tasks = [_lookup(url, name, rdtype) for name in names for rdtype in rdtypes for url in urls]
+        return await asyncio.gather(*tasks)
+
+    async def aclose(self):
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            await client.aclose()
+
+
+_doh_client: DoHClient | None = None
+
+
+def get_doh_client() -> DoHClient:
+    global _doh_client
+    if _doh_client is None:
+        _doh_client = DoHClient()
+    return _doh_client
+
+
+async def close_doh_client():
+    global _doh_client
+    if _doh_client is not None:
+        await _doh_client.aclose()
+        _doh_client = None
@@ -0,0 +1,140 @@
+import asyncio
+import datetime
+import ssl
+import time
+
+import pytest
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+from utils.basic import AsyncSSLClientContext, get_peer_cert_chain
+from utils.network.certs import SSLCertMonitor, SSLCertScanner, get_cert_cache_ttl, parse_host_port
+
+
+def make_server_ssl_context(tmp_path) -> ssl.SSLContext:
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "localhost")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=30))
+        .add_extension(x509.SubjectAlternativeName([x509.DNSName("localhost")]), critical=False)
+        .sign(key, hashes.SHA256())
+    )
+    cert_path, key_path = tmp_path / "cert.pem", tmp_path / "key.pem"
+    cert_path.write_bytes(cert.public_bytes(serialization.Encoding.PEM))
+    key_path.write_bytes(
+        key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption())
+    )
+    ctx = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    ctx.minimum_version = ssl.TLSVersion.TLSv1_3
+    ctx.load_cert_chain(cert_path, key_path)
+    return ctx
+
+
+def test_parse_host_port():
+    assert parse_host_port("example.com") == ("example.com", 443)
+    assert parse_host_port("example.com:8443") == ("example.com", 8443)
+    assert parse_host_port("[::1]:8443") == ("::1", 8443)
+    assert parse_host_port("[::1]") == ("::1", 443)
+    for value in ("example.com:https", "example.com:", "example.com:70000", "[::1]8443", ":443"):
+        with pytest.raises(ValueError):
+            parse_host_port(value)
+
+
+@pytest.mark.asyncio
+async def test_ssl_cert_scanner(tmp_path):
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        await reader.read()
+        writer.close()
+
+    async def hang(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        await asyncio.sleep(10)
+
+    tls_server = await asyncio.start_server(handle, "127.0.0.1", 0, ssl=make_server_ssl_context(tmp_path))
+    hang_server = await asyncio.start_server(hang, "127.0.0.1", 0)
+    tls_port = tls_server.sockets[0].getsockname()[1]
+    hang_port = hang_server.sockets[0].getsockname()[1]
+
+    scanner = SSLCertScanner(concurrency=4, connect_timeout=0.5, handshake_timeout=0.5)
+    start = time.perf_counter()
+    results = [x async for x in scanner.scan([f"localhost:{tls_port}", f"127.0.0.1:{hang_port}"])]
+    assert time.perf_counter() - start < 2
+
+    assert [(x.host, x.tcp_port) for x in results] == [("localhost", tls_port), ("127.0.0.1", hang_port)]
+    assert results[0].error is None, results[0].error
+    assert results[0].cert and results[0].cert.cert_sans == "DNS:localhost"
+    assert results[1].error is not None and results[1].cert is None
+    assert scanner._dns_cache[("localhost", tls_port)]
+    assert scanner.get_cached(f"localhost:{tls_port}") is results[0]
+    assert scanner.get_cached(f"127.0.0.1:{hang_port}") is None
+    invalid = await scanner.scan_one("example.com:https")
+    assert invalid.cert is None and invalid.error and "example.com:https" in invalid.error
+    assert await scanner.scan_one(f"localhost:{tls_port}") is results[0]
+
+    notifications = []
+
+    async def notify(title: str, body: str):
+        notifications.append((title, body))
+
+    monitor = SSLCertMonitor(scanner, [f"localhost:{tls_port}"], expire_days=60, notify=notify)
+    alerts = await monitor.check()
+    assert len(alerts) == 1 and alerts[0] is not results[0]
+    assert await monitor.check() == []
+    assert len(notifications) == 1
+    assert f"localhost:{tls_port}" in notifications[0][1]
+    assert monitor.results[("localhost", tls_port)].cert
+
+    tls_server.close()
+    hang_server.close()
+
+
+def test_get_cert_cache_ttl():
+    assert get_cert_cache_ttl(0) == 300
+    assert get_cert_cache_ttl(3) == 3 * 3600
+    assert get_cert_cache_ttl(90) == 86400
+
+
+@pytest.mark.asyncio
+async def test_async_ssl_client_context_chain(tmp_path):
+    """TLS 1.3 下证书消息是加密的, 证书链应从握手完成后的 SSL 对象中读取"""
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        await reader.read()
+        writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0, ssl=make_server_ssl_context(tmp_path))
+    port = server.sockets[0].getsockname()[1]
+    async with AsyncSSLClientContext("localhost", port, address="127.0.0.1", timeout=2) as client:
+        cert = client.certificate
+        assert client.writer
+        ssl_object = client.writer.get_extra_info("ssl_object")
+        assert ssl_object.version() == "TLSv1.3"
+    assert cert
+    assert cert.issued_to == "CN=localhost"
+    assert [x.subject for x in cert.chain][:1] == ["CN=localhost"]
+    assert cert.chain[0].self_signed and not cert.chain[0].is_ca
+    assert cert.chain[0].days_to_expire == cert.valid_days_to_expire
+    server.close()
+
+
+def test_get_peer_cert_chain():
+    class LegacySSLObject:
+        def getpeercert(self, binary_form: bool = False) -> bytes:
+            return b"leaf"
+
+    class ModernSSLObject(LegacySSLObject):
+        def get_verified_chain(self) -> list[bytes]:
+            raise ssl.SSLError("not verified")
+
+        def get_unverified_chain(self) -> list[bytes]:
+            return [b"leaf", b"intermediate"]
+
+    assert get_peer_cert_chain(LegacySSLObject()) == [b"leaf"]  # type: ignore[arg-type]
+    assert get_peer_cert_chain(ModernSSLObject()) == [b"leaf", b"intermediate"]  # type: ignore[arg-type]
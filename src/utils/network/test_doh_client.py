@@ -0,0 +1,252 @@
+import asyncio
+import base64
+import socket
+import time
+from urllib.parse import parse_qs
+
+import dns.message
+import dns.rrset
+import httpx
+import pytest
+from hypercorn.asyncio import serve
+from hypercorn.config import Config
+from utils.network.doh import DoHClient, DoHMethod, build_query_wire, get_response_ttl
+
+JSON_DOH = "https://json.example.com/dns-query"
+WIRE_DOH = "https://wire.example.com/dns-query"
+
+
+class FakeTimer:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _decode(request: httpx.Request) -> bytes:
+    if request.method == "POST":
+        return request.content
+    param = request.url.params["dns"]
+    return base64.urlsafe_b64decode(param + "=" * (-len(param) % 4))
+
+
+def make_transport(requests: list[httpx.Request]) -> httpx.MockTransport:
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        if request.url.host == "down.example.com":
+            return httpx.Response(503)
+        if request.url.host == "json.example.com":
+            return httpx.Response(
+                200,
+                json={
+                    "Status": 0,
+                    "TC": 0,
+                    "RD": 1,
+                    "RA": 1,
+                    "AD": 0,
+                    "CD": 0,
+                    "Question": [{"name": "example.com.", "type": 1}],
+                    "Answer": [
+                        {"name": "example.com.", "type": 1, "TTL": 300, "data": "1.1.1.1"},
+                        {"name": "example.com.", "type": 1, "TTL": 60, "data": "1.0.0.1"},
+                    ],
+                },
+                headers={"content-type": "application/dns-json"},
+            )
+        if "dns" not in request.url.params and request.method != "POST":
+            return httpx.Response(400)
+        query = dns.message.from_wire(_decode(request))
+        response = dns.message.make_response(query)
+        response.answer.append(dns.rrset.from_text(query.question[0].name, 120, "IN", "A", "2.2.2.2"))
+        return httpx.Response(200, content=response.to_wire(), headers={"content-type": "application/dns-message"})
+
+    return httpx.MockTransport(handler)
+
+
+@pytest.mark.asyncio
+async def test_doh_client_cache_by_ttl():
+    requests: list[httpx.Request] = []
+    timer = FakeTimer()
+    client = DoHClient(transport=make_transport(requests), timer=timer)
+
+    data = await client.query(JSON_DOH, "example.com")
+    assert get_response_ttl(data) == 60
+    assert await client.query(JSON_DOH, "Example.com.") is data
+    assert len(requests) == 1
+
+    timer.now = 61
+    await client.query(JSON_DOH, "example.com")
+    assert len(requests) == 2
+    await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_doh_client_auto_probes_once():
+    requests: list[httpx.Request] = []
+    client = DoHClient(transport=make_transport(requests))
+
+    data = await client.query(WIRE_DOH, "a.example.com")
+    assert data["Answer"][0]["data"] == "2.2.2.2"
+    assert client.get_method(WIRE_DOH) == DoHMethod.wireformat
+    assert len(requests) == 2
+
+    await client.query(WIRE_DOH, "b.example.com", "AAAA")
+    assert len(requests) == 3
+    assert "dns" in requests[-1].url.params
+
+    with pytest.raises(httpx.HTTPStatusError):
+        await client.query(WIRE_DOH, "c.example.com", method=DoHMethod.json)
+    await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_doh_client_lookup_many():
+    requests: list[httpx.Request] = []
+    client = DoHClient(transport=make_transport(requests))
+
+    names = [f"{i}.example.com" for i in range(20)]
+    lookups = await client.lookup_many(
+        [JSON_DOH, WIRE_DOH, "https://down.example.com/dns-query"], names, ["A"], concurrency=4
+    )
+    assert len(lookups) == 60
+    assert [x.name for x in lookups[:3]] == ["0.example.com"] * 3
+    assert lookups[0].answers == ["1.0.0.1", "1.1.1.1"]
+    assert lookups[1].answers == ["2.2.2.2"]
+    assert lookups[2].error is not None
+    await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_doh_client_post():
+    requests: list[httpx.Request] = []
+    client = DoHClient(transport=make_transport(requests))
+
+    data = await client.query(WIRE_DOH, "example.com", method=DoHMethod.post)
+    assert data["Answer"][0]["data"] == "2.2.2.2"
+    assert requests[0].method == "POST"
+    assert requests[0].headers["content-type"] == "application/dns-message"
+
+    query = dns.message.from_wire(requests[0].content)
+    assert query.id == 0
+    assert len(requests[0].content) % 128 == 0
+    assert build_query_wire("example.com", "A") is build_query_wire("example.com", "A")
+    await client.aclose()
+
+
+async def stub_doh_app(scope, receive, send):
+    """本地 DoH 服务, 对所有 A 查询返回固定地址"""
+    if scope["type"] != "http":
+        return
+    body = b""
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get("body", b"")
+        more_body = message.get("more_body", False)
+    if scope["method"] == "GET":
+        param = parse_qs(scope["query_string"].decode())["dns"][0]
+        body = base64.urlsafe_b64decode(param + "=" * (-len(param) % 4))
+    query = dns.message.from_wire(body)
+    response = dns.message.make_response(query)
+    response.answer.append(dns.rrset.from_text(query.question[0].name, 60, "IN", "A", "1.2.3.4"))
+    await send(
+        {"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"application/dns-message")]}
+    )
+    await send({"type": "http.response.body", "body": response.to_wire()})
+
+
+@pytest.mark.asyncio
+async def test_doh_get_post_benchmark():
+    """通过单个 HTTP/2 (h2c) 连接对本地 DoH 服务并发查询, 对比 GET 与 POST 的吞吐"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    config = Config()
+    config.bind = [f"127.0.0.1:{port}"]
+    config.loglevel = "WARNING"
+    config.keep_alive_max_requests = 10000
+    shutdown = asyncio.Event()
+    server = asyncio.create_task(serve(stub_doh_app, config, shutdown_trigger=shutdown.wait))
+    url = f"http://127.0.0.1:{port}/dns-query"
+    transport = httpx.AsyncHTTPTransport(http1=False, http2=True)
+    client = DoHClient(transport=transport)
+    try:
+        for _ in range(50):
+            try:
+                await client.query_wireformat(url, "warmup.example.com")
+                break
+            except httpx.ConnectError:
+                await asyncio.sleep(0.05)
+
+        total = 500
+        for method in (DoHMethod.wireformat, DoHMethod.post):
+            names = [f"{method.value}-{i}.example.com" for i in range(total)]
+            start = time.perf_counter()
+            lookups = await client.lookup_many([url], names, ["A"], method=method, concurrency=64)
+            elapsed = time.perf_counter() - start
+            failed = [x for x in lookups if x.answers != ["1.2.3.4"]]
+            assert not failed, failed[:3]
+            print(
+                f"\n[doh benchmark] {method.value}: {total} queries in {elapsed * 1000:.2f}ms, {total / elapsed:.0f} qps"
+            )
+    finally:
+        await client.aclose()
+        shutdown.set()
+        await server
+
+
+@pytest.mark.asyncio
+async def test_doh_client_race():
+    async def handler(request: httpx.Request) -> httpx.Response:
+        delay = {"slow.example.com": 0.5, "fast.example.com": 0.01}.get(request.url.host, 0)
+        if request.url.host == "broken.example.com":
+            return httpx.Response(503)
+        await asyncio.sleep(delay)
+        query = dns.message.from_wire(_decode(request))
+        response = dns.message.make_response(query)
+        response.answer.append(dns.rrset.from_text(query.question[0].name, 0, "IN", "A", "3.3.3.3"))
+        return httpx.Response(200, content=response.to_wire(), headers={"content-type": "application/dns-message"})
+
+    client = DoHClient(transport=httpx.MockTransport(handler))
+    slow, fast, broken = (f"https://{x}.example.com/dns-query" for x in ("slow", "fast", "broken"))
+
+    start = time.perf_counter()
+    result = await client.race([slow, fast, broken], "example.com", method=DoHMethod.wireformat)
+    assert time.perf_counter() - start < 0.4
+    assert result.url == fast
+    assert result.answers == ["3.3.3.3"]
+
+    scores = client.get_latency_scores()
+    assert scores[fast] < scores[slow] < scores[broken]
+    assert client.pick_race_resolvers([slow, fast, broken], 2)[0] == fast
+
+    result = await client.race([broken], "example.com", method=DoHMethod.wireformat)
+    assert result.error is not None
+    await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_doh_client_race_scores_distinguish_losers():
+    delays = {"a": 0.01, "b": 0.05, "c": 0.3}
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(delays[request.url.host.split(".")[0]])
+        query = dns.message.from_wire(_decode(request))
+        response = dns.message.make_response(query)
+        response.answer.append(dns.rrset.from_text(query.question[0].name, 0, "IN", "A", "3.3.3.3"))
+        return httpx.Response(200, content=response.to_wire(), headers={"content-type": "application/dns-message"})
+
+    client = DoHClient(transport=httpx.MockTransport(handler))
+    a, b, c = (f"https://{x}.example.com/dns-query" for x in delays)
+    # 先各自单独测量一次, 之后的竞速中输家的评分不应被拉低到胜者的延迟
+    for url in (a, b, c):
+        await client.query(url, "warmup.example.com", method=DoHMethod.wireformat)
+    for i in range(10):
+        await client.race([a, b, c], f"{i}.example.com", method=DoHMethod.wireformat)
+
+    scores = client.get_latency_scores()
+    assert scores[a] < scores[b] < scores[c]
+    assert client.pick_race_resolvers([c, b, a], 1) == [a]
+    assert client.pick_race_resolvers([c, b, a], 3) == [a, b, c]
+    await client.aclose()
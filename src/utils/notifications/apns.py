@@ -0,0 +1,65 @@
+import asyncio
+import logging
+
+import httpx
+from schemas.notifications.apple import ApplePushEnvironment, ApplePushMessage
+
+logger = logging.getLogger(__file__)
+
+
+def get_apple_channels(message: ApplePushMessage) -> list[tuple[str, str]]:
+    """返回 (渠道, 设备), 指定了 device_tokens 时每个设备是一个渠道"""
+    if message.device_tokens is None:
+        return [("apple", message.device_token)]
+    return [(f"apple:{x}", x) for x in message.get_device_tokens()]
+
+
+def retain_apple_channels(message: ApplePushMessage, channels: set[str]) -> ApplePushMessage | None:
+    tokens = [token for channel, token in get_apple_channels(message) if channel in channels]
+    if not tokens:
+        return None
+    if message.device_tokens is None:
+        return message
+    return message.model_copy(update={"device_token": tokens[0], "device_tokens": tokens})
+
+
+class APNsClient:
+    """APNs 推送
+
+    - 每个 (topic, 环境) 只建立一个 HTTP/2 连接, 并发的推送在同一连接上多路复用
+    - 鉴权 Token 按密钥复用, 每 30 分钟轮换, 见 APNsTokenManager
+    """
+
+    def __init__(
+        self, *, timeout: float = 10, concurrency: int = 100, transport: httpx.AsyncBaseTransport | None = None
+    ):
+        self._timeout = timeout
+        self._transport = transport
+        self._clients: dict[tuple[str, ApplePushEnvironment], httpx.AsyncClient] = {}
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    def get_client(self, message: ApplePushMessage) -> httpx.AsyncClient:
+        key = (message.topic, message.environment)
+        client = self._clients.get(key)
+        if client is None or client.is_closed:
+            client = self._clients[key] = httpx.AsyncClient(
+                http2=True,
+                timeout=self._timeout,
+                limits=httpx.Limits(max_connections=1),
+                transport=self._transport,
+            )
+        return client
+
+    async def send(self, message: ApplePushMessage, device_token: str | None = None) -> httpx.Response:
+        async with self._semaphore:
+            return await message.apush(self.get_client(message), device_token)
+
+    async def send_many(self, message: ApplePushMessage) -> list[httpx.Response | BaseException]:
+        """并发推送到消息中的所有设备, 返回值与 get_device_tokens 的顺序一致"""
+        tokens = message.get_device_tokens()
+        return await asyncio.gather(*(self.send(message, x) for x in tokens), return_exceptions=True)
+
+    async def aclose(self):
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            await client.aclose()
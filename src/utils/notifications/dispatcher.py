@@ -0,0 +1,152 @@
+import asyncio
+import logging
+import time
+from collections.abc import Awaitable, Callable, Sequence
+from typing import Any
+
+import httpx
+from schemas.notifications import PushChannelResult, PushMessage, PushMessageV3
+from schemas.notifications.apple import ApplePushMessage
+from schemas.notifications.telegram import TelegramPushMessageV3
+from utils.notifications.apns import APNsClient, get_apple_channels
+
+logger = logging.getLogger(__file__)
+
+
+PushCall = Callable[[httpx.AsyncClient], Awaitable[Any]]
+# 同一组内的渠道按顺序推送, 例如同一 telegram 会话的文本、图片与媒体组
+PushChannelGroup = list[tuple[str, str, PushCall]]
+
+DEFAULT_PROVIDER_CONCURRENCY = {"telegram": 8, "bark": 16, "gotify": 8, "apple": 32, "gmail": 2}
+HTTP2_PROVIDERS = {"telegram"}
+
+
+def get_retry_after(resp: httpx.Response) -> float | None:
+    """telegram 限流时在 parameters.retry_after 中返回等待秒数, 其他服务使用 Retry-After 响应头"""
+    try:
+        data = resp.json()
+        return float(data["parameters"]["retry_after"])
+    except Exception:
+        pass
+    try:
+        return float(resp.headers["Retry-After"])
+    except (KeyError, ValueError):
+        return None
+
+
+class NotificationDispatcher:
+    """异步消息推送
+
+    - 每个推送服务复用一个连接池, telegram 使用 HTTP/2, APNs 见 APNsClient
+    - 所有消息与渠道并发推送, 每个推送服务有独立的并发上限
+    - 单个渠道失败不影响其余渠道, 返回每个渠道的推送结果
+    """
+
+    def __init__(
+        self,
+        *,
+        concurrency: dict[str, int] | None = None,
+        timeout: float = 10,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ):
+        self._concurrency = {**DEFAULT_PROVIDER_CONCURRENCY, **(concurrency or {})}
+        self._timeout = timeout
+        self._transport = transport
+        self._clients: dict[str, httpx.AsyncClient] = {}
+        self._semaphores: dict[str, asyncio.Semaphore] = {}
+        self.apns = APNsClient(timeout=timeout, transport=transport)
+
+    def get_client(self, provider: str) -> httpx.AsyncClient:
+        client = self._clients.get(provider)
+        if client is None or client.is_closed:
+            client = self._clients[provider] = httpx.AsyncClient(
+                http2=provider in HTTP2_PROVIDERS, timeout=self._timeout, transport=self._transport
+            )
+        return client
+
+    def get_semaphore(self, provider: str) -> asyncio.Semaphore:
+        semaphore = self._semaphores.get(provider)
+        if semaphore is None:
+            semaphore = self._semaphores[provider] = asyncio.Semaphore(self._concurrency.get(provider, 8))
+        return semaphore
+
+    async def call(self, index: int, channel: str, provider: str, push: PushCall) -> PushChannelResult:
+        start = time.perf_counter()
+        status_code, error, retry_after = None, None, None
+        try:
+            async with self.get_semaphore(provider):
+                resp = await push(self.get_client(provider))
+            if isinstance(resp, httpx.Response):
+                status_code = resp.status_code
+        except httpx.HTTPStatusError as e:
+            status_code = e.response.status_code
+            error = f"{e}: {e.response.text[:256]}"
+            retry_after = get_retry_after(e.response)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        if error:
+            logger.warning(f"[NotificationDispatcher] messages[{index}].{channel} failed: {error}")
+        latency = round((time.perf_counter() - start) * 1000, 2)
+        return PushChannelResult(
+            index=index,
+            channel=channel,
+            ok=error is None,
+            status_code=status_code,
+            error=error,
+            latency=latency,
+            retry_after=retry_after,
+        )
+
+    async def _call_group(self, index: int, group: PushChannelGroup) -> list[PushChannelResult]:
+        return [await self.call(index, channel, provider, push) for channel, provider, push in group]
+
+    def get_apple_call(self, message: ApplePushMessage, device_token: str) -> PushCall:
+        """APNs 不使用按推送服务划分的连接池, 由 APNsClient 按 topic 与环境复用连接"""
+
+        async def push(_: httpx.AsyncClient) -> httpx.Response:
+            return await self.apns.send(message, device_token)
+
+        return push
+
+    def get_channel_groups(self, message: PushMessage | PushMessageV3) -> list[PushChannelGroup]:
+        groups: list[PushChannelGroup] = []
+        telegram = message.telegram
+        if isinstance(telegram, TelegramPushMessageV3):
+            group: PushChannelGroup = []
+            if telegram.message:
+                group.append(("telegram.message", "telegram", telegram.apush_text))
+            if telegram.photo:
+                group.append(("telegram.photo", "telegram", telegram.apush_photo))
+            if telegram.media:
+                group.append(("telegram.media", "telegram", telegram.apush_media))
+            groups.append(group)
+        elif telegram is not None:
+            groups.append([("telegram", "telegram", telegram.apush)])
+        if message.gmail:
+            gmail = message.gmail
+            groups.append([("gmail", "gmail", lambda _: asyncio.to_thread(gmail.push))])
+        if message.bark:
+            groups.append([("bark", "bark", message.bark.apush)])
+        if isinstance(message, PushMessageV3):
+            if message.gotify:
+                groups.append([("gotify", "gotify", message.gotify.apush)])
+            if message.apple:
+                apple = message.apple
+                for channel, token in get_apple_channels(apple):
+                    groups.append([(channel, "apple", self.get_apple_call(apple, token))])
+        return [x for x in groups if x]
+
+    async def dispatch(self, messages: Sequence[PushMessage | PushMessageV3]) -> list[PushChannelResult]:
+        """并发推送全部消息, 结果按消息与渠道的顺序返回"""
+        tasks = [
+            self._call_group(index, group)
+            for index, message in enumerate(messages)
+            for group in self.get_channel_groups(message)
+        ]
+        return [result for results in await asyncio.gather(*tasks) for result in results]
+
+    async def aclose(self):
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            await client.aclose()
+        await self.apns.aclose()
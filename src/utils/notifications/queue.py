@@ -0,0 +1,367 @@
+import asyncio
+import json
+import logging
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from collections import defaultdict
+from collections.abc import Awaitable, Callable, Iterable
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from schemas.notifications import PushChannelResult, PushJobSchema, PushJobStatus, PushMessageV3
+from schemas.notifications.telegram import (
+    TelegramPushMessageMediaDetail,
+    TelegramPushMessagePhoto,
+    TelegramPushMessageText,
+    TelegramPushMessageV3,
+)
+from utils.notifications.apns import get_apple_channels, retain_apple_channels
+from utils.notifications.dispatcher import NotificationDispatcher
+
+logger = logging.getLogger(__file__)
+
+
+TELEGRAM_TEXT_LIMIT = 4096
+TELEGRAM_MEDIA_GROUP_LIMIT = 10
+TELEGRAM_CHANNEL_FIELDS = {"telegram.message": "message", "telegram.photo": "photo", "telegram.media": "media"}
+
+
+def retain_channels(message: PushMessageV3, channels: Iterable[str]) -> PushMessageV3 | None:
+    """仅保留指定的渠道, 用于只重试失败的渠道, 没有剩余渠道时返回 None"""
+    retained_channels = set(channels)
+    update: dict = {name: None for name in ("gmail", "bark", "gotify") if name not in retained_channels}
+    if message.apple is not None:
+        update["apple"] = retain_apple_channels(message.apple, retained_channels)
+    if message.telegram is not None:
+        telegram = message.telegram.model_copy(
+            update={x: None for channel, x in TELEGRAM_CHANNEL_FIELDS.items() if channel not in retained_channels}
+        )
+        update["telegram"] = telegram if (telegram.message or telegram.photo or telegram.media) else None
+    retained = message.model_copy(update=update)
+    if not any(getattr(retained, x) for x in ("telegram", "gmail", "bark", "gotify", "apple")):
+        return None
+    return retained
+
+
+def get_channels(message: PushMessageV3) -> list[str]:
+    channels = [
+        channel
+        for channel, name in TELEGRAM_CHANNEL_FIELDS.items()
+        if message.telegram is not None and getattr(message.telegram, name)
+    ]
+    channels.extend(x for x in ("gmail", "bark", "gotify") if getattr(message, x))
+    if message.apple is not None:
+        channels.extend(channel for channel, _ in get_apple_channels(message.apple))
+    return channels
+
+
+@dataclass
+class NotificationJob:
+    id: str
+    message: PushMessageV3
+    status: PushJobStatus = PushJobStatus.queued
+    attempts: int = 0
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+    next_run_at: float | None = field(default_factory=time.time)
+    results: dict[str, PushChannelResult] = field(default_factory=dict)
+
+    def to_schema(self) -> PushJobSchema:
+        return PushJobSchema(
+            id=self.id,
+            status=self.status,
+            attempts=self.attempts,
+            created_at=self.created_at,
+            updated_at=self.updated_at,
+            next_run_at=self.next_run_at,
+            results=list(self.results.values()),
+        )
+
+
+class NotificationJobStore:
+    """基于 SQLite 的任务存储, 进程重启后继续推送未完成的任务"""
+
+    def __init__(self, path: str | Path):
+        path = Path(path).expanduser()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, message TEXT NOT NULL, status TEXT NOT NULL, attempts INTEGER NOT NULL, "
+            "created_at REAL NOT NULL, updated_at REAL NOT NULL, next_run_at REAL, results TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status_next_run_at ON jobs (status, next_run_at)")
+        self._conn.commit()
+
+    @staticmethod
+    def _to_job(row: tuple) -> NotificationJob:
+        id_, message, status, attempts, created_at, updated_at, next_run_at, results = row
+        return NotificationJob(
+            id=id_,
+            message=PushMessageV3.model_validate_json(message),
+            status=PushJobStatus(status),
+            attempts=attempts,
+            created_at=created_at,
+            updated_at=updated_at,
+            next_run_at=next_run_at,
+            results={k: PushChannelResult(**v) for k, v in json.loads(results).items()},
+        )
+
+    def save(self, job: NotificationJob):
+        results = json.dumps({k: v.model_dump() for k, v in job.results.items()}, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    job.id,
+                    job.message.model_dump_json(by_alias=True),
+                    job.status.value,
+                    job.attempts,
+                    job.created_at,
+                    job.updated_at,
+                    job.next_run_at,
+                    results,
+                ),
+            )
+            self._conn.commit()
+
+    def get(self, id_: str) -> NotificationJob | None:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (id_,)).fetchone()
+        return self._to_job(row) if row else None
+
+    def due(self, now: float, limit: int) -> list[NotificationJob]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM jobs WHERE status = ? AND next_run_at <= ? ORDER BY created_at LIMIT ?",
+                (PushJobStatus.queued.value, now, limit),
+            ).fetchall()
+        return [self._to_job(x) for x in rows]
+
+    def next_run_at(self) -> float | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MIN(next_run_at) FROM jobs WHERE status = ?", (PushJobStatus.queued.value,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {**{x.value: 0 for x in PushJobStatus}, **dict(rows)}
+
+    def purge(self, before: float) -> int:
+        """删除已结束且早于 before 的任务"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM jobs WHERE status != ? AND updated_at < ?", (PushJobStatus.queued.value, before)
+            )
+            self._conn.commit()
+        return cursor.rowcount
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+@dataclass
+class _TelegramBatch:
+    """合并后的一次 telegram 推送, 以及贡献了内容的 (任务, 渠道)"""
+
+    message: TelegramPushMessageV3
+    channel: str
+    sources: list[tuple[NotificationJob, str]]
+
+
+def batch_telegram(jobs: list[NotificationJob]) -> list[list[_TelegramBatch]]:
+    """将发往同一会话的 telegram 消息合并
+
+    文本按 parse_mode 合并为不超过 4096 字符的消息, 图片与媒体合并为不超过 10 项的媒体组;
+    返回按会话分组的推送列表, 同一会话内按顺序推送
+    """
+    chats: dict[tuple[str, str], list[tuple[NotificationJob, TelegramPushMessageV3]]] = defaultdict(list)
+    for job in jobs:
+        if job.message.telegram is not None:
+            chats[(job.message.telegram.bot_id, job.message.telegram.chat_id)].append((job, job.message.telegram))
+
+    plans = []
+    for (bot_id, chat_id), items in chats.items():
+        batches: list[_TelegramBatch] = []
+        text_batch: _TelegramBatch | None = None
+        for job, telegram in items:
+            if telegram.message is None:
+                continue
+            text = telegram.message.text
+            if (
+                text_batch is None
+                or text_batch.message.message is None
+                or text_batch.message.message.parse_mode != telegram.message.parse_mode
+                or len(text_batch.message.message.text) + 2 + len(text) > TELEGRAM_TEXT_LIMIT
+            ):
+                text_batch = _TelegramBatch(
+                    TelegramPushMessageV3(bot_id=bot_id, chat_id=chat_id, message=telegram.message),
+                    "telegram.message",
+                    [],
+                )
+                batches.append(text_batch)
+            else:
+                merged = TelegramPushMessageText(
+                    text=f"{text_batch.message.message.text}\n\n{text}", parse_mode=telegram.message.parse_mode
+                )
+                text_batch.message = text_batch.message.model_copy(update={"message": merged})
+            text_batch.sources.append((job, "telegram.message"))
+
+        media: list[tuple[TelegramPushMessageMediaDetail, NotificationJob, str]] = []
+        for job, telegram in items:
+            if telegram.photo is not None:
+                detail = TelegramPushMessageMediaDetail(
+                    type="photo", media=telegram.photo.photo, caption=telegram.photo.caption
+                )
+                media.append((detail, job, "telegram.photo"))
+            media.extend((x, job, "telegram.media") for x in telegram.media or [])
+        for i in range(0, len(media), TELEGRAM_MEDIA_GROUP_LIMIT):
+            chunk = media[i : i + TELEGRAM_MEDIA_GROUP_LIMIT]
+            sources = list({(job.id, channel): (job, channel) for _, job, channel in chunk}.values())
+            if len(chunk) == 1 and chunk[0][0].type == "photo":
+                photo = TelegramPushMessagePhoto(photo=chunk[0][0].media, caption=chunk[0][0].caption)
+                message = TelegramPushMessageV3(bot_id=bot_id, chat_id=chat_id, photo=photo)
+                batches.append(_TelegramBatch(message, "telegram.photo", sources))
+            else:
+                message = TelegramPushMessageV3(bot_id=bot_id, chat_id=chat_id, media=[x for x, _, _ in chunk])
+                batches.append(_TelegramBatch(message, "telegram.media", sources))
+        plans.append(batches)
+    return plans
+
+
+class NotificationQueue:
+    """持久化的推送队列
+
+    - 消息写入 SQLite 后立即返回, 后台任务负责推送
+    - 仅重试失败的渠道, 按指数退避并遵循 telegram 的 retry_after, 超过最大次数后标记为失败
+    - 短时间内发往同一 telegram 会话的消息会合并推送, 图片合并为 sendMediaGroup
+    """
+
+    def __init__(
+        self,
+        store: NotificationJobStore,
+        dispatcher: NotificationDispatcher,
+        *,
+        max_attempts: int = 8,
+        base_delay: float = 2,
+        max_delay: float = 600,
+        batch_window: float = 1,
+        batch_size: int = 100,
+        retention: float = 7 * 86400,
+        timer: Callable[[], float] = time.time,
+        sleep: Callable[[float], Awaitable[None]] = asyncio.sleep,
+    ):
+        self.store = store
+        self.dispatcher = dispatcher
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.batch_window = batch_window
+        self.batch_size = batch_size
+        self.retention = retention
+        self._timer = timer
+        self._sleep = sleep
+        self._wakeup = asyncio.Event()
+
+    async def enqueue(self, messages: list[PushMessageV3]) -> list[str]:
+        now = self._timer()
+        jobs = [NotificationJob(id=uuid.uuid4().hex, message=x, created_at=now, updated_at=now) for x in messages]
+        for job in jobs:
+            job.next_run_at = now
+            await asyncio.to_thread(self.store.save, job)
+        self._wakeup.set()
+        return [x.id for x in jobs]
+
+    async def get(self, id_: str) -> NotificationJob | None:
+        return await asyncio.to_thread(self.store.get, id_)
+
+    async def stats(self) -> dict[str, int]:
+        return await asyncio.to_thread(self.store.stats)
+
+    def get_delay(self, attempts: int, retry_after: float | None = None) -> float:
+        delay = min(self.max_delay, self.base_delay * 2.0 ** (attempts - 1))
+        delay = delay * random.uniform(0.8, 1.2)
+        return max(delay, retry_after or 0)
+
+    async def _push(self, jobs: list[NotificationJob]) -> dict[str, list[PushChannelResult]]:
+        results: dict[str, list[PushChannelResult]] = defaultdict(list)
+
+        async def push_rest(job: NotificationJob):
+            channels = [x for x in get_channels(job.message) if not x.startswith("telegram")]
+            rest = retain_channels(job.message, channels)
+            if rest is not None:
+                results[job.id].extend(await self.dispatcher.dispatch([rest]))
+
+        async def push_chat(batches: list[_TelegramBatch]):
+            for batch in batches:
+                push = {
+                    "telegram.message": batch.message.apush_text,
+                    "telegram.photo": batch.message.apush_photo,
+                    "telegram.media": batch.message.apush_media,
+                }[batch.channel]
+                result = await self.dispatcher.call(0, batch.channel, "telegram", push)
+                for job, channel in batch.sources:
+                    results[job.id].append(result.model_copy(update={"channel": channel}))
+
+        await asyncio.gather(*map(push_rest, jobs), *map(push_chat, batch_telegram(jobs)))
+        return results
+
+    async def process(self) -> int:
+        """推送所有到期的任务, 返回处理的任务数量"""
+        jobs = await asyncio.to_thread(self.store.due, self._timer(), self.batch_size)
+        if not jobs:
+            return 0
+        results = await self._push(jobs)
+        now = self._timer()
+        for job in jobs:
+            job.attempts += 1
+            job.updated_at = now
+            job_results = results.get(job.id, [])
+            for result in job_results:
+                job.results[result.channel] = result
+            # 同一渠道拆分为多次推送时可能有多个结果, 任一可重试的失败都会重试整个渠道
+            retryable = {x.channel for x in job_results if x.retryable}
+            failed = {k for k, v in job.results.items() if not v.ok}
+            remaining = retain_channels(job.message, retryable) if retryable else None
+            if remaining is not None and job.attempts < self.max_attempts:
+                retry_after = max((x.retry_after or 0 for x in job_results if x.channel in retryable), default=0)
+                job.message = remaining
+                job.next_run_at = now + self.get_delay(job.attempts, retry_after)
+                logger.info(
+                    f"[NotificationQueue] job {job.id} retry {sorted(retryable)} in {job.next_run_at - now:.1f}s"
+                )
+            else:
+                job.status = PushJobStatus.failed if failed else PushJobStatus.done
+                job.next_run_at = None
+                if failed:
+                    logger.warning(f"[NotificationQueue] job {job.id} failed: {sorted(failed)}")
+            await asyncio.to_thread(self.store.save, job)
+        return len(jobs)
+
+    async def run(self):
+        while True:
+            try:
+                while await self.process():
+                    pass
+                await asyncio.to_thread(self.store.purge, self._timer() - self.retention)
+                next_run_at = await asyncio.to_thread(self.store.next_run_at)
+            except Exception as e:
+                logger.exception(f"[NotificationQueue] process failed: {e}")
+                next_run_at = self._timer() + self.base_delay
+
+            timeout = None if next_run_at is None else max(next_run_at - self._timer(), 0)
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                continue
+            # 新消息到达后等待一小段时间, 合并突发的消息
+            await self._sleep(self.batch_window)
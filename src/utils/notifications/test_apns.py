@@ -0,0 +1,95 @@
+import asyncio
+
+import httpx
+import jwt
+import pytest
+import schemas.notifications.apple as apple
+from schemas.notifications import PushMessageV3
+from schemas.notifications.apple import AppleAPNSMessage, ApplePushEnvironment, ApplePushMessage, APNsTokenManager
+from utils.notifications.apns import APNsClient
+from utils.notifications.dispatcher import NotificationDispatcher
+from utils.notifications.queue import retain_channels
+
+
+def make_message(**kwargs) -> ApplePushMessage:
+    data = {"device_token": "token0", "aps": AppleAPNSMessage(alert="hello"), **kwargs}  # type: ignore[call-arg]
+    return ApplePushMessage(**data)
+
+
+def test_apns_token_manager_rotation(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(apple.time, "time", lambda: now[0])
+    manager = APNsTokenManager(refresh_interval=1800)
+    message = make_message()
+
+    token = manager.get_token(message.team_id, message.token_private_key, message.auth_key_id)
+    assert jwt.get_unverified_header(token)["kid"] == message.auth_key_id
+    now[0] += 1799
+    assert manager.get_token(message.team_id, message.token_private_key, message.auth_key_id) == token
+
+    # 超过 30 分钟后重新生成
+    now[0] += 1
+    rotated = manager.get_token(message.team_id, message.token_private_key, message.auth_key_id)
+    assert rotated != token
+    assert jwt.decode(rotated, options={"verify_signature": False})["iat"] == int(now[0])
+
+    manager.invalidate(message.team_id, message.token_private_key, message.auth_key_id)
+    now[0] += 1
+    assert manager.get_token(message.team_id, message.token_private_key, message.auth_key_id) != rotated
+
+
+@pytest.mark.asyncio
+async def test_apns_client_multiplexes_device_tokens():
+    requests: list[httpx.Request] = []
+    active, peak = [0], [0]
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        active[0] += 1
+        peak[0] = max(peak[0], active[0])
+        await asyncio.sleep(0.01)
+        active[0] -= 1
+        if request.url.path.endswith("/bad"):
+            return httpx.Response(400, json={"reason": "BadDeviceToken"})
+        return httpx.Response(200)
+
+    client = APNsClient(transport=httpx.MockTransport(handler))
+    message = make_message(device_tokens=["token1", "token2", "bad", "token1"])
+    results = await client.send_many(message)
+
+    assert [x.url.path for x in requests] == [f"/3/device/{x}" for x in ("token0", "token1", "token2", "bad")]
+    assert {x.url.host for x in requests} == {"api.push.apple.com"}
+    assert len({x.headers["authorization"] for x in requests}) == 1
+    assert peak[0] == 4
+    assert [isinstance(x, httpx.Response) for x in results] == [True, True, True, False]
+
+    # 同一 topic 与环境复用同一个客户端
+    assert client.get_client(message) is client.get_client(make_message())
+    sandbox = make_message(environment=ApplePushEnvironment.sandbox)
+    assert client.get_client(sandbox) is not client.get_client(message)
+    await client.send(sandbox)
+    assert requests[-1].url.host == "api.sandbox.push.apple.com"
+    await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_dispatcher_apple_channels():
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(500 if request.url.path.endswith("/token2") else 200)
+
+    dispatcher = NotificationDispatcher(transport=httpx.MockTransport(handler))
+    message = PushMessageV3(apple=make_message(device_tokens=["token1", "token2"]))
+    results = await dispatcher.dispatch([message])
+    assert [(x.channel, x.ok) for x in results] == [
+        ("apple:token0", True),
+        ("apple:token1", True),
+        ("apple:token2", False),
+    ]
+
+    # 重试时只推送失败的设备
+    retained = retain_channels(message, [x.channel for x in results if x.retryable])
+    assert retained is not None and retained.apple is not None
+    assert retained.apple.get_device_tokens() == ["token2"]
+
+    assert [x.channel for x in await dispatcher.dispatch([PushMessageV3(apple=make_message())])] == ["apple"]
+    await dispatcher.aclose()
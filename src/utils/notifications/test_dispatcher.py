@@ -0,0 +1,64 @@
+import asyncio
+from typing import Any
+
+import httpx
+import pytest
+from schemas.notifications import PushMessagesV3
+from utils.notifications.dispatcher import NotificationDispatcher
+
+
+def make_messages(count: int) -> PushMessagesV3:
+    data: dict[str, Any] = {
+        "messages": [
+            {
+                "telegram": {
+                    "bot_id": "bot",
+                    "chat_id": "1",
+                    "message": {"text": f"text {i}"},
+                    "photo": {"photo": "https://example.com/a.png"},
+                },
+                "bark": {"device_key": "fail" if i == 0 else "ok", "title": "t", "body": f"body {i}"},
+                "gotify": {"token": "token", "detail": {"message": "m"}},
+            }
+            for i in range(count)
+        ]
+    }
+    return PushMessagesV3(**data)
+
+
+@pytest.mark.asyncio
+async def test_notification_dispatcher():
+    active = {"bark": 0}
+    peak = {"bark": 0}
+    telegram_calls: list[str] = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.host == "api.day.app":
+            active["bark"] += 1
+            peak["bark"] = max(peak["bark"], active["bark"])
+            await asyncio.sleep(0.01)
+            active["bark"] -= 1
+            if b'"fail"' in request.content:
+                return httpx.Response(500, text="server error")
+        if request.url.host == "api.telegram.org":
+            telegram_calls.append(request.url.path.rsplit("/", 1)[1])
+            await asyncio.sleep(0.01)
+        return httpx.Response(200, json={"ok": True})
+
+    dispatcher = NotificationDispatcher(concurrency={"bark": 2}, transport=httpx.MockTransport(handler))
+    results = await dispatcher.dispatch(make_messages(5).messages)
+
+    assert [(x.index, x.channel) for x in results[:4]] == [
+        (0, "telegram.message"),
+        (0, "telegram.photo"),
+        (0, "bark"),
+        (0, "gotify"),
+    ]
+    failed = [x for x in results if not x.ok]
+    assert [(x.index, x.channel, x.status_code) for x in failed] == [(0, "bark", 500)]
+    assert len(results) == 20
+    assert peak["bark"] <= 2
+    # 同一条消息的 telegram 渠道按顺序推送
+    assert telegram_calls.count("sendMessage") == telegram_calls.count("sendPhoto") == 5
+    assert dispatcher.get_client("telegram") is dispatcher.get_client("telegram")
+    await dispatcher.aclose()
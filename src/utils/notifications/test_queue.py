@@ -0,0 +1,134 @@
+import json
+
+import httpx
+import pytest
+from schemas.notifications import PushJobStatus, PushMessageV3
+from schemas.notifications.bark import BarkPushMessage
+from schemas.notifications.telegram import (
+    TelegramPushMessagePhoto,
+    TelegramPushMessageText,
+    TelegramPushMessageV3,
+)
+from utils.notifications.dispatcher import NotificationDispatcher
+from utils.notifications.queue import NotificationJobStore, NotificationQueue, retain_channels
+
+
+class Clock:
+    def __init__(self):
+        self.now: float = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def make_queue(tmp_path, handler, clock: Clock) -> NotificationQueue:
+    dispatcher = NotificationDispatcher(transport=httpx.MockTransport(handler))
+    return NotificationQueue(NotificationJobStore(tmp_path / "notifications.db"), dispatcher, timer=clock)
+
+
+def telegram_message(text: str | None = None, photo: str | None = None) -> PushMessageV3:
+    return PushMessageV3(
+        telegram=TelegramPushMessageV3(
+            bot_id="bot",
+            chat_id="chat",
+            message=TelegramPushMessageText(text=text, parse_mode=None) if text else None,
+            photo=TelegramPushMessagePhoto(photo=photo) if photo else None,
+        )
+    )
+
+
+def test_retain_channels():
+    message = telegram_message("hi", "https://example.com/a.png")
+    message.bark = BarkPushMessage(device_key="key", title="title", body="body")  # type: ignore[call-arg]
+    retained = retain_channels(message, ["telegram.photo"])
+    assert retained is not None and retained.bark is None and retained.telegram is not None
+    assert retained.telegram.message is None and retained.telegram.photo is not None
+    assert retain_channels(message, []) is None
+
+
+@pytest.mark.asyncio
+async def test_notification_queue_retry_after(tmp_path):
+    requests: list[httpx.Request] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        if "day.app" in request.url.host:
+            return httpx.Response(200)
+        if len([x for x in requests if x.url.host == "api.telegram.org"]) == 1:
+            return httpx.Response(429, json={"ok": False, "parameters": {"retry_after": 30}})
+        return httpx.Response(200, json={"ok": True})
+
+    clock = Clock()
+    queue = make_queue(tmp_path, handler, clock)
+    message = telegram_message("hello")
+    message.bark = BarkPushMessage(device_key="key", title="title", body="body")  # type: ignore[call-arg]
+    (id_,) = await queue.enqueue([message])
+
+    assert await queue.process() == 1
+    job = await queue.get(id_)
+    assert job is not None and job.status == PushJobStatus.queued and job.attempts == 1
+    assert job.next_run_at is not None and job.next_run_at - clock.now >= 30
+    assert job.results["telegram.message"].retry_after == 30
+
+    # 未到重试时间不推送, 重试时只推送失败的渠道
+    assert await queue.process() == 0
+    clock.now = job.next_run_at
+    assert await queue.process() == 1
+    job = await queue.get(id_)
+    assert job is not None and job.status == PushJobStatus.done and job.attempts == 2
+    assert [x.url.host for x in requests].count("api.day.app") == 1
+    assert await queue.stats() == {"queued": 0, "done": 1, "failed": 0}
+
+
+@pytest.mark.asyncio
+async def test_notification_queue_gives_up(tmp_path):
+    clock = Clock()
+    queue = make_queue(tmp_path, lambda _: httpx.Response(400, json={"ok": False}), clock)
+    (id_,) = await queue.enqueue([telegram_message("hello")])
+    assert await queue.process() == 1
+    job = await queue.get(id_)
+    # 非限流的客户端错误不重试
+    assert job is not None and job.status == PushJobStatus.failed and job.next_run_at is None
+
+
+@pytest.mark.asyncio
+async def test_notification_queue_batches_telegram(tmp_path):
+    requests: list[httpx.Request] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(200, json={"ok": True})
+
+    queue = make_queue(tmp_path, handler, Clock())
+    messages = [telegram_message(f"text {i}", f"https://example.com/{i}.png") for i in range(12)]
+    ids = await queue.enqueue(messages)
+    assert await queue.process() == 12
+
+    methods = [x.url.path.rsplit("/", 1)[1] for x in requests]
+    assert methods == ["sendMessage", "sendMediaGroup", "sendMediaGroup"]
+    assert json.loads(requests[0].content)["text"] == "\n\n".join(f"text {i}" for i in range(12))
+    assert [len(json.loads(x.content)["media"]) for x in requests[1:]] == [10, 2]
+    for id_ in ids:
+        job = await queue.get(id_)
+        assert job is not None and job.status == PushJobStatus.done
+        assert set(job.results) == {"telegram.message", "telegram.photo"}
+
+
+@pytest.mark.asyncio
+async def test_notification_queue_persistence(tmp_path):
+    clock = Clock()
+    queue = make_queue(tmp_path, lambda _: httpx.Response(200, json={"ok": True}), clock)
+    (id_,) = await queue.enqueue([telegram_message("hello")])
+    queue.store.close()
+
+    # 重启后继续推送未完成的任务
+    queue = make_queue(tmp_path, lambda _: httpx.Response(200, json={"ok": True}), clock)
+    assert await queue.stats() == {"queued": 1, "done": 0, "failed": 0}
+    assert await queue.process() == 1
+    job = await queue.get(id_)
+    assert job is not None and job.status == PushJobStatus.done
+    assert job.message.telegram is not None and job.message.telegram.message is not None
+
+    clock.now += queue.retention + 1
+    assert queue.store.purge(clock.now - queue.retention) == 1
+    assert await queue.get(id_) is None
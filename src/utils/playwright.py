@@ -2,25 +2,180 @@ import asyncio
 import logging
 import time
 from abc import ABC
+from collections.abc import AsyncIterator, Awaitable, Callable
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
 
 from playwright import async_api
 from playwright._impl._errors import TargetClosedError
+from settings import get_settings
 
 logger = logging.getLogger(__file__)
 
 
+class BrowserPoolBusy(Exception):
+    pass
+
+
+@dataclass
+class _BrowserSlot:
+    browser: async_api.Browser | None = None
+    uses: int = 0
+
+
+class BrowserPool:
+    """固定数量的 Chromium 实例, 每个任务使用独立的无痕上下文
+
+    - 浏览器在首次使用时启动, 使用 max_uses 次或崩溃后关闭并重新启动
+    - 所有浏览器都在使用时任务排队等待, 排队的任务超过 max_queue 时抛出 BrowserPoolBusy
+    """
+
+    def __init__(
+        self,
+        size: int = 2,
+        *,
+        max_uses: int = 50,
+        max_queue: int = 16,
+        headless: bool = True,
+        launch: Callable[[], Awaitable[async_api.Browser]] | None = None,
+    ):
+        self.size = size
+        self.max_uses = max_uses
+        self.max_queue = max_queue
+        self.headless = headless
+        self._launch = launch
+        self._playwright: async_api.Playwright | None = None
+        self._playwright_lock = asyncio.Lock()
+        self._slots: asyncio.Queue[_BrowserSlot] = asyncio.Queue()
+        for _ in range(size):
+            self._slots.put_nowait(_BrowserSlot())
+        self._waiting = 0
+        self._closed = False
+
+    async def launch(self) -> async_api.Browser:
+        if self._launch is not None:
+            return await self._launch()
+        async with self._playwright_lock:
+            if self._playwright is None:
+                self._playwright = await async_api.async_playwright().start()
+        return await self._playwright.chromium.launch(headless=self.headless)
+
+    @staticmethod
+    async def _close_browser(slot: _BrowserSlot):
+        browser, slot.browser, slot.uses = slot.browser, None, 0
+        if browser is None:
+            return
+        try:
+            await browser.close()
+        except Exception as e:
+            logger.warning(f"[BrowserPool] close browser failed: {e}")
+
+    @asynccontextmanager
+    async def browser(self) -> AsyncIterator[async_api.Browser]:
+        if self._closed:
+            raise RuntimeError("BrowserPool is closed")
+        if self._slots.empty() and self._waiting >= self.max_queue:
+            raise BrowserPoolBusy(f"too many pending browser tasks: {self._waiting}")
+        self._waiting += 1
+        try:
+            slot = await self._slots.get()
+        finally:
+            self._waiting -= 1
+
+        try:
+            if slot.browser is not None and (slot.uses >= self.max_uses or not slot.browser.is_connected()):
+                logger.debug(f"[BrowserPool] recycle browser after {slot.uses} uses")
+                await self._close_browser(slot)
+            if slot.browser is None:
+                slot.browser = await self.launch()
+            slot.uses += 1
+            yield slot.browser
+        except TargetClosedError:
+            await self._close_browser(slot)
+            raise
+        finally:
+            if slot.browser is not None and not slot.browser.is_connected():
+                await self._close_browser(slot)
+            self._slots.put_nowait(slot)
+
+    @asynccontextmanager
+    async def new_context(self, **kwargs) -> AsyncIterator[async_api.BrowserContext]:
+        """获取浏览器并创建独立的上下文, 退出时关闭上下文"""
+        async with self.browser() as browser:
+            context = await browser.new_context(**kwargs)
+            try:
+                yield context
+            finally:
+                try:
+                    await context.close()
+                except Exception as e:
+                    logger.warning(f"[BrowserPool] close context failed: {e}")
+
+    def stats(self) -> dict:
+        return {"size": self.size, "idle": self._slots.qsize(), "waiting": self._waiting}
+
+    async def aclose(self):
+        self._closed = True
+        while not self._slots.empty():
+            await self._close_browser(self._slots.get_nowait())
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+
+
+_browser_pool: BrowserPool | None = None
+
+
+def get_browser_pool() -> BrowserPool:
+    """全局共享的浏览器池"""
+    global _browser_pool
+    if _browser_pool is None:
+        settings = get_settings()
+        _browser_pool = BrowserPool(
+            settings.playwright_browser_pool_size,
+            max_uses=settings.playwright_browser_max_uses,
+            max_queue=settings.playwright_browser_max_queue,
+            headless=settings.playwright_headless,
+        )
+    return _browser_pool
+
+
+async def close_browser_pool():
+    global _browser_pool
+    if _browser_pool is not None:
+        await _browser_pool.aclose()
+        _browser_pool = None
+
+
 class AsyncPlaywright(ABC):
+    """在浏览器中打开页面, 返回 WATCH_URL_PATH 对应请求的响应内容
+
+    - 子类可通过 BLOCK_RESOURCE_TYPES 与 BLOCK_URL_PATTERNS 拦截不需要的资源
+    - 读取到监听的响应后立即返回, 不等待页面加载完成
+    - 单个任务的总耗时不超过 TIMEOUT 秒, 包括等待浏览器的时间
+    """
+
     WATCH_URL_PATH = ""
-    HEADLESS = True
+    BLOCK_RESOURCE_TYPES: frozenset[str] = frozenset({"image", "media", "font", "imageset", "texttrack"})
+    BLOCK_URL_PATTERNS: tuple[str, ...] = (
+        "google-analytics.com",
+        "googletagmanager.com",
+        "doubleclick.net",
+        "hm.baidu.com",
+    )
+    TIMEOUT: float | None = None
 
     def __init__(
         self,
         url: str,
         user_agent: str = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/140.0.0.0 Safari/537.36",
+        *,
+        pool: BrowserPool | None = None,
     ):
         self.url = url
         self._cookies: list = []
         self.user_agent = user_agent
+        self.pool = pool
         self._start_ts = time.time()
         self.fut: asyncio.Future[str | dict] = asyncio.Future()
 
@@ -33,27 +188,51 @@ class AsyncPlaywright(ABC):
         cookies = [{"name": k, "value": v, "url": url} for k, v in _cookies_dict.items()]
         return cookies
 
+    def get_timeout(self) -> float:
+        return self.TIMEOUT or get_settings().playwright_task_timeout
+
+    def should_block(self, resource_type: str, url: str) -> bool:
+        if resource_type in self.BLOCK_RESOURCE_TYPES:
+            return self.WATCH_URL_PATH not in url
+        return any(x in url for x in self.BLOCK_URL_PATTERNS)
+
+    async def on_route(self, route: async_api.Route):
+        request = route.request
+        try:
+            if self.should_block(request.resource_type, request.url):
+                await route.abort()
+            else:
+                await route.continue_()
+        except TargetClosedError:
+            pass
+
     async def run(self):
         logger.debug(f"{self.__class__.__name__} run {self.url}")
+        timeout = self.get_timeout()
+        try:
+            return await asyncio.wait_for(self._run(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"{self.__class__.__name__} [run] 超时: {self.url}")
+            raise TimeoutError(f"{self.__class__.__name__} timed out after {timeout}s: {self.url}")
+
+    async def _run(self):
         url = self.url
         cookies = self._cookies
-        async with async_api.async_playwright() as playwright:
-            logger.debug(f"{self.__class__.__name__} enter playwright context: {self.url}")
-            chromium = playwright.chromium
-            browser = await chromium.launch(headless=self.__class__.HEADLESS)
-            logger.debug(f"{self.__class__.__name__} new browser: {self.url}")
-            browser = await browser.new_context(user_agent=self.user_agent)
+        pool = self.pool or get_browser_pool()
+        async with pool.new_context(user_agent=self.user_agent) as context:
             logger.debug(f"{self.__class__.__name__} new context: {self.url}")
             if cookies:
-                await browser.add_cookies(cookies)  # type: ignore
+                await context.add_cookies(cookies)  # type: ignore
+            await context.route("**/*", self.on_route)
 
-            page = await browser.new_page()
+            page = await context.new_page()
             logger.debug(f"{self.__class__.__name__} new page: {self.url}")
             page.on("response", self.on_response)
 
             try:
                 logger.debug(f"{self.__class__.__name__} goto page: {self.url}")
-                await page.goto(url)
+                # 页面开始加载即返回, 监听的请求可能早于 load 事件完成
+                await page.goto(url, wait_until="commit")
                 logger.debug(f"{self.__class__.__name__} wait for: {self.url}")
                 result = await self.fut
                 logger.debug(f"{self.__class__.__name__} fetch result done, {self.url}")
@@ -61,9 +240,6 @@ class AsyncPlaywright(ABC):
             except Exception as e:
                 logger.warning(f"{self.__class__.__name__} [run] 运行错误, 请检查用户 id: {self.url}")
                 raise e
-            finally:
-                await browser.close()
-                logger.debug(f"{self.__class__.__name__} close browser: {self.url}")
 
     async def on_response(self, response: async_api.Response):
         try:
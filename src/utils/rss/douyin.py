@@ -2,6 +2,8 @@ import asyncio
 import logging
 import random
 import re
+import time
+from collections.abc import Awaitable, Callable
 from dataclasses import dataclass
 from datetime import datetime
 from typing import Any
@@ -10,6 +12,7 @@ import pytz
 from schemas.rss.jsonfeed import JSONFeedItem
 from settings import get_settings
 from utils.basic import ShelveStorage, URLToolkit  # type: ignore
+from utils.douyin.video import DOUYIN_BLOCK_URL_PATTERNS
 from utils.playwright import AsyncPlaywright
 
 
@@ -31,7 +34,7 @@ class AccessHistory:
     async def get_history(shuffle: bool = True) -> list[DouyinPlaywrightTask]:
         async with AccessHistory.lock:
             with AccessHistory.storage:
-                items = await asyncio.to_thread(AccessHistory.storage.iterall)
+                items = await asyncio.to_thread(lambda: list(AccessHistory.storage.iterall()))
 
             result = [DouyinPlaywrightTask(*item) for item in items]
             if shuffle:
@@ -47,6 +50,7 @@ class AccessHistory:
 
 class DouyinPlaywright(AsyncPlaywright):
     WATCH_URL_PATH = "/web/aweme/post"
+    BLOCK_URL_PATTERNS = DOUYIN_BLOCK_URL_PATTERNS
 
 
 def to_feeds(username: str, body: dict, *, video_autoplay: bool = True) -> list[JSONFeedItem]:
@@ -134,3 +138,157 @@ def to_feeds(username: str, body: dict, *, video_autoplay: bool = True) -> list[
 logger = logging.getLogger(__file__)
 
 Headless = get_settings().rss_douyin_user_headless
+
+
+@dataclass
+class DouyinUserFeedsEntry:
+    items: list[JSONFeedItem]
+    fetched_at: float
+
+
+async def fetch_user_feeds(username: str, cookie: str) -> list[JSONFeedItem]:
+    url = f"https://www.douyin.com/user/{username}"
+    play = DouyinPlaywright(url)
+    if cookie:
+        play.add_cookies(play.cookies_by_str(cookie, "https://www.douyin.com"))
+    body = await play.run()
+    assert isinstance(body, dict)
+    return to_feeds(username, body)
+
+
+class DouyinUserFeeds:
+    """抖音用户动态的持久化缓存
+
+    - 缓存未过期时直接返回, 过期后先返回旧数据并在后台刷新 (stale-while-revalidate)
+    - 同一用户同时只有一个刷新任务, 所有刷新共用 rss_douyin_user_semaphore 并发上限
+    - prefetch 定时遍历访问记录, 提前刷新所有用户, 请求基本都能命中缓存
+    """
+
+    def __init__(
+        self,
+        path: str,
+        *,
+        ttl: float = 1800,
+        concurrency: int = 5,
+        timeout: float = 60,
+        fetch: Callable[[str, str], Awaitable[list[JSONFeedItem]]] = fetch_user_feeds,
+        timer: Callable[[], float] = time.time,
+    ):
+        self.storage = ShelveStorage(path)
+        self.ttl = ttl
+        self.timeout = timeout
+        self._fetch = fetch
+        self._timer = timer
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._entries: dict[str, DouyinUserFeedsEntry] | None = None
+        self._pending: dict[str, asyncio.Task[DouyinUserFeedsEntry]] = {}
+
+    def _load(self) -> dict[str, DouyinUserFeedsEntry]:
+        with self.storage:
+            items = list(self.storage.iterall())
+        return {k: DouyinUserFeedsEntry([JSONFeedItem(**x) for x in v["items"]], v["fetched_at"]) for k, v in items}
+
+    async def _get_entries(self) -> dict[str, DouyinUserFeedsEntry]:
+        if self._entries is None:
+            self._entries = await asyncio.to_thread(self._load)
+        return self._entries
+
+    def _save(self, username: str, entry: DouyinUserFeedsEntry):
+        value = {"items": [x.model_dump(mode="json") for x in entry.items], "fetched_at": entry.fetched_at}
+        with self.storage:
+            self.storage[username] = value
+
+    async def _refresh(self, username: str, cookie: str) -> DouyinUserFeedsEntry:
+        async with self._semaphore:
+            logger.debug(f"[DouyinUserFeeds] refresh {username}")
+            items = await asyncio.wait_for(self._fetch(username, cookie), self.timeout)
+        entry = DouyinUserFeedsEntry(items, self._timer())
+        (await self._get_entries())[username] = entry
+        await asyncio.to_thread(self._save, username, entry)
+        return entry
+
+    def refresh(self, username: str, cookie: str) -> asyncio.Task[DouyinUserFeedsEntry]:
+        task = self._pending.get(username)
+        if task is None:
+            task = self._pending[username] = asyncio.create_task(self._refresh(username, cookie))
+            task.add_done_callback(self._on_refreshed(username))
+        return task
+
+    def _on_refreshed(self, username: str) -> Callable[[asyncio.Task], None]:
+        def callback(task: asyncio.Task):
+            self._pending.pop(username, None)
+            if not task.cancelled() and task.exception() is not None:
+                logger.warning(f"[DouyinUserFeeds] refresh {username} failed: {task.exception()!r}")
+
+        return callback
+
+    def is_fresh(self, entry: DouyinUserFeedsEntry) -> bool:
+        return self._timer() - entry.fetched_at < self.ttl
+
+    async def get(self, username: str, cookie: str) -> list[JSONFeedItem]:
+        entry = (await self._get_entries()).get(username)
+        if entry is None:
+            entry = await asyncio.shield(self.refresh(username, cookie))
+        elif not self.is_fresh(entry):
+            self.refresh(username, cookie)
+        return entry.items
+
+    async def prefetch(self, tasks: list[DouyinPlaywrightTask], jitter: float = 0) -> int:
+        """刷新缓存已过期的用户, 每个刷新任务之间随机等待 0 ~ jitter 秒, 返回刷新成功的数量"""
+        entries = await self._get_entries()
+        refreshes = []
+        for task in tasks:
+            entry = entries.get(task.username)
+            if entry is not None and self.is_fresh(entry):
+                continue
+            refreshes.append(self.refresh(task.username, task.cookie))
+            if jitter:
+                await asyncio.sleep(random.uniform(0, jitter))
+        results = await asyncio.gather(*refreshes, return_exceptions=True)
+        return len([x for x in results if not isinstance(x, BaseException)])
+
+    async def run(self, start_wait: float, interval: float, jitter: float):
+        await asyncio.sleep(start_wait)
+        while True:
+            try:
+                tasks = await AccessHistory.get_history()
+                count = await self.prefetch(tasks, jitter)
+                logger.info(f"[DouyinUserFeeds] prefetch {count}/{len(tasks)} users")
+            except Exception as e:
+                logger.exception(f"[DouyinUserFeeds] prefetch failed: {e}")
+            await asyncio.sleep(interval * random.uniform(0.9, 1.1))
+
+    async def aclose(self):
+        tasks = list(self._pending.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+_douyin_user_feeds: DouyinUserFeeds | None = None
+
+
+def get_douyin_user_feeds() -> DouyinUserFeeds:
+    global _douyin_user_feeds
+    if _douyin_user_feeds is None:
+        settings = get_settings()
+        _douyin_user_feeds = DouyinUserFeeds(
+            settings.rss_douyin_user_feeds_storage,
+            ttl=settings.rss_douyin_user_feeds_cache_time,
+            concurrency=settings.rss_douyin_user_semaphore,
+            timeout=settings.rss_douyin_user_auto_fetch_timeout,
+        )
+    return _douyin_user_feeds
+
+
+async def close_douyin_user_feeds():
+    global _douyin_user_feeds
+    if _douyin_user_feeds is not None:
+        await _douyin_user_feeds.aclose()
+        _douyin_user_feeds = None
+
+
+async def get_user_feeds(username: str, cookie: str) -> list[JSONFeedItem]:
+    """记录访问并从缓存返回用户动态, 记录的用户会被定时预取"""
+    await AccessHistory.append(username, cookie)
+    return await get_douyin_user_feeds().get(username, cookie)
@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+from schemas.rss.jsonfeed import JSONFeedItem
+from utils.rss.douyin import DouyinPlaywrightTask, DouyinUserFeeds
+
+
+class Clock:
+    def __init__(self):
+        self.now: float = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def make_feeds(tmp_path, clock: Clock, calls: list) -> DouyinUserFeeds:
+    async def fetch(username: str, cookie: str) -> list[JSONFeedItem]:
+        calls.append(username)
+        await asyncio.sleep(0.01)
+        if username == "broken":
+            raise ValueError("broken")
+        return [JSONFeedItem(id=f"douyin.user.{username}.{len(calls)}", content_html="<br>")]  # type: ignore[call-arg]
+
+    return DouyinUserFeeds(str(tmp_path / "feeds"), ttl=60, concurrency=2, fetch=fetch, timer=clock)
+
+
+@pytest.mark.asyncio
+async def test_douyin_user_feeds_stale_while_revalidate(tmp_path):
+    clock, calls = Clock(), []
+    feeds = make_feeds(tmp_path, clock, calls)
+
+    # 并发的首次请求只抓取一次
+    results = await asyncio.gather(*(feeds.get("alice", "") for _ in range(3)))
+    assert calls == ["alice"] and all(x[0].id == "douyin.user.alice.1" for x in results)
+    assert (await feeds.get("alice", ""))[0].id == "douyin.user.alice.1"
+
+    # 过期后返回旧数据并在后台刷新
+    clock.now += 61
+    assert (await feeds.get("alice", ""))[0].id == "douyin.user.alice.1"
+    await asyncio.sleep(0.05)
+    assert calls == ["alice", "alice"]
+    assert (await feeds.get("alice", ""))[0].id == "douyin.user.alice.2"
+
+    # 重启后从持久化缓存读取
+    feeds = make_feeds(tmp_path, clock, calls)
+    assert (await feeds.get("alice", ""))[0].id == "douyin.user.alice.2"
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_douyin_user_feeds_prefetch(tmp_path):
+    clock, calls = Clock(), []
+    feeds = make_feeds(tmp_path, clock, calls)
+    await feeds.get("alice", "")
+
+    tasks = [DouyinPlaywrightTask(x, "") for x in ("alice", "bob", "carol", "broken")]
+    assert await feeds.prefetch(tasks) == 2
+    assert sorted(calls) == ["alice", "bob", "broken", "carol"]
+
+    with pytest.raises(ValueError):
+        await feeds.get("broken", "")
+    await feeds.aclose()
@@ -0,0 +1,563 @@
+"""Loon 插件解析
+
+https://nsloon.app/docs/Plugin/
+
+单次遍历插件文本, 按 section 分发到预编译的正则表, 生成与 Stash 无关的中间结构 `LoonPlugin`,
+再由 `LoonPlugin.to_stash_override` 渲染为 Stash 覆写
+"""
+
+import json
+import logging
+import re
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+from schemas.loon import LoonArgument
+
+logger = logging.getLogger(__file__)
+
+
+SECTION_PATTERN = re.compile(r"^\[(.*)?\]")
+ARGUMENT_FIELD_PATTERN = re.compile(r"\{([^}]+)\}")
+ARGUMENT_VALUE_TOKEN_PATTERN = re.compile(r"[\[\](),]")
+JQ_PATH_PATTERN = re.compile(r'jq-path="(http.*)"')
+
+SCRIPT_CRON_PATTERN = re.compile(r"(cron) (.*)")
+SCRIPT_GENERIC_PATTERN = re.compile(r"(generic) (.*)")
+SCRIPT_HTTP_PATTERN = re.compile(r"(http-request|http-response) (\S+) (.*)")
+
+
+class LoonRewriteKind:
+    url = "url"
+    header = "header"
+    request_body = "request-body"
+    response_body = "response-body"
+    bad_header = "bad-header"
+    bad_redirect = "bad-redirect"
+
+
+@dataclass(frozen=True)
+class LoonRewritePattern:
+    """rewrite 分发表的一项
+
+    `guards` 中的子串都是 `pattern` 匹配成功的必要条件, 先做子串判断, 避免对每行依次执行全部正则
+    """
+
+    kind: str
+    pattern: re.Pattern
+    render: Callable[[tuple[str, ...]], str]
+    guards: tuple[str, ...] = ()
+    min_http_count: int = 1
+
+    def match(self, line: str) -> tuple[str, ...] | None:
+        if line.count("http") < self.min_http_count:
+            return None
+        for guard in self.guards:
+            if guard not in line:
+                return None
+        matched = self.pattern.match(line)
+        return matched.groups() if matched else None
+
+
+# 按匹配优先级排序
+# https://nsloon.app/docs/Rewrite/
+REWRITE_PATTERNS: tuple[LoonRewritePattern, ...] = (
+    # URL 类型复写
+    LoonRewritePattern(
+        LoonRewriteKind.url,
+        re.compile(r"(.*?http.*?) header (.*?http.*)"),
+        lambda groups: f"{groups[0]} {groups[1]} transparent",
+        guards=(" header ",),
+        min_http_count=2,
+    ),
+    # redirect
+    LoonRewritePattern(
+        LoonRewriteKind.url,
+        re.compile(r"(.*?http.*?) (\d{3}) (.*?http.*)"),
+        lambda groups: f"{groups[0]} {groups[2]} {groups[1]}",
+        min_http_count=2,
+    ),
+    # reject
+    LoonRewritePattern(
+        LoonRewriteKind.url,
+        re.compile(r"(.*?http.*?) (reject.*)"),
+        lambda groups: f"{groups[0]} - {groups[1]}",
+        guards=(" reject",),
+    ),
+    # reject-200
+    LoonRewritePattern(
+        LoonRewriteKind.url,
+        re.compile(r"(.*) (reject-200)"),
+        lambda groups: f"{groups[0]} - {groups[1]}",
+        guards=(" reject-200",),
+        min_http_count=0,
+    ),
+    # request header
+    LoonRewritePattern(
+        LoonRewriteKind.header,
+        re.compile(r"(.*?http.*?) (header-add|header-del|header-replace|header-replace-regex) (.*)"),
+        lambda groups: " ".join(groups),
+        guards=(" header-",),
+    ),
+    # response header
+    LoonRewritePattern(
+        LoonRewriteKind.header,
+        re.compile(
+            r"(.*?http.*?) (response-header-add|response-header-del|response-header-replace|response-header-replace-regex) (.*)"
+        ),
+        lambda groups: " ".join(groups),
+        guards=(" response-header-",),
+    ),
+    # request body
+    LoonRewritePattern(
+        LoonRewriteKind.request_body,
+        re.compile(
+            r"(.*?http.*?) (request-body-replace-regex|request-body-json-add|request-body-json-replace|request-body-json-del|request-body-json-jq) (.*)"
+        ),
+        lambda groups: " ".join(groups),
+        guards=(" request-body-",),
+    ),
+    # response body
+    LoonRewritePattern(
+        LoonRewriteKind.response_body,
+        re.compile(
+            r"(.*?http.*?) (response-body-replace-regex|response-body-json-add|response-body-json-replace|response-body-json-del|response-body-json-jq) (.*)"
+        ),
+        lambda groups: " ".join(groups),
+        guards=(" response-body-",),
+    ),
+    # header ?
+    LoonRewritePattern(
+        LoonRewriteKind.bad_header,
+        re.compile(r"(.*?http.*?) (header) (.*)"),
+        lambda groups: " ".join(groups),
+        guards=(" header ",),
+    ),
+    # redirect ?
+    LoonRewritePattern(
+        LoonRewriteKind.bad_redirect,
+        re.compile(r"(.*?http.*?) (.*?) (\d{3})"),
+        lambda groups: " ".join(groups),
+    ),
+)
+
+
+@dataclass
+class LoonBodyRewrite:
+    url: str
+    type: str
+    content: str
+    jq_path: str | None = None
+
+    def render(self, jq_contents: dict[str, str] | None = None) -> str:
+        content = self.content
+        if self.jq_path is not None:
+            content = (jq_contents or {})[self.jq_path]
+        return f"{self.url} {self.type} {content}"
+
+
+@dataclass
+class LoonScript:
+    match: str
+    name: str
+    type: str
+    script_path: str
+    require_body: bool = False
+    binary_mode: bool = False
+    timeout: int = 20
+    argument: str = ""
+
+
+@dataclass
+class LoonPlugin:
+    metadata: dict[str, str] = field(default_factory=dict)
+    arguments: dict[str, LoonArgument] = field(default_factory=dict)
+    mitm: list[str] = field(default_factory=list)
+    rules: list[str] = field(default_factory=list)
+    url_rewrites: list[str] = field(default_factory=list)
+    header_rewrites: list[str] = field(default_factory=list)
+    body_rewrites: list[LoonBodyRewrite] = field(default_factory=list)
+    scripts: list[LoonScript] = field(default_factory=list)
+
+    @property
+    def jq_paths(self) -> list[str]:
+        """body-rewrite 中需要远程获取的 jq 脚本地址, 已去重并保持顺序"""
+        return list(dict.fromkeys(x.jq_path for x in self.body_rewrites if x.jq_path is not None))
+
+    def to_stash_override(
+        self,
+        *,
+        name: str | None = None,
+        desc: str | None = None,
+        category: str | None = None,
+        icon: str | None = None,
+        script_arguments: dict[str, str] | None = None,
+        jq_contents: dict[str, str] | None = None,
+    ) -> dict[str, Any]:
+        override: dict[str, Any] = dict(self.metadata)
+        if name is not None:
+            override["name"] = name
+        if category is not None:
+            override["category"] = category
+        if icon is not None:
+            override["icon"] = icon
+        if desc is not None:
+            override["desc"] = desc
+
+        if self.mitm:
+            override.setdefault("http", {})
+            override["http"]["mitm"] = list(self.mitm)
+        if self.rules:
+            override["rules"] = list(self.rules)
+        if self.url_rewrites:
+            override.setdefault("http", {})
+            override["http"]["url-rewrite"] = list(self.url_rewrites)
+        if self.body_rewrites:
+            override.setdefault("http", {})
+            override["http"]["body-rewrite"] = [x.render(jq_contents) for x in self.body_rewrites]
+        if self.header_rewrites:
+            override.setdefault("http", {})
+            override["http"]["header-rewrite"] = list(self.header_rewrites)
+        if self.scripts:
+            scripts = []
+            script_providers = {}
+            for script in self.scripts:
+                scripts.append(
+                    {
+                        "match": script.match,
+                        "name": script.name,
+                        "type": script.type,
+                        "require-body": script.require_body,
+                        "argument": rewrite_loon_argument(script.argument, self.arguments, script_arguments),
+                        "binary-mode": script.binary_mode,
+                        "timeout": script.timeout,
+                    }
+                )
+                script_providers[script.name] = {"url": script.script_path, "interval": 86400}
+            override.setdefault("http", {})
+            override["http"]["script"] = scripts
+            override["script-providers"] = script_providers
+        return override
+
+
+def rewrite_loon_argument(
+    argument: str, loon_arguments: dict[str, LoonArgument], overrideScriptArguments: dict | None
+) -> str | None:
+    """将 Loon 脚本参数重写为 Stash 可用的脚本参数，填充 Argument 默认值"""
+    if overrideScriptArguments is None:
+        overrideScriptArguments = {}
+
+    if not argument:
+        return ""
+
+    body = {}
+    for name in ARGUMENT_FIELD_PATTERN.findall(argument):
+        value = overrideScriptArguments.get(name) or loon_arguments[name].default
+        if value == "true":
+            value = True
+        if value == "false":
+            value = False
+        body[name] = value
+    return json.dumps(body, ensure_ascii=False)
+
+
+def _find_argument_value_end(content: str, start: int) -> int:
+    """返回 argument 值的结束位置, 括号内的逗号不作为分隔符"""
+    prefix: list[str] = []
+    for matched in ARGUMENT_VALUE_TOKEN_PATTERN.finditer(content, start):
+        char = matched.group()
+        index = matched.start()
+        if char == ",":
+            if not prefix:
+                return index
+        elif char in "[(":
+            prefix.append(char)
+        elif char == ")":
+            if not prefix or prefix[-1] != "(":
+                raise ValueError(f"bad character at index of: {index}\ncontent:{content}")
+            prefix.pop()
+        elif char == "]":
+            if not prefix or prefix[-1] != "[":
+                raise ValueError(f"bad character at index of: {index}\ncontent:{content}")
+            prefix.pop()
+
+    if prefix:
+        raise ValueError(f"invalid value: argument - {content[start:]} - {prefix}")
+    return len(content)
+
+
+def kv_pair_parse(content: str) -> dict:
+    """解析 `key=value, key=value` 形式的脚本参数
+
+    key 中的空格会被忽略, `argument` 的值允许在 `[]`, `()` 中包含逗号
+    """
+    data = {}
+    key_start = 0
+    index = 0
+    stop = len(content)
+    while index < stop:
+        end = content.find("=", index)
+        if end == -1:
+            break
+
+        key = content[key_start:end].replace(" ", "")
+        start = end + 1
+        if key.lower() == "argument":
+            end = _find_argument_value_end(content, start)
+        else:
+            end = content.find(",", start)
+            if end == -1:
+                end = stop
+
+        data[key] = content[start:end]
+        index = key_start = end + 1
+
+    return data
+
+
+def _parse_argument(line: str) -> LoonArgument:
+    name = None
+    result: dict[str, Any] = {}
+    for part in line.split(","):
+        part = part.strip().strip('"')
+        if "=" in part:
+            key, value = part.split("=", 1)
+            key = key.strip()
+            value = value.strip()
+            if name is None and key not in ("tag", "desc"):
+                name = key
+            result[key] = value
+        else:
+            result.setdefault("_values", []).append(part)
+
+    assert name, (line, result)
+    return LoonArgument(
+        name=name,
+        type=result[name],
+        desc=result.get("desc", ""),
+        tag=result.get("tag", ""),
+        default=result["_values"][0],
+        values=result["_values"],
+    )
+
+
+def _parse_rewrite(plugin: LoonPlugin, line: str):
+    for item in REWRITE_PATTERNS:
+        groups = item.match(line)
+        if groups is None:
+            continue
+
+        match item.kind:
+            case LoonRewriteKind.url:
+                plugin.url_rewrites.append(item.render(groups))
+            case LoonRewriteKind.header:
+                plugin.header_rewrites.append(item.render(groups))
+            case LoonRewriteKind.request_body | LoonRewriteKind.response_body:
+                url, rewrite_type, content = groups
+                rewrite_type = (
+                    rewrite_type.replace("request-body", "request").replace("response-body", "response")
+                ).replace("json-jq", "jq")
+                jq_path = None
+                if rewrite_type.endswith("-jq"):
+                    jq_path_matched = JQ_PATH_PATTERN.match(content)
+                    if jq_path_matched:
+                        jq_path = jq_path_matched.group(1)
+                    else:
+                        content = content.strip("'")
+                plugin.body_rewrites.append(LoonBodyRewrite(url, rewrite_type, content, jq_path))
+            case LoonRewriteKind.bad_header:
+                logger.warning(f"[Bad Header Rewrite] {line}")
+            case LoonRewriteKind.bad_redirect:
+                logger.warning(f"[Bad Redirect Rewrite] {line}")
+        return
+
+    logger.warning(f"[NotImplementedError] {line}")
+    raise NotImplementedError(line)
+
+
+def _parse_script(plugin: LoonPlugin, line: str):
+    if SCRIPT_CRON_PATTERN.match(line):
+        # TODO: 实现 cron 脚本转换
+        logger.debug("skip because of cron script")
+        return
+
+    if SCRIPT_GENERIC_PATTERN.match(line):
+        logger.debug("skip because of generic script")
+        return
+
+    matched = SCRIPT_HTTP_PATTERN.match(line)
+    if not matched:
+        raise ValueError(f"invalid script line: {line}")
+
+    type_, match_, p3 = matched.groups()
+    type_ = type_.replace("http-", "")
+
+    # bad case
+    if match_ == r"^https:\/\/j1\.pupuapi\.com\/client\/a朴朴超市,":
+        return
+
+    try:
+        kwargs = kv_pair_parse(p3)
+    except Exception as e:
+        logger.error(f"[Loon Script] get kwargs by script\n{match_}\n{p3}\n{line}")
+        raise e
+
+    try:
+        if "script-path" not in kwargs:
+            logger.error(f"[loon] can't find script-path: {kwargs}")
+            raise RuntimeError()
+
+        script = LoonScript(
+            match=match_,
+            name=kwargs.pop("tag", uuid.uuid4().hex),
+            type=type_,
+            script_path=kwargs.pop("script-path"),
+            require_body=kwargs.pop("requires-body", "false").strip() == "true",
+            binary_mode=kwargs.pop("binary-body-mode", "false").strip() == "true",
+            timeout=int(kwargs.pop("timeout", 20)),
+            argument=kwargs.pop("argument", ""),
+        )
+    except Exception as e:
+        logger.warning(f"[Loon Script] add script failed: {e}\n{match_}\n{type_}\n{p3}")
+        raise e
+    plugin.scripts.append(script)
+
+
+def _parse_mitm(plugin: LoonPlugin, line: str):
+    if line.startswith("hostname"):
+        for item in line.split("=", 1)[1].split(","):
+            item = item.strip()
+            if item:
+                plugin.mitm.append(item)
+
+
+def _parse_rule(plugin: LoonPlugin, line: str):
+    content = line.replace(" ", "")
+    if content.count(",") < 2:
+        logger.warning(f"[Loon Rules]invalid rule: {line}")
+    else:
+        plugin.rules.append(content)
+
+
+def _parse_argument_line(plugin: LoonPlugin, line: str):
+    argument = _parse_argument(line)
+    plugin.arguments[argument.name] = argument
+
+
+SECTION_PARSERS: dict[str, Callable[[LoonPlugin, str], None]] = {
+    "argument": _parse_argument_line,
+    "mitm": _parse_mitm,
+    "rule": _parse_rule,
+    "rewrite": _parse_rewrite,
+    "script": _parse_script,
+}
+
+
+def parse_loon_plugin(text: str) -> LoonPlugin:
+    """单次遍历解析 Loon 插件
+
+    不支持的内容
+    - Rewrite
+        - Mock
+    - Script
+        - generic
+        - cron
+    """
+    plugin = LoonPlugin()
+    parser: Callable[[LoonPlugin, str], None] | None = None
+    section: str | None = None
+    unknown_sections: set[str] = set()
+
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+
+        if line[0] == "#":
+            if line.startswith("#!") and "=" in line:
+                k, v = line[2:].split("=", 1)
+                plugin.metadata[k.strip()] = v.strip()
+            continue
+
+        if line[0] == "[":
+            matched = SECTION_PATTERN.match(line)
+            if matched:
+                section = (matched.group(1) or "").lower()
+                parser = SECTION_PARSERS.get(section)
+                continue
+
+        if section is None:
+            continue
+
+        # Mock
+        if section != "argument" and ("mock-request-body" in line or "mock-response-body" in line):
+            logger.debug(f"skip by mock: {line}")
+            continue
+
+        if parser is None:
+            if section not in unknown_sections:
+                unknown_sections.add(section)
+                logger.warning(f"[Loon] Unkown section: {section}")
+            continue
+
+        parser(plugin, line)
+
+    logger.debug(f"[loon] arguments: {plugin.arguments}")
+    return plugin
+
+
+def bundle_stash_overrides(
+    overrides: list[dict[str, Any]],
+    *,
+    name: str,
+    desc: str | None = None,
+    category: str | None = None,
+    icon: str | None = None,
+) -> dict[str, Any]:
+    """将多个由 `LoonPlugin.to_stash_override` 生成的覆写合并为一个
+
+    mitm、rules 和各类 rewrite 按出现顺序去重; 不同插件的同名脚本指向不同地址时, 为后者追加序号
+    """
+    bundle: dict[str, Any] = {"name": name}
+    if desc is not None:
+        bundle["desc"] = desc
+    if category is not None:
+        bundle["category"] = category
+    if icon is not None:
+        bundle["icon"] = icon
+
+    http_keys = ("mitm", "url-rewrite", "body-rewrite", "header-rewrite")
+    http: dict[str, dict[str, None]] = {key: {} for key in http_keys}
+    rules: dict[str, None] = {}
+    scripts: list[dict[str, Any]] = []
+    script_providers: dict[str, dict[str, Any]] = {}
+
+    for override in overrides:
+        for key in http_keys:
+            http[key].update(dict.fromkeys(override.get("http", {}).get(key, [])))
+        rules.update(dict.fromkeys(override.get("rules", [])))
+
+        providers = override.get("script-providers", {})
+        for script in override.get("http", {}).get("script", []):
+            provider = providers[script["name"]]
+            script_name = script["name"]
+            index = 1
+            while script_name in script_providers and script_providers[script_name] != provider:
+                index += 1
+                script_name = f"{script['name']}-{index}"
+            script_providers[script_name] = provider
+            scripts.append({**script, "name": script_name})
+
+    for key in http_keys:
+        if http[key]:
+            bundle.setdefault("http", {})
+            bundle["http"][key] = list(http[key])
+    if scripts:
+        bundle.setdefault("http", {})
+        bundle["http"]["script"] = scripts
+    if rules:
+        bundle["rules"] = list(rules)
+    if script_providers:
+        bundle["script-providers"] = script_providers
+    return bundle
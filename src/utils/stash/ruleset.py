@@ -1,8 +1,245 @@
+import hashlib
+import logging
+import re
+import struct
+import zlib
+from collections import Counter
+from enum import Enum
 from typing import cast
 
+import httpx
 import yaml
+from cachetools import LRUCache
 from schemas.v2fly.geosite_pb import DomainTypeEnum
-from utils.v2fly.geosite import get_geosite_library_by_url
+from utils.v2fly.geosite import get_geosite_library_by_url, get_geosite_library_version
+
+logger = logging.getLogger(__file__)
+
+
+class RulesetBehaviorEnum(str, Enum):
+    domain = "domain"
+    classical = "classical"
+
+
+class RulesetFormatEnum(str, Enum):
+    """binary 为本服务内部使用的 PTRS 格式, 不兼容 mihomo .mrs, 客户端无法直接加载"""
+
+    yaml = "yaml"
+    binary = "binary"
+
+
+class AdblockRuleKind(str, Enum):
+    comment = "comment"
+    domain = "domain"
+    suffix = "suffix"
+    regex = "regex"
+    exception = "exception"
+    unsupported = "unsupported"
+
+
+# 按顺序匹配, 首个命中的规则决定类型
+ADBLOCK_RULE_PATTERNS: tuple[tuple[AdblockRuleKind, re.Pattern], ...] = (
+    (AdblockRuleKind.comment, re.compile(r"^(?:!|#|\[Adblock)", re.IGNORECASE)),
+    (AdblockRuleKind.domain, re.compile(r"^\|\|([\w.-]+)\^$")),
+    (AdblockRuleKind.suffix, re.compile(r"^\|\|([\w.-]+)$")),
+    (AdblockRuleKind.regex, re.compile(r"^/(.+)/$")),
+    (AdblockRuleKind.exception, re.compile(r"^@@")),
+)
+
+
+# 可参与后缀优化的条目格式, 值为 (是否为后缀匹配, 前缀)
+DOMAIN_ENTRY_PREFIXES: tuple[tuple[str, bool], ...] = (
+    ("+.", True),
+    ("DOMAIN-SUFFIX,", True),
+    ("DOMAIN,", False),
+)
+DOMAIN_ENTRY_PATTERN = re.compile(r"^[\w-]+(?:\.[\w-]+)*$")
+_TRIE_TERMINAL = ""
+
+
+def _parse_domain_entry(entry: str) -> tuple[bool, str, str] | None:
+    """返回 (是否为后缀匹配, 前缀, 小写域名), 无法参与优化的条目返回 None"""
+    for prefix, is_suffix in DOMAIN_ENTRY_PREFIXES:
+        if entry.startswith(prefix):
+            domain = entry[len(prefix) :]
+            break
+    else:
+        prefix, is_suffix, domain = "", False, entry
+    domain = domain.strip().lower()
+    if not DOMAIN_ENTRY_PATTERN.match(domain):
+        return None
+    return is_suffix, prefix, domain
+
+
+def optimize_domain_payloads(payloads: list[str]) -> list[str]:
+    """移除已被更短后缀覆盖的规则, 并合并大小写不同的重复条目
+
+    `+.example.com` 覆盖 `example.com`, `a.example.com` 与 `+.a.example.com`;
+    使用按 label 倒序构建的字典树判断覆盖关系, 保持条目原有顺序.
+    正则、关键字、`*.` 通配等无法判断覆盖关系的条目仅做去重
+    """
+    entries: list[tuple[str, tuple[bool, str, str] | None]] = []
+    seen: set[str] = set()
+    trie: dict = {}
+    for entry in payloads:
+        parsed = _parse_domain_entry(entry)
+        key = entry if parsed is None else f"{parsed[1]}{parsed[2]}"
+        if key in seen:
+            continue
+        seen.add(key)
+        entries.append((key, parsed))
+        if parsed is not None and parsed[0]:
+            node = trie
+            for label in reversed(parsed[2].split(".")):
+                node = node.setdefault(label, {})
+            node[_TRIE_TERMINAL] = True
+
+    results = []
+    for key, parsed in entries:
+        if parsed is None:
+            results.append(key)
+            continue
+
+        is_suffix, _, domain = parsed
+        labels = domain.split(".")
+        node = trie
+        covered = False
+        for index, label in enumerate(reversed(labels), start=1):
+            node = node.get(label, {})
+            if not node:
+                break
+            # 后缀条目只会被更短的后缀覆盖, 完整域名也会被同名后缀覆盖
+            if node.get(_TRIE_TERMINAL) and (index < len(labels) or not is_suffix):
+                covered = True
+                break
+        if not covered:
+            results.append(key)
+    return results
+
+
+def optimize_ruleset_payloads(payloads: list[str]) -> tuple[list[str], dict[str, str]]:
+    """优化规则集并返回描述缩减比例的响应头"""
+    optimized = optimize_domain_payloads(payloads)
+    ratio = 1 - len(optimized) / len(payloads) if payloads else 0
+    headers = {
+        "X-Ruleset-Payload-Count": f"{len(optimized)}/{len(payloads)}",
+        "X-Ruleset-Reduction-Ratio": f"{ratio:.4f}",
+    }
+    return optimized, headers
+
+
+def dump_ruleset_payloads(payloads: list[str]) -> str:
+    return cast(str, yaml.safe_dump({"payload": payloads}, width=9999, allow_unicode=True, sort_keys=False))
+
+
+# 二进制规则集格式说明见 docs/tech/ruleset-binary-format.md
+RULESET_BINARY_MAGIC = b"PTRS"
+RULESET_BINARY_VERSION = 1
+RULESET_BINARY_HEADER = struct.Struct(">4sBBI")
+RULESET_BINARY_FLAG_ZLIB = 0x01
+RULESET_BINARY_KIND_FULL = 0
+RULESET_BINARY_KIND_SUFFIX = 1
+
+# 按数据版本缓存生成的二进制规则集, 数据版本变化后旧条目自然被淘汰
+RULESET_BINARY_CACHE: LRUCache = LRUCache(128)
+
+
+def _write_varint(buf: bytearray, value: int):
+    while value >= 0x80:
+        buf.append((value & 0x7F) | 0x80)
+        value >>= 7
+    buf.append(value)
+
+
+def _read_varint(data: bytes, offset: int) -> tuple[int, int]:
+    value = shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+def encode_domain_ruleset(payloads: list[str]) -> bytes:
+    """将 domain 规则集编码为按倒序域名排序、前缀压缩的二进制格式
+
+    仅支持完整域名与后缀规则, 其余条目会被忽略
+    """
+    entries: set[tuple[bytes, int]] = set()
+    skipped = 0
+    for entry in payloads:
+        parsed = _parse_domain_entry(entry)
+        if parsed is None:
+            skipped += 1
+            continue
+        is_suffix, _, domain = parsed
+        key = ".".join(reversed(domain.split("."))).encode()
+        entries.add((key, RULESET_BINARY_KIND_SUFFIX if is_suffix else RULESET_BINARY_KIND_FULL))
+    if skipped:
+        logger.debug(f"[encode_domain_ruleset] skip {skipped} entries which are not domain rules")
+
+    body = bytearray()
+    previous = b""
+    for key, kind in sorted(entries):
+        shared = 0
+        limit = min(len(previous), len(key))
+        while shared < limit and previous[shared] == key[shared]:
+            shared += 1
+        _write_varint(body, shared)
+        _write_varint(body, len(key) - shared)
+        body += key[shared:]
+        body.append(kind)
+        previous = key
+
+    header = RULESET_BINARY_HEADER.pack(
+        RULESET_BINARY_MAGIC, RULESET_BINARY_VERSION, RULESET_BINARY_FLAG_ZLIB, len(entries)
+    )
+    return header + zlib.compress(bytes(body), 9)
+
+
+def decode_domain_ruleset(data: bytes) -> list[str]:
+    """解码 `encode_domain_ruleset` 生成的二进制规则集, 返回 domain 规则集 payload"""
+    magic, version, flags, count = RULESET_BINARY_HEADER.unpack_from(data)
+    if magic != RULESET_BINARY_MAGIC or version != RULESET_BINARY_VERSION:
+        raise ValueError(f"unsupported ruleset binary: {magic!r} v{version}")
+
+    body = data[RULESET_BINARY_HEADER.size :]
+    if flags & RULESET_BINARY_FLAG_ZLIB:
+        body = zlib.decompress(body)
+
+    payloads = []
+    previous = b""
+    offset = 0
+    for _ in range(count):
+        shared, offset = _read_varint(body, offset)
+        length, offset = _read_varint(body, offset)
+        key = previous[:shared] + body[offset : offset + length]
+        offset += length
+        kind = body[offset]
+        offset += 1
+        domain = ".".join(reversed(key.decode().split(".")))
+        payloads.append(f"+.{domain}" if kind == RULESET_BINARY_KIND_SUFFIX else domain)
+        previous = key
+    return payloads
+
+
+def _to_cached_binary(key: tuple, payloads: list[str], optimize: bool) -> tuple[bytes, dict[str, str]]:
+    headers: dict[str, str] = {}
+    if optimize:
+        payloads, headers = optimize_ruleset_payloads(payloads)
+    value = RULESET_BINARY_CACHE[key] = (encode_domain_ruleset(payloads), headers)
+    return value
+
+
+def classify_adblock_rule(line: str) -> tuple[AdblockRuleKind, str]:
+    """返回 Adblock 规则的类型和提取出的值"""
+    for kind, pattern in ADBLOCK_RULE_PATTERNS:
+        matched = pattern.match(line)
+        if matched:
+            return kind, matched.group(1) if pattern.groups else line
+    return AdblockRuleKind.unsupported, line
 
 
 class RulesetGeositeOverride:
@@ -39,5 +276,94 @@ class RulesetGeositeOverride:
 
     async def to_yaml(self) -> str:
         payloads = await self.get_payloads()
-        body = {"payload": payloads}
-        return cast(str, yaml.safe_dump(body, width=9999, allow_unicode=True, sort_keys=False))
+        return dump_ruleset_payloads(payloads)
+
+    async def to_binary(self, *, optimize: bool = False) -> tuple[bytes, dict[str, str]]:
+        """返回二进制规则集与优化结果响应头, 按 geosite 数据版本缓存"""
+        version = await get_geosite_library_version(self._geosite_url)
+        key = ("geosite", version, self.name.upper(), self._attribute, optimize)
+        cached_value = RULESET_BINARY_CACHE.get(key)
+        if cached_value is not None:
+            return cast(tuple[bytes, dict[str, str]], cached_value)
+        return _to_cached_binary(key, await self.get_payloads(), optimize)
+
+
+class RulesetAdblock:
+    """流式读取 Adblock-style 规则列表并转换为规则集
+
+    支持以下规则
+    - ||stun1.douyucdn.cn
+    - ||mcdn.bilivideo.cn^
+    - /.*pcdn.*biliapi\\.net/, 仅 classical 规则集输出为 DOMAIN-REGEX
+    """
+
+    def __init__(self, url: str):
+        self.url = url
+        # dict 保持首次出现的顺序, 同时用于去重
+        self.domains: dict[str, None] = {}
+        self.suffix_domains: dict[str, None] = {}
+        self.regexps: dict[str, None] = {}
+        self.unsupported: Counter[AdblockRuleKind] = Counter()
+        self._unsupported_samples: list[str] = []
+        self._digest = hashlib.sha256()
+
+    def add(self, line: str):
+        line = line.strip()
+        if not line:
+            return
+
+        kind, value = classify_adblock_rule(line)
+        match kind:
+            case AdblockRuleKind.comment:
+                return
+            case AdblockRuleKind.domain:
+                self.domains[value] = None
+            case AdblockRuleKind.suffix:
+                self.suffix_domains[value] = None
+            case AdblockRuleKind.regex:
+                self.regexps[value] = None
+            case _:
+                self.unsupported[kind] += 1
+                if len(self._unsupported_samples) < 5:
+                    self._unsupported_samples.append(line)
+
+    async def fetch(self):
+        async with httpx.AsyncClient(follow_redirects=True) as client:
+            async with client.stream("GET", self.url) as resp:
+                resp.raise_for_status()
+                async for line in resp.aiter_lines():
+                    self._digest.update(line.encode() + b"\n")
+                    self.add(line)
+
+        logger.info(
+            f"[RulesetAdblock] {self.url}: domain={len(self.domains)}, suffix={len(self.suffix_domains)}, "
+            f"regex={len(self.regexps)}, unsupported={dict(self.unsupported)}"
+        )
+        if self.unsupported:
+            logger.warning(
+                f"[RulesetAdblock] {sum(self.unsupported.values())} unsupported rules skipped, "
+                f"samples: {self._unsupported_samples}"
+            )
+
+    def get_payloads(self, behavior: RulesetBehaviorEnum = RulesetBehaviorEnum.domain) -> list[str]:
+        """domain 规则集保持原有输出, ||host^ 输出为完整域名
+
+        Adblock 语法中 ||host^ 同样匹配子域名, classical 规则集将其输出为 DOMAIN-SUFFIX
+        """
+        if behavior == RulesetBehaviorEnum.classical:
+            return [
+                *(f"DOMAIN-SUFFIX,{x}" for x in dict.fromkeys([*self.domains, *self.suffix_domains])),
+                *(f"DOMAIN-REGEX,{x}" for x in self.regexps),
+            ]
+        return [*self.domains, *(f"+.{x}" for x in self.suffix_domains)]
+
+    def to_yaml(self, behavior: RulesetBehaviorEnum = RulesetBehaviorEnum.domain) -> str:
+        return dump_ruleset_payloads(self.get_payloads(behavior))
+
+    def to_binary(self, *, optimize: bool = False) -> tuple[bytes, dict[str, str]]:
+        """返回二进制 domain 规则集与优化结果响应头, 按列表内容的哈希缓存"""
+        key = ("adblock", self._digest.hexdigest(), optimize)
+        cached_value = RULESET_BINARY_CACHE.get(key)
+        if cached_value is not None:
+            return cast(tuple[bytes, dict[str, str]], cached_value)
+        return _to_cached_binary(key, self.get_payloads(RulesetBehaviorEnum.domain), optimize)
@@ -0,0 +1,191 @@
+import time
+
+import pytest
+from utils.stash.loon import bundle_stash_overrides, kv_pair_parse, parse_loon_plugin, rewrite_loon_argument
+
+# 结构参考 https://kelee.one/Tool/Loon/Lpx/YouTube_remove_ads.lpx
+YOUTUBE_PLUGIN = r"""
+#!name = YouTube去广告
+#!desc = 移除YouTube广告, 移除瀑布流中的Shorts
+#!openUrl = https://apps.apple.com/app/id544007664
+#!author = Maasea[https://github.com/Maasea]
+#!tag = 去广告
+#!system = iOS, iPadOS
+#!date = 2025-05-20 10:10:10
+#!icon = https://raw.githubusercontent.com/luestr/IconResource/main/App_icon/120px/YouTube.png
+
+[Argument]
+blockUpload = switch, false, true, tag=上传按钮, desc=此项用于控制是否屏蔽上传按钮
+blockImmersive = switch, false, true, tag=选段按钮, desc=此项用于控制是否屏蔽选段按钮
+captionLang = select, "zh-Hans", "zh-Hant", "ja", "off", tag=字幕翻译语言, desc=此项用于控制字幕翻译语言
+debug = switch, false, true, tag=启用调试模式, desc=此项用于控制是否显示更多日志
+
+[Rule]
+AND, ((DOMAIN-SUFFIX, googlevideo.com), (PROTOCOL, QUIC)), REJECT
+AND, ((DOMAIN, youtubei.googleapis.com), (PROTOCOL, QUIC)), REJECT
+DOMAIN-SUFFIX, ads.youtube.com
+
+[Rewrite]
+^https?:\/\/[\w-]+\.googlevideo\.com\/initplayback.+&oad reject-200
+^https?:\/\/youtubei\.googleapis\.com\/youtubei\/v1\/log_event reject
+^https?:\/\/s\.youtube\.com\/api\/stats\/ads reject-dict
+^http:\/\/www\.youtube\.com\/watch header https://m.youtube.com/watch
+^https?:\/\/youtu\.be\/(.*) 302 https://www.youtube.com/watch?v=$1
+^https?:\/\/www\.youtube\.com\/api\/stats\/qoe mock-response-body data-type=text data=""
+^https?:\/\/m\.youtube\.com\/ header-add X-Client-Data proxy-tool
+^https?:\/\/m\.youtube\.com\/ response-header-del Set-Cookie
+^https?:\/\/youtubei\.googleapis\.com\/youtubei\/v1\/config request-body-json-del client.screenDensityFloat
+^https?:\/\/youtubei\.googleapis\.com\/youtubei\/v1\/guide response-body-json-jq 'del(.items[0])'
+^https?:\/\/youtubei\.googleapis\.com\/youtubei\/v1\/browse response-body-json-jq jq-path="https://example.com/youtube/browse.jq"
+
+[Script]
+http-response ^https:\/\/youtubei\.googleapis\.com\/(youtubei\/v1\/(browse|next|player|search|reel\/reel_watch_sequence|guide|account\/get_setting|get_watch))(\?(.*))?$ script-path=https://kelee.one/Resource/Script/YouTube/YouTube_remove_ads/YouTube_remove_ads_response.js, requires-body=true, binary-body-mode=true, tag=移除YouTube广告, argument=[{blockUpload},{blockImmersive},{captionLang},{debug}]
+http-request ^https:\/\/youtubei\.googleapis\.com\/youtubei\/v1\/(browse|next|player|reel) script-path=https://kelee.one/Resource/Script/YouTube/YouTube_remove_ads/YouTube_remove_ads_request.js, requires-body=true, binary-body-mode=true, timeout=60, tag=YouTube请求
+cron "0 8 * * *" script-path=https://example.com/cron.js, tag=定时任务
+generic script-path=https://example.com/generic.js, tag=通用脚本
+
+[MitM]
+hostname = *.googlevideo.com, youtubei.googleapis.com, www.youtube.com, m.youtube.com
+"""
+
+
+def test_parse_loon_plugin():
+    plugin = parse_loon_plugin(YOUTUBE_PLUGIN)
+    assert plugin.metadata["name"] == "YouTube去广告"
+    assert plugin.metadata["date"] == "2025-05-20 10:10:10"
+    assert set(plugin.arguments) == {"blockUpload", "blockImmersive", "captionLang", "debug"}
+    assert plugin.arguments["captionLang"].default == "zh-Hans"
+
+    assert plugin.mitm == ["*.googlevideo.com", "youtubei.googleapis.com", "www.youtube.com", "m.youtube.com"]
+    assert plugin.rules == [
+        "AND,((DOMAIN-SUFFIX,googlevideo.com),(PROTOCOL,QUIC)),REJECT",
+        "AND,((DOMAIN,youtubei.googleapis.com),(PROTOCOL,QUIC)),REJECT",
+    ]
+    assert plugin.url_rewrites == [
+        r"^https?:\/\/[\w-]+\.googlevideo\.com\/initplayback.+&oad - reject-200",
+        r"^https?:\/\/youtubei\.googleapis\.com\/youtubei\/v1\/log_event - reject",
+        r"^https?:\/\/s\.youtube\.com\/api\/stats\/ads - reject-dict",
+        r"^http:\/\/www\.youtube\.com\/watch https://m.youtube.com/watch transparent",
+        r"^https?:\/\/youtu\.be\/(.*) https://www.youtube.com/watch?v=$1 302",
+    ]
+    assert plugin.header_rewrites == [
+        r"^https?:\/\/m\.youtube\.com\/ header-add X-Client-Data proxy-tool",
+        r"^https?:\/\/m\.youtube\.com\/ response-header-del Set-Cookie",
+    ]
+    assert [x.type for x in plugin.body_rewrites] == ["request-json-del", "response-jq", "response-jq"]
+    assert plugin.body_rewrites[1].content == "del(.items[0])"
+    assert plugin.jq_paths == ["https://example.com/youtube/browse.jq"]
+
+    assert [x.name for x in plugin.scripts] == ["移除YouTube广告", "YouTube请求"]
+    assert plugin.scripts[0].require_body and plugin.scripts[0].binary_mode
+    assert plugin.scripts[1].timeout == 60
+
+
+def test_loon_plugin_to_stash_override():
+    plugin = parse_loon_plugin(YOUTUBE_PLUGIN)
+    override = plugin.to_stash_override(
+        name="YouTube",
+        script_arguments={"debug": "true"},
+        jq_contents={"https://example.com/youtube/browse.jq": "del(.contents)"},
+    )
+    assert override["name"] == "YouTube"
+    assert list(override) == [
+        "name",
+        "desc",
+        "openUrl",
+        "author",
+        "tag",
+        "system",
+        "date",
+        "icon",
+        "http",
+        "rules",
+        "script-providers",
+    ]
+    assert list(override["http"]) == ["mitm", "url-rewrite", "body-rewrite", "header-rewrite", "script"]
+    assert override["http"]["body-rewrite"][-1].endswith("response-jq del(.contents)")
+
+    script = override["http"]["script"][0]
+    assert script["argument"] == (
+        '{"blockUpload": false, "blockImmersive": false, "captionLang": "zh-Hans", "debug": true}'
+    )
+    assert override["script-providers"]["YouTube请求"]["url"].endswith("YouTube_remove_ads_request.js")
+
+
+def test_loon_plugin_unsupported_rewrite():
+    with pytest.raises(NotImplementedError):
+        parse_loon_plugin("[Rewrite]\n^https?:\\/\\/example\\.com unknown-action")
+
+
+def test_rewrite_loon_argument():
+    plugin = parse_loon_plugin(YOUTUBE_PLUGIN)
+    assert rewrite_loon_argument("", plugin.arguments, None) == ""
+    assert rewrite_loon_argument("[{debug}]", plugin.arguments, None) == '{"debug": false}'
+
+
+def test_kv_pair_parse_argument_brackets():
+    kwargs = kv_pair_parse("script-path=https://a.com/a.js, requires-body = true, argument=[{a},({b},{c})], tag=t")
+    assert kwargs == {
+        "script-path": "https://a.com/a.js",
+        "requires-body": " true",
+        "argument": "[{a},({b},{c})]",
+        "tag": "t",
+    }
+
+    with pytest.raises(ValueError):
+        kv_pair_parse("argument=[{a},({b}]")
+    with pytest.raises(ValueError):
+        kv_pair_parse("argument=[{a}")
+
+
+def test_parse_loon_plugin_benchmark():
+    """社区大型插件通常包含数千条 rewrite, 转换耗时应在毫秒级"""
+    lines = YOUTUBE_PLUGIN.splitlines()
+    index = lines.index("[Rewrite]") + 1
+    rewrites = [line for line in lines[index:] if line and not line.startswith("[")][:11]
+    scale = 500
+    payload = "\n".join(lines[:index] + rewrites * scale + lines[index + len(rewrites) :])
+
+    start = time.perf_counter()
+    plugin = parse_loon_plugin(payload)
+    plugin.to_stash_override(jq_contents={"https://example.com/youtube/browse.jq": "."})
+    elapsed = time.perf_counter() - start
+
+    assert len(plugin.url_rewrites) == 5 * scale
+    print(f"\n[loon benchmark] {len(rewrites) * scale} rewrite lines in {elapsed * 1000:.2f}ms")
+    assert elapsed < 1, elapsed
+
+
+def test_bundle_stash_overrides():
+    youtube = parse_loon_plugin(YOUTUBE_PLUGIN).to_stash_override(
+        jq_contents={"https://example.com/youtube/browse.jq": "."}
+    )
+    other = parse_loon_plugin(
+        "\n".join(
+            [
+                "#!name = Other",
+                "[Rule]",
+                "AND, ((DOMAIN-SUFFIX, googlevideo.com), (PROTOCOL, QUIC)), REJECT",
+                "DOMAIN, ads.example.com, REJECT",
+                "[Script]",
+                "http-response ^https:\\/\\/example\\.com script-path=https://example.com/a.js, tag=YouTube请求",
+                "[MitM]",
+                "hostname = m.youtube.com, example.com",
+            ]
+        )
+    ).to_stash_override()
+
+    bundle = bundle_stash_overrides([youtube, other], name="bundle", desc="desc")
+    assert bundle["name"] == "bundle"
+    assert bundle["http"]["mitm"] == [
+        "*.googlevideo.com",
+        "youtubei.googleapis.com",
+        "www.youtube.com",
+        "m.youtube.com",
+        "example.com",
+    ]
+    assert bundle["rules"][-1] == "DOMAIN,ads.example.com,REJECT"
+    assert len(bundle["rules"]) == 3
+    assert [x["name"] for x in bundle["http"]["script"]] == ["移除YouTube广告", "YouTube请求", "YouTube请求-2"]
+    assert bundle["script-providers"]["YouTube请求-2"]["url"] == "https://example.com/a.js"
+    assert len(bundle["script-providers"]) == 3
@@ -0,0 +1,138 @@
+import logging
+import time
+from functools import partial
+
+import httpx
+import pytest
+import utils.stash.ruleset as ruleset_module
+from utils.stash.ruleset import (
+    AdblockRuleKind,
+    RulesetAdblock,
+    RulesetBehaviorEnum,
+    classify_adblock_rule,
+    decode_domain_ruleset,
+    dump_ruleset_payloads,
+    encode_domain_ruleset,
+    optimize_domain_payloads,
+    optimize_ruleset_payloads,
+)
+
+ADBLOCK_LINES = r"""
+[Adblock Plus 2.0]
+! Title: PCDN
+||stun1.douyucdn.cn
+||mcdn.bilivideo.cn^
+||mcdn.bilivideo.cn^
+/.*pcdn.*biliapi\.net/
+@@||allow.example.com^
+||ads.example.com^$third-party
+example.com##.banner
+"""
+
+
+def test_classify_adblock_rule():
+    assert classify_adblock_rule("! comment") == (AdblockRuleKind.comment, "! comment")
+    assert classify_adblock_rule("||a.com^") == (AdblockRuleKind.domain, "a.com")
+    assert classify_adblock_rule("||a.com") == (AdblockRuleKind.suffix, "a.com")
+    assert classify_adblock_rule(r"/.*pcdn.*biliapi\.net/") == (AdblockRuleKind.regex, r".*pcdn.*biliapi\.net")
+    assert classify_adblock_rule("@@||a.com^")[0] == AdblockRuleKind.exception
+    assert classify_adblock_rule("||a.com^$third-party")[0] == AdblockRuleKind.unsupported
+
+
+def test_ruleset_adblock(caplog):
+    ruleset = RulesetAdblock("https://example.com/adblock.txt")
+    with caplog.at_level(logging.WARNING):
+        for line in ADBLOCK_LINES.splitlines():
+            ruleset.add(line)
+    assert not caplog.records
+
+    assert ruleset.get_payloads() == ["mcdn.bilivideo.cn", "+.stun1.douyucdn.cn"]
+    assert ruleset.get_payloads(RulesetBehaviorEnum.classical) == [
+        "DOMAIN-SUFFIX,mcdn.bilivideo.cn",
+        "DOMAIN-SUFFIX,stun1.douyucdn.cn",
+        r"DOMAIN-REGEX,.*pcdn.*biliapi\.net",
+    ]
+    assert ruleset.unsupported == {AdblockRuleKind.exception: 1, AdblockRuleKind.unsupported: 2}
+
+
+@pytest.mark.asyncio
+async def test_ruleset_adblock_digest_line_boundaries(monkeypatch):
+    contents = {"/a.txt": "||ab.com\n||c.com", "/b.txt": "||a\nb.com||c.com"}
+    transport = httpx.MockTransport(lambda request: httpx.Response(200, text=contents[request.url.path]))
+    monkeypatch.setattr(ruleset_module.httpx, "AsyncClient", partial(httpx.AsyncClient, transport=transport))
+
+    digests = []
+    for path in contents:
+        ruleset = RulesetAdblock(f"https://example.com{path}")
+        await ruleset.fetch()
+        digests.append(ruleset._digest.hexdigest())
+    # 拼接后内容相同但分行不同的列表, 摘要不同
+    assert digests[0] != digests[1]
+
+
+def test_optimize_domain_payloads():
+    payloads = [
+        "a.example.com",
+        "+.example.com",
+        "+.b.example.com",
+        "Example.COM",
+        "example.com",
+        "+.EXAMPLE.com",
+        "+.example.com.cn",
+        "example.org",
+        "+.a.example.org",
+        "*.example.net",
+        "*.example.net",
+    ]
+    assert optimize_domain_payloads(payloads) == [
+        "+.example.com",
+        "+.example.com.cn",
+        "example.org",
+        "+.a.example.org",
+        "*.example.net",
+    ]
+
+    payloads = [
+        "DOMAIN,a.example.com",
+        "DOMAIN-SUFFIX,example.com",
+        "DOMAIN-SUFFIX,b.example.com",
+        r"DOMAIN-REGEX,.*pcdn.*biliapi\.net",
+    ]
+    assert optimize_domain_payloads(payloads) == [
+        "DOMAIN-SUFFIX,example.com",
+        r"DOMAIN-REGEX,.*pcdn.*biliapi\.net",
+    ]
+
+
+def test_optimize_ruleset_payloads():
+    payloads, headers = optimize_ruleset_payloads(["+.example.com", "a.example.com", "b.example.com", "example.org"])
+    assert payloads == ["+.example.com", "example.org"]
+    assert headers == {"X-Ruleset-Payload-Count": "2/4", "X-Ruleset-Reduction-Ratio": "0.5000"}
+
+
+def test_encode_domain_ruleset():
+    payloads = ["+.example.com", "a.example.com", "example.org", "+.example.com", "1.1.1.1/32"]
+    data = encode_domain_ruleset(payloads)
+    assert data[:4] == b"PTRS"
+    assert decode_domain_ruleset(data) == ["+.example.com", "a.example.com", "example.org"]
+    assert decode_domain_ruleset(encode_domain_ruleset([])) == []
+
+
+def test_encode_domain_ruleset_benchmark():
+    """大型 domain 规则集的二进制编码应明显小于 yaml"""
+    payloads = [f"+.host{i}.cdn{i % 97}.example{i % 13}.com" for i in range(50000)]
+
+    start = time.perf_counter()
+    text = dump_ruleset_payloads(payloads)
+    yaml_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    data = encode_domain_ruleset(payloads)
+    binary_elapsed = time.perf_counter() - start
+
+    print(
+        f"\n[ruleset benchmark] yaml {len(text.encode())} bytes in {yaml_elapsed * 1000:.2f}ms, "
+        f"binary {len(data)} bytes in {binary_elapsed * 1000:.2f}ms"
+    )
+    assert len(data) * 5 < len(text.encode())
+    assert sorted(decode_domain_ruleset(data)) == sorted(payloads)
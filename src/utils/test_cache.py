@@ -0,0 +1,42 @@
+import os
+
+from utils.cache import DiskLRUCache
+
+
+def _write(path, size: int):
+    path.write_bytes(b"0" * size)
+    return path
+
+
+def test_disk_lru_cache(tmp_path):
+    cache = DiskLRUCache(tmp_path / "cache", max_size=25, suffix=".mp4")
+    assert cache.get("a") is None
+
+    for key in ("a", "b"):
+        path = cache.put(key, _write(tmp_path / f"{key}.tmp", 10))
+        assert path.suffix == ".mp4" and path.exists()
+    assert not (tmp_path / "a.tmp").exists()
+
+    # 访问 a 后 b 成为最久未访问的文件
+    assert cache.get("a") == cache.path_for("a")
+    cache.put("c", _write(tmp_path / "c.tmp", 10))
+    assert cache.get("b") is None
+    assert not cache.path_for("b").exists()
+    assert cache.stats() == {"hits": 1, "misses": 2, "evictions": 1, "count": 2, "size": 20, "max_size": 25}
+
+    # 超出上限的单个文件也会保留
+    cache.put("d", _write(tmp_path / "d.tmp", 30))
+    assert cache.get("d") and cache.stats()["count"] == 1
+
+
+def test_disk_lru_cache_restore_index(tmp_path):
+    cache = DiskLRUCache(tmp_path, max_size=25, suffix=".mp4")
+    a = cache.put("a", _write(tmp_path / "a.tmp", 10))
+    b = cache.put("b", _write(tmp_path / "b.tmp", 10))
+    os.utime(a, (1, 1))
+    os.utime(b, (2, 2))
+
+    restored = DiskLRUCache(tmp_path, max_size=25, suffix=".mp4")
+    assert restored.size == 20
+    restored.put("c", _write(tmp_path / "c.tmp", 10))
+    assert not a.exists() and b.exists()
@@ -0,0 +1,197 @@
+import asyncio
+from types import SimpleNamespace
+from typing import Any
+
+import pytest
+from utils.playwright import AsyncPlaywright, BrowserPool, BrowserPoolBusy
+
+
+class FakePage:
+    def __init__(self, context: "FakeContext"):
+        self.context = context
+        self.handlers: dict = {}
+
+    def on(self, event: str, handler):
+        self.handlers[event] = handler
+
+    async def goto(self, url: str, wait_until: str = "load"):
+        self.context.browser.goto.append((url, wait_until))
+        route = self.context.route_handler
+        for resource_type, request_url in self.context.browser.requests:
+            await route(FakeRoute(resource_type, request_url, self.context.browser.routed))
+        body = self.context.browser.body
+        if body is not None:
+            response = SimpleNamespace(
+                url=f"https://www.douyin.com{Watcher.WATCH_URL_PATH}?id=1",
+                request=SimpleNamespace(method="GET"),
+                headers={"content-type": "application/json"},
+                json=lambda: asyncio.sleep(0, body),
+            )
+            asyncio.get_running_loop().create_task(self.handlers["response"](response))
+
+
+class FakeRoute:
+    def __init__(self, resource_type: str, url: str, routed: list):
+        self.request = SimpleNamespace(resource_type=resource_type, url=url)
+        self.routed = routed
+
+    async def abort(self):
+        self.routed.append(("abort", self.request.url))
+
+    async def continue_(self):
+        self.routed.append(("continue", self.request.url))
+
+
+class FakeContext:
+    def __init__(self, browser: "FakeBrowser"):
+        self.browser = browser
+        self.route_handler: Any = None
+        browser.contexts += 1
+
+    async def route(self, pattern: str, handler):
+        self.route_handler = handler
+
+    async def new_page(self) -> FakePage:
+        return FakePage(self)
+
+    async def close(self):
+        self.browser.contexts -= 1
+
+
+class FakeBrowser:
+    def __init__(self):
+        self.connected: bool = True
+        self.contexts = 0
+        self.goto: list = []
+        self.requests: list = []
+        self.routed: list = []
+        self.body: dict | None = None
+
+    def is_connected(self) -> bool:
+        return self.connected
+
+    async def new_context(self, **kwargs) -> FakeContext:
+        return FakeContext(self)
+
+    async def close(self):
+        self.connected = False
+
+
+def make_pool(launched: list, **kwargs) -> BrowserPool:
+    async def launch():
+        launched.append(FakeBrowser())
+        return launched[-1]
+
+    return BrowserPool(launch=launch, **kwargs)  # type: ignore[arg-type]
+
+
+@pytest.mark.asyncio
+async def test_browser_pool_bounded_and_reused():
+    launched: list[FakeBrowser] = []
+    pool = make_pool(launched, size=2, max_uses=100)
+    active, peak = [0], [0]
+
+    async def task():
+        async with pool.new_context() as context:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+            await asyncio.sleep(0.01)
+            active[0] -= 1
+            assert context.browser.contexts == 1
+
+    await asyncio.gather(*(task() for _ in range(10)))
+    assert peak[0] == 2 and len(launched) == 2
+    assert all(x.contexts == 0 for x in launched)
+    assert pool.stats() == {"size": 2, "idle": 2, "waiting": 0}
+
+    await pool.aclose()
+    assert not any(x.connected for x in launched)
+
+
+@pytest.mark.asyncio
+async def test_browser_pool_recycle():
+    launched: list[FakeBrowser] = []
+    pool = make_pool(launched, size=1, max_uses=3)
+    for _ in range(4):
+        async with pool.browser():
+            pass
+    # 使用 3 次后重新启动
+    assert len(launched) == 2 and not launched[0].connected
+
+    # 浏览器崩溃后重新启动
+    with pytest.raises(RuntimeError):
+        async with pool.browser() as browser:
+            browser.connected = False
+            raise RuntimeError("crashed")
+    async with pool.browser() as browser:
+        assert browser is launched[2]
+    await pool.aclose()
+
+
+@pytest.mark.asyncio
+async def test_browser_pool_back_pressure():
+    pool = make_pool([], size=1, max_queue=2)
+    release = asyncio.Event()
+
+    async def hold():
+        async with pool.browser():
+            await release.wait()
+
+    tasks = [asyncio.create_task(hold()) for _ in range(3)]
+    await asyncio.sleep(0.01)
+    assert pool.stats()["waiting"] == 2
+    with pytest.raises(BrowserPoolBusy):
+        async with pool.browser():
+            pass
+    release.set()
+    await asyncio.gather(*tasks)
+    await pool.aclose()
+
+
+class Watcher(AsyncPlaywright):
+    WATCH_URL_PATH = "/aweme/v1/web/aweme/detail/"
+    BLOCK_URL_PATTERNS = (*AsyncPlaywright.BLOCK_URL_PATTERNS, "mcs.zijieapi.com")
+    TIMEOUT = 0.2
+
+
+@pytest.mark.asyncio
+async def test_playwright_should_block():
+    watcher = Watcher("https://www.douyin.com/video/1")
+    assert watcher.should_block("image", "https://p3.douyinpic.com/a.jpeg")
+    assert watcher.should_block("font", "https://lf.douyinstatic.com/a.woff2")
+    assert watcher.should_block("xhr", "https://mcs.zijieapi.com/list")
+    assert not watcher.should_block("script", "https://lf.douyinstatic.com/a.js")
+    assert not watcher.should_block("xhr", "https://www.douyin.com/aweme/v1/web/aweme/detail/?id=1")
+
+
+@pytest.mark.asyncio
+async def test_playwright_run_resolves_on_watched_response():
+    launched: list[FakeBrowser] = []
+    pool = make_pool(launched, size=1)
+    watcher = Watcher("https://www.douyin.com/video/1", pool=pool)
+
+    async def launch():
+        browser = FakeBrowser()
+        browser.body = {"aweme_detail": {}}
+        browser.requests = [("image", "https://p3.douyinpic.com/a.jpeg"), ("script", "https://a.com/a.js")]
+        launched.append(browser)
+        return browser
+
+    pool._launch = launch
+    assert await watcher.run() == {"aweme_detail": {}}
+    browser = launched[0]
+    assert browser.goto == [("https://www.douyin.com/video/1", "commit")]
+    assert browser.routed == [("abort", "https://p3.douyinpic.com/a.jpeg"), ("continue", "https://a.com/a.js")]
+    assert browser.contexts == 0
+    await pool.aclose()
+
+
+@pytest.mark.asyncio
+async def test_playwright_run_timeout():
+    launched: list[FakeBrowser] = []
+    pool = make_pool(launched, size=1)
+    with pytest.raises(TimeoutError):
+        await Watcher("https://www.douyin.com/video/1", pool=pool).run()
+    # 超时后上下文被关闭, 浏览器归还到池中
+    assert launched[0].contexts == 0 and pool.stats()["idle"] == 1
+    await pool.aclose()
@@ -1,4 +1,5 @@
 import asyncio
+import hashlib
 from enum import Enum
 from itertools import chain
 from typing import cast
@@ -119,17 +120,30 @@ async def get_domains_by_geosite(name: str, *, include_all: bool = True) -> set[
 
 
 @cached(RandomTTLCache(16, 43200))
-async def get_geosite_library_by_url(
-    url: str = "https://github.com/v2fly/domain-list-community/releases/latest/download/dlc.dat",
-) -> proto.Message:
+async def fetch_geosite_library(url: str) -> tuple[proto.Message, str]:
+    """返回 geosite 数据及其版本, 版本为文件内容的 sha256"""
     async with httpx.AsyncClient() as client:
         resp = await client.get(url, follow_redirects=True)
         resp.raise_for_status()
         content = resp.content
         geosite_list = GeoSiteList.deserialize(content)
+    return geosite_list, hashlib.sha256(content).hexdigest()
+
+
+async def get_geosite_library_by_url(
+    url: str = "https://github.com/v2fly/domain-list-community/releases/latest/download/dlc.dat",
+) -> proto.Message:
+    geosite_list, _ = await fetch_geosite_library(url)
     return geosite_list
 
 
+async def get_geosite_library_version(
+    url: str = "https://github.com/v2fly/domain-list-community/releases/latest/download/dlc.dat",
+) -> str:
+    _, version = await fetch_geosite_library(url)
+    return version
+
+
 async def get_domains_by_geosite_library(
     name: str,
     *,